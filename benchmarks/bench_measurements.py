@@ -0,0 +1,140 @@
+"""
+Time every MeasurementFunctions entry through
+calculate_oscilloscope_measurement, for sine, square, triangle and rampup
+signals of 500, 10k, 100k and 1M samples.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_measurements.py
+    python benchmarks/bench_measurements.py --save      # update the baseline
+    python benchmarks/bench_measurements.py --compare   # check regressions
+
+The baseline (benchmarks/baseline.json) is stored with the repository so the
+changes in the timings show up in review. Save it again in the same commit
+as any change to the timings of the measurements, so --compare is never
+against stale numbers. Timings depend on the machine, so compare in the
+machine where it was saved, or save a local baseline first.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from typing import Dict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ll_oscilloscope_measurements as llom  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+SAMPLING_RATE = 25000.0
+FREQUENCY = 1000.0
+SIZES = (500, 10_000, 100_000, 1_000_000)
+SHAPES = ('sine', 'square', 'triangle', 'rampup')
+
+# A measurement is considered slower if it takes this much more time
+REGRESSION_RATIO = 1.25
+
+
+def measurement_functions():
+    """
+    Every function in MeasurementFunctions.
+    """
+    return sorted(
+            value for name, value in vars(llom.MeasurementFunctions).items()
+            if not name.startswith('_'))
+
+
+def generate_signal(shape: str, size: int) -> np.ndarray:
+    """
+    Synthetic 1 Vpp signal of the shape, like the ones in tests/data.
+    """
+    phase = (FREQUENCY * np.arange(size) / SAMPLING_RATE) % 1.0
+    if shape == 'sine':
+        signal = 0.5 * np.sin(2 * np.pi * phase)
+    elif shape == 'square':
+        signal = np.where(phase < 0.5, 0.5, -0.5)
+    elif shape == 'triangle':
+        signal = 2 * np.abs(phase - 0.5) - 0.5
+    elif shape == 'rampup':
+        signal = phase - 0.5
+    else:
+        raise ValueError(f"Unknown shape: {shape}")
+    noise = np.random.default_rng(size).normal(scale=0.005, size=size)
+    return signal + noise
+
+
+def run() -> Dict[str, float]:
+    """
+    Time every function, shape and size. Return the seconds per call by
+    'function/shape/size'.
+    """
+    results = {}
+    for size in SIZES:
+        for shape in SHAPES:
+            samples = generate_signal(shape, size)
+            # The other channel of the phase delay is the same signal, delayed
+            other = np.roll(samples, size // 100)
+            for function in measurement_functions():
+                def measure():
+                    llom.spectrum_cache.clear()
+                    llom.calculate_oscilloscope_measurement(
+                        function,
+                        samples,
+                        sampling_rate=SAMPLING_RATE,
+                        other_channel_samples=other)
+
+                number, _ = timeit.Timer(measure).autorange()
+                best = min(timeit.repeat(measure, number=number, repeat=3))
+                key = f"{function}/{shape}/{size}"
+                results[key] = best / number
+                print(f"{key:<40} {results[key] * 1000:10.3f} ms")
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float]) -> bool:
+    """
+    Print the ratio of every timing to the baseline. Return whether there is
+    no regression.
+    """
+    regressions = []
+    for key, seconds in results.items():
+        if key not in baseline:
+            print(f"{key:<40} not in the baseline")
+            continue
+        ratio = seconds / baseline[key]
+        print(f"{key:<40} {ratio:6.2f}x")
+        if ratio > REGRESSION_RATIO:
+            regressions.append(key)
+
+    if regressions:
+        print(f"{len(regressions)} measurements are slower than the "
+              f"baseline: {', '.join(regressions)}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--save', action='store_true',
+                        help=f"store the results in {BASELINE}")
+    parser.add_argument('--compare', action='store_true',
+                        help=f"compare the results with {BASELINE}")
+    args = parser.parse_args()
+
+    results = run()
+    if args.save:
+        with open(BASELINE, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+    if args.compare:
+        with open(BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+        if not compare(results, baseline):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Compare the previous sort-based VBase/VTop with the partition-based one.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_voltage_extremes.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ll_oscilloscope_measurements as llom  # noqa: E402
+
+
+def sort_based_amplitude(samples: np.ndarray) -> float:
+    sorted_samples = np.sort(samples)
+    top_10_percent_samples = sorted_samples[-round(0.1*len(samples)):]
+    bottom_10_percent_samples = sorted_samples[:round(0.1*len(samples))]
+    return np.mean(top_10_percent_samples) - np.mean(bottom_10_percent_samples)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for size in (10_000, 100_000, 1_000_000):
+        samples = np.sin(np.linspace(0, 200 * np.pi, size))
+        samples += rng.normal(scale=0.01, size=size)
+
+        assert np.isclose(
+            sort_based_amplitude(samples),
+            llom.calculate_voltage_amplitude(samples))
+
+        number = max(1, 1_000_000 // size)
+        sort_time = timeit.timeit(
+                        lambda: sort_based_amplitude(samples),
+                        number=number) / number
+        partition_time = timeit.timeit(
+                        lambda: llom.calculate_voltage_amplitude(samples),
+                        number=number) / number
+        print(f"{size:>9} samples: sort {sort_time * 1000:8.3f} ms, "
+              f"partition {partition_time * 1000:8.3f} ms "
+              f"({sort_time / partition_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2023 onwards LabsLand, Inc.
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE, which
+# you should have received as part of this distribution.
+#
+
+"""
+This code provides the measurements to asyncio applications, without
+blocking the event loop: the measurements are calculated in an executor (a
+pool of threads by default, since NumPy and SciPy release the GIL in the
+heavy parts, or a pool of processes).
+
+A MeasurementService limits the number of measurements being calculated at
+once (the rest wait for their turn) and the number of requests it accepts
+(more requests are rejected with ServiceBusyError instead of queueing
+without limit), and concurrent requests of the same measurements of the
+same samples share a single calculation. Cancelling a request that is
+waiting for its turn means it is never calculated.
+"""
+
+import asyncio
+import functools
+import os
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import ll_oscilloscope_measurements as llom
+
+
+class ServiceBusyError(RuntimeError):
+    """
+    The MeasurementService already has 'max_pending' requests.
+    """
+
+
+class MeasurementService:
+    """
+    Calculate measurements in an executor ('executor', or a pool of
+    'max_workers' threads, one per CPU by default), with at most
+    'max_running' of them (the number of workers by default) submitted at
+    once, and at most 'max_pending' requests (16 per running calculation by
+    default) being prepared, waiting for their turn or being calculated.
+
+    The samples are also converted and hashed (to find the concurrent
+    requests of the same samples) in the executor, so large captures do not
+    block the event loop either.
+    """
+
+    def __init__(
+            self,
+            executor: Optional[Executor] = None,
+            max_workers: Optional[int] = None,
+            max_running: Optional[int] = None,
+            max_pending: Optional[int] = None
+    ):
+        max_workers = max_workers or os.cpu_count() or 1
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers)
+        self.executor = executor
+        self.max_running = max_running or max_workers
+        self.max_pending = max_pending or 16 * self.max_running
+
+        self._loop = None
+        self._semaphore = None
+        self._requests = 0
+        # Calculation of each key and number of requests waiting for it
+        self._in_flight = {}
+
+    async def measure(
+            self,
+            functions: Iterable[str],
+            samples,
+            sampling_rate: Optional[float] = None,
+            other_channel_samples=None
+    ) -> Dict[str, float]:
+        """
+        Same as calculate_oscilloscope_measurements, without blocking the
+        event loop. Raises ServiceBusyError if the service already has
+        'max_pending' requests.
+        """
+        if self._requests >= self.max_pending:
+            raise ServiceBusyError(
+                f"The service already has {self._requests} requests "
+                f"(max_pending={self.max_pending})")
+        self._requests += 1
+        try:
+            return await self._measure(
+                                tuple(functions),
+                                samples,
+                                sampling_rate,
+                                other_channel_samples)
+        finally:
+            self._requests -= 1
+
+    async def _measure(
+            self,
+            functions: tuple,
+            samples,
+            sampling_rate: Optional[float],
+            other_channel_samples
+    ) -> Dict[str, float]:
+        loop = asyncio.get_running_loop()
+        samples, other_channel_samples, key = await loop.run_in_executor(
+                                                    self.executor,
+                                                    functools.partial(
+                                                        _prepare,
+                                                        functions,
+                                                        samples,
+                                                        sampling_rate,
+                                                        other_channel_samples))
+        if key not in self._in_flight:
+            calculation = asyncio.ensure_future(self._calculate(
+                                functools.partial(
+                                    llom.calculate_oscilloscope_measurements,
+                                    functions,
+                                    samples,
+                                    sampling_rate,
+                                    other_channel_samples)))
+            self._in_flight[key] = [calculation, 0]
+            calculation.add_done_callback(
+                lambda _: self._forget(key, calculation))
+
+        calculation, _ = in_flight = self._in_flight[key]
+        in_flight[1] += 1
+        try:
+            # The calculation is shared, so it is only cancelled when
+            # every request waiting for it is cancelled
+            return dict(await asyncio.shield(calculation))
+        except asyncio.CancelledError:
+            if in_flight[1] == 1 and not calculation.done():
+                calculation.cancel()
+                self._forget(key, calculation)
+            raise
+        finally:
+            in_flight[1] -= 1
+
+    async def measure_one(
+            self,
+            function: str,
+            samples,
+            sampling_rate: Optional[float] = None,
+            other_channel_samples=None
+    ) -> float:
+        """
+        Same as calculate_oscilloscope_measurement, without blocking the
+        event loop.
+        """
+        results = await self.measure(
+                            [function],
+                            samples,
+                            sampling_rate,
+                            other_channel_samples)
+        return results[function]
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of calculations waiting for their turn or being calculated.
+        """
+        return len(self._in_flight)
+
+    @property
+    def requests(self) -> int:
+        """
+        Number of requests being prepared, waiting or being calculated (at
+        most max_pending).
+        """
+        return self._requests
+
+    def close(self):
+        """
+        Shut down the executor, if it was created by the service.
+        """
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def _forget(self, key, calculation: asyncio.Future):
+        if key in self._in_flight and self._in_flight[key][0] is calculation:
+            del self._in_flight[key]
+
+    async def _calculate(self, calculate):
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, calculate)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # The semaphore belongs to the event loop where it is used
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_running)
+        return self._semaphore
+
+
+def _prepare(
+        functions: tuple,
+        samples,
+        sampling_rate: Optional[float],
+        other_channel_samples
+) -> tuple:
+    """
+    Convert the samples and calculate the key of the request, in the
+    executor.
+    """
+    samples = llom.as_samples(samples)
+    if other_channel_samples is not None:
+        other_channel_samples = llom.as_samples(other_channel_samples)
+    key = (
+        functions,
+        sampling_rate,
+        llom.samples_key(samples),
+        None if other_channel_samples is None
+        else llom.samples_key(other_channel_samples),
+    )
+    return samples, other_channel_samples, key
+
+
+_default_service = None  # pylint: disable=invalid-name
+
+
+async def measure_async(
+        functions: Iterable[str],
+        samples,
+        sampling_rate: Optional[float] = None,
+        other_channel_samples=None,
+        service: Optional[MeasurementService] = None
+) -> Dict[str, float]:
+    """
+    Same as calculate_oscilloscope_measurements, without blocking the event
+    loop. The measurements are calculated by 'service', or by a default
+    MeasurementService with a pool of threads.
+    """
+    global _default_service  # pylint: disable=global-statement
+    if service is None:
+        if _default_service is None:
+            _default_service = MeasurementService()
+        service = _default_service
+    return await service.measure(
+                        functions,
+                        samples,
+                        sampling_rate,
+                        other_channel_samples)
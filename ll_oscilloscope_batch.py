@@ -0,0 +1,391 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2023 onwards LabsLand, Inc.
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE, which
+# you should have received as part of this distribution.
+#
+
+"""
+This code measures many captures (e.g., the archive of recorded sessions)
+in parallel, spreading them across a pool of processes.
+
+measure_batch measures arrays of samples and measure_files measures capture
+files (see ll_oscilloscope_io). In both cases the results are generated in
+the same order as the captures, while the next captures are being measured,
+and they can be written with write_csv or write_json.
+
+Large arrays are sent to the processes through shared memory instead of
+being pickled, and capture files are opened by the processes themselves
+(memory mapped in the case of the binary format).
+"""
+
+import csv
+import itertools
+import json
+import os
+
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import (
+    Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+)
+
+import numpy as np
+
+import ll_oscilloscope_io as llio
+import ll_oscilloscope_measurements as llom
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# Arrays of at least this number of bytes are sent through shared memory
+SHARED_MEMORY_THRESHOLD = 1024 * 1024
+
+# Number of captures sent to a process at once
+CAPTURES_PER_TASK = 16
+
+
+class _SharedArray(NamedTuple):
+    """
+    Reference to an array in shared memory.
+    """
+    name: str
+    shape: tuple
+    dtype: str
+
+
+def measure_batch(
+        functions: Sequence[str],
+        captures: Iterable[Any],
+        sampling_rate: Optional[float] = None,
+        other_channel_captures: Optional[Iterable[Any]] = None,
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        cache: Optional[llom.ResultCache] = None,
+        tasks_in_flight: Optional[int] = None
+) -> Iterator[Dict[str, float]]:
+    """
+    Measure the 'functions' in every capture (an array of samples, or
+    anything accepted by calculate_oscilloscope_measurements), optionally
+    with the captures of the other channel for the phase delay.
+
+    Generate the results of each capture, in order. The captures are read
+    lazily, only a few tasks ahead of the results being generated, so they
+    can come from a generator of any length.
+
+    The captures are measured by 'workers' processes (one per CPU by
+    default), or by the provided 'executor', with at most 'tasks_in_flight'
+    tasks of CAPTURES_PER_TASK captures submitted at once (two per worker
+    by default). If a ResultCache is provided, the captures whose results
+    are in the cache are not sent to them.
+    """
+    functions = list(functions)
+    if other_channel_captures is None:
+        pairs = ((capture, None) for capture in captures)
+    else:
+        pairs = zip(captures, other_channel_captures)
+
+    def measure(pairs):
+        return _measure_pairs(
+                    functions,
+                    pairs,
+                    sampling_rate,
+                    workers,
+                    executor,
+                    tasks_in_flight)
+
+    if cache is None:
+        yield from measure(pairs)
+    else:
+        yield from _cached(functions, pairs, sampling_rate, cache, measure)
+
+
+def measure_files(
+        functions: Sequence[str],
+        paths: Iterable[str],
+        channel: str = 'Channel1',
+        other_channel: Optional[str] = None,
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        tasks_in_flight: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Measure the 'functions' in the 'channel' of every capture file (CSV or
+    binary, see ll_oscilloscope_io), using the sampling rate of the file and
+    optionally 'other_channel' for the phase delay, as measure_batch.
+
+    Generate the results of each file, in order, with the path of the file
+    in 'path'.
+    """
+    functions = list(functions)
+
+    def submit(executor):
+        for task in _grouped(paths, CAPTURES_PER_TASK):
+            future = executor.submit(
+                        _measure_files,
+                        functions,
+                        task,
+                        channel,
+                        other_channel)
+            yield future, None
+
+    yield from _in_order(submit, workers, executor, None, tasks_in_flight)
+
+
+def write_csv(
+        results: Iterable[Dict[str, Any]],
+        path: str
+) -> int:
+    """
+    Write the results (as generated by measure_batch or measure_files) in a
+    CSV file, one row per capture, while they are generated. Return the
+    number of rows.
+    """
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = None
+        for result in results:
+            if writer is None:
+                writer = csv.DictWriter(csv_file, fieldnames=list(result))
+                writer.writeheader()
+            writer.writerow(_serializable(result))
+            rows += 1
+    return rows
+
+
+def write_json(
+        results: Iterable[Dict[str, Any]],
+        path: str
+) -> int:
+    """
+    Write the results (as generated by measure_batch or measure_files) in a
+    JSON file, as a list with one object per capture, while they are
+    generated. Return the number of objects.
+    """
+    rows = 0
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json_file.write('[')
+        for result in results:
+            if rows:
+                json_file.write(',')
+            json_file.write('\n    ')
+            json.dump(_serializable(result), json_file)
+            rows += 1
+        json_file.write('\n]\n')
+    return rows
+
+
+def _measure_pairs(
+        functions: List[str],
+        pairs: Iterable,
+        sampling_rate: Optional[float],
+        workers: Optional[int],
+        executor: Optional[Executor],
+        tasks_in_flight: Optional[int]
+) -> Iterator[Dict[str, float]]:
+    def submit(executor):
+        for task in _grouped(pairs, CAPTURES_PER_TASK):
+            shared = []
+            arguments = []
+            for samples, other in task:
+                arguments.append((
+                    _share(samples, shared),
+                    None if other is None else _share(other, shared)))
+            future = executor.submit(
+                        _measure_captures,
+                        functions,
+                        arguments,
+                        sampling_rate)
+            yield future, shared
+
+    return _in_order(submit, workers, executor, _release, tasks_in_flight)
+
+
+def _cached(
+        functions: List[str],
+        pairs: Iterable,
+        sampling_rate: Optional[float],
+        cache: llom.ResultCache,
+        measure
+) -> Iterator[Dict[str, float]]:
+    """
+    Generate the results of every pair of captures in order, taking them
+    from the cache or, for the pairs not in the cache, from 'measure'.
+    """
+    # Keys of the results to measure, or the results found in the cache
+    slots = deque()
+
+    def missing():
+        for samples, other in pairs:
+            keys = cache.keys(functions, samples, sampling_rate, other)
+            results = {
+                function: cache.get(key) for function, key in keys.items()
+            }
+            if any(result is None for result in results.values()):
+                slots.append((keys, None))
+                yield samples, other
+            else:
+                slots.append((None, results))
+
+    for measured in measure(missing()):
+        while slots[0][0] is None:
+            yield slots.popleft()[1]
+        keys, _ = slots.popleft()
+        for function, key in keys.items():
+            cache.put(key, measured[function])
+        yield measured
+    while slots:
+        yield slots.popleft()[1]
+
+
+def _in_order(
+        submit,
+        workers,
+        executor,
+        release,
+        tasks_in_flight
+) -> Iterator[Dict]:
+    """
+    Submit the tasks, keeping at most 'tasks_in_flight' of them (two per
+    worker, one worker per CPU, by default) in flight, and generate their
+    results in order.
+    """
+    workers = workers or os.cpu_count() or 1
+    in_flight = tasks_in_flight or 2 * workers
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(workers)
+
+    pending = deque()
+    try:
+        for future, resources in submit(executor):
+            pending.append((future, resources))
+            if len(pending) >= in_flight:
+                yield from _results(pending.popleft(), release)
+        while pending:
+            yield from _results(pending.popleft(), release)
+    finally:
+        for future, resources in pending:
+            future.cancel()
+        for future, resources in pending:
+            if not future.cancelled():
+                future.exception()
+            if release is not None:
+                release(resources)
+        if own_executor:
+            executor.shutdown()
+
+
+def _results(submitted, release) -> List[Dict]:
+    future, resources = submitted
+    try:
+        return future.result()
+    finally:
+        if release is not None:
+            release(resources)
+
+
+def _grouped(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        group = list(itertools.islice(iterator, size))
+        if not group:
+            return
+        yield group
+
+
+def _share(samples, shared: List) -> Any:
+    """
+    Copy large arrays into shared memory, adding the shared memory to
+    'shared' so it is released later. Smaller captures are pickled.
+    """
+    samples = llom.as_samples(samples)
+    if shared_memory is None or samples.nbytes < SHARED_MEMORY_THRESHOLD:
+        return samples
+
+    memory = shared_memory.SharedMemory(create=True, size=samples.nbytes)
+    shared.append(memory)
+    np.ndarray(samples.shape, samples.dtype, buffer=memory.buf)[...] = samples
+    return _SharedArray(memory.name, samples.shape, samples.dtype.str)
+
+
+def _release(shared: List):
+    for memory in shared:
+        memory.close()
+        memory.unlink()
+
+
+def _measure_captures(
+        functions: List[str],
+        arguments: List,
+        sampling_rate: Optional[float]
+) -> List[Dict[str, float]]:
+    """
+    Measure a group of captures, in a process of the pool.
+    """
+    results = []
+    for samples, other in arguments:
+        attached = []
+        samples = _attach(samples, attached)
+        other = _attach(other, attached)
+        results.append(llom.calculate_oscilloscope_measurements(
+                            functions,
+                            samples,
+                            sampling_rate,
+                            other))
+        del samples, other
+        for memory in attached:
+            memory.close()
+    return results
+
+
+def _attach(samples, attached: List):
+    if not isinstance(samples, _SharedArray):
+        return samples
+    memory = shared_memory.SharedMemory(name=samples.name)
+    attached.append(memory)
+    return np.ndarray(samples.shape, samples.dtype, buffer=memory.buf)
+
+
+def _measure_files(
+        functions: List[str],
+        paths: List[str],
+        channel: str,
+        other_channel: Optional[str]
+) -> List[Dict[str, Any]]:
+    """
+    Measure a group of capture files, in a process of the pool.
+    """
+    results = []
+    for path in paths:
+        capture = _load(path)
+        result = {'path': path}
+        result.update(llom.calculate_oscilloscope_measurements(
+                        functions,
+                        capture.column(channel),
+                        capture.sampling_rate,
+                        None if other_channel is None
+                        else capture.column(other_channel)))
+        results.append(result)
+        del capture
+    return results
+
+
+def _load(path: str) -> llio.Capture:
+    with open(path, 'rb') as capture_file:
+        is_binary = capture_file.read(len(llio.MAGIC)) == llio.MAGIC
+    if is_binary:
+        return llio.open_binary(path)
+    return llio.read_csv(path)
+
+
+def _serializable(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value.tolist() if isinstance(value, (np.ndarray, np.generic))
+        else value
+        for key, value in result.items()
+    }
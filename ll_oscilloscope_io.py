@@ -0,0 +1,287 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2023 onwards LabsLand, Inc.
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE, which
+# you should have received as part of this distribution.
+#
+
+"""
+This code loads captures of an oscilloscope so they can be measured with
+ll_oscilloscope_measurements.
+
+Two formats are supported:
+
+ * The CSV files exported by the oscilloscope (see tests/data), with an
+   optional 'sep=' line, a header with the name of each column (e.g.,
+   Time, Channel1, Channel2) and one row per sample. They are parsed in
+   bulk with NumPy.
+
+ * A compact binary format, with the samples of each column stored
+   contiguously after a small header. It is opened with np.memmap, so the
+   captures of very long sessions can be measured without loading them
+   into memory. CSV files are converted into it with convert_csv_to_binary.
+
+The binary format is:
+
+ * The magic string b'LLOSC' and a version byte.
+ * The length of the header, as a little endian uint32.
+ * The header, in JSON: the names of the columns, the dtype of the samples,
+   the number of samples of each column and the sampling rate (if known).
+   It is padded with spaces so the samples are aligned to 64 bytes.
+ * The samples of each column, one column after another.
+"""
+
+import itertools
+import json
+import struct
+
+from typing import Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+import numpy as np
+
+MAGIC = b'LLOSC\x01'
+
+# The samples start at a multiple of this number of bytes
+ALIGNMENT = 64
+
+# Number of rows of the CSV files parsed at once
+CSV_CHUNK_ROWS = 100_000
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+class Capture(NamedTuple):
+    """
+    Samples of every column of a capture, in a (n_columns, n_samples) array.
+    """
+    names: List[str]
+    data: np.ndarray
+    sampling_rate: Optional[float] = None
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Samples of the column with that name.
+        """
+        return self.data[self.names.index(name)]
+
+    def chunks(self, name: str, chunk_size: int) -> Iterator[np.ndarray]:
+        """
+        Samples of the column with that name, in chunks of chunk_size (e.g.,
+        to measure them with StreamingMeasurements).
+        """
+        samples = self.column(name)
+        for start in range(0, len(samples), chunk_size):
+            yield samples[start:start + chunk_size]
+
+
+def read_csv(path: str, dtype=float) -> Capture:
+    """
+    Load every column of a CSV file exported by the oscilloscope.
+    """
+    with open(path, 'r', encoding='utf-8') as csv_file:
+        names, delimiter = _read_csv_header(csv_file)
+        chunks = list(_read_csv_chunks(csv_file, delimiter, len(names), dtype))
+
+    if not chunks:
+        return Capture(names, np.empty((len(names), 0), dtype))
+    # Each column contiguous, so measuring it does not need strided access
+    data = np.empty((len(names), sum(len(chunk) for chunk in chunks)), dtype)
+    position = 0
+    for chunk in chunks:
+        data[:, position:position + len(chunk)] = chunk.T
+        position += len(chunk)
+    return Capture(names, data, _sampling_rate(names, chunks[0].T))
+
+
+def convert_csv_to_binary(
+        csv_path: str,
+        binary_path: str,
+        dtype=float
+) -> Capture:
+    """
+    Convert a CSV file exported by the oscilloscope into the binary format,
+    parsing it in chunks so the whole file is never in memory. Return the
+    new capture, memory mapped.
+    """
+    with open(csv_path, 'r', encoding='utf-8') as csv_file:
+        names, delimiter = _read_csv_header(csv_file)
+        n_samples = sum(1 for line in csv_file if line.strip())
+
+    with open(csv_path, 'r', encoding='utf-8') as csv_file:
+        _read_csv_header(csv_file)
+        chunks = _read_csv_chunks(csv_file, delimiter, len(names), dtype)
+        first_chunk = next(chunks, np.empty((0, len(names)), dtype))
+        sampling_rate = _sampling_rate(names, first_chunk.T)
+
+        data = _create_binary(
+                    binary_path,
+                    names,
+                    np.dtype(dtype),
+                    n_samples,
+                    sampling_rate)
+        position = 0
+        for chunk in itertools.chain([first_chunk], chunks):
+            data[:, position:position + len(chunk)] = chunk.T
+            position += len(chunk)
+        _flush(data)
+        del data
+
+    return open_binary(binary_path)
+
+
+def write_binary(
+        path: str,
+        columns: Dict[str, np.ndarray],
+        sampling_rate: Optional[float] = None,
+        dtype=float
+):
+    """
+    Store the samples of every column (all of them of the same length) in
+    the binary format.
+    """
+    names = list(columns)
+    n_samples = len(columns[names[0]]) if names else 0
+    data = _create_binary(
+                path,
+                names,
+                np.dtype(dtype),
+                n_samples,
+                sampling_rate)
+    for index, name in enumerate(names):
+        data[index] = columns[name]
+    _flush(data)
+
+
+def open_binary(path: str, mode: str = 'r') -> Capture:
+    """
+    Open a file in the binary format with np.memmap, so the samples are only
+    read from disk when they are used.
+    """
+    with open(path, 'rb') as binary_file:
+        header, offset = _read_binary_header(binary_file)
+
+    shape = (len(header['columns']), header['n_samples'])
+    if shape[0] * shape[1] == 0:
+        data = np.empty(shape, header['dtype'])
+    else:
+        data = np.memmap(
+                    path,
+                    dtype=header['dtype'],
+                    mode=mode,
+                    offset=offset,
+                    shape=shape)
+    return Capture(header['columns'], data, header['sampling_rate'])
+
+
+def _read_csv_header(csv_file: TextIO) -> Tuple[List[str], Optional[str]]:
+    """
+    Read the optional 'sep=' line and the names of the columns. Return the
+    names and the delimiter (None for whitespace).
+    """
+    delimiter = None
+    line = csv_file.readline()
+    if line.startswith('sep='):
+        delimiter = line[len('sep='):].rstrip('\r\n') or None
+        line = csv_file.readline()
+    names = [name.strip() for name in line.strip().split(delimiter)]
+    return names, delimiter
+
+
+def _read_csv_chunks(
+        csv_file: TextIO,
+        delimiter: Optional[str],
+        n_columns: int,
+        dtype
+) -> Iterator[np.ndarray]:
+    """
+    Parse the rows of the CSV file, CSV_CHUNK_ROWS at a time, into
+    (n_rows, n_columns) arrays.
+    """
+    while True:
+        lines = list(itertools.islice(csv_file, CSV_CHUNK_ROWS))
+        if not lines:
+            return
+        chunk = np.loadtxt(
+                    lines,
+                    dtype=dtype,
+                    delimiter=delimiter,
+                    ndmin=2)
+        if len(chunk) == 0:
+            continue
+        if chunk.shape[1] != n_columns:
+            raise ValueError(
+                f"Expected {n_columns} columns, found {chunk.shape[1]}")
+        yield chunk
+
+
+def _sampling_rate(names: List[str], data: np.ndarray) -> Optional[float]:
+    """
+    Sampling rate from the 'Time' column, if there is one, using the median
+    time between samples (some captures start again in the middle). Only
+    the first chunk of the file is used, so it is the same when converting
+    the file.
+    """
+    if 'Time' not in names or data.shape[-1] < 2:
+        return None
+    times = data[names.index('Time')]
+    return float(1 / np.median(np.diff(times)))
+
+
+def _create_binary(
+        path: str,
+        names: List[str],
+        dtype: np.dtype,
+        n_samples: int,
+        sampling_rate: Optional[float]
+) -> np.ndarray:
+    """
+    Write the header of a binary file and return the (memory mapped) array
+    to fill with the samples.
+    """
+    header = json.dumps({
+        'columns': names,
+        'dtype': dtype.str,
+        'n_samples': n_samples,
+        'sampling_rate': sampling_rate,
+    }).encode('utf-8')
+    prefix_length = len(MAGIC) + _HEADER_LENGTH.size
+    padding = -(prefix_length + len(header)) % ALIGNMENT
+    header += b' ' * padding
+
+    with open(path, 'wb') as binary_file:
+        binary_file.write(MAGIC)
+        binary_file.write(_HEADER_LENGTH.pack(len(header)))
+        binary_file.write(header)
+        binary_file.truncate(
+            prefix_length + len(header) + len(names) * n_samples * dtype.itemsize)
+
+    shape = (len(names), n_samples)
+    if shape[0] * shape[1] == 0:
+        return np.empty(shape, dtype)
+    return np.memmap(
+                path,
+                dtype=dtype,
+                mode='r+',
+                offset=prefix_length + len(header),
+                shape=shape)
+
+
+def _flush(data: np.ndarray):
+    if isinstance(data, np.memmap):
+        data.flush()
+
+
+def _read_binary_header(binary_file) -> Tuple[Dict, int]:
+    """
+    Read the header of a binary file. Return it and the offset of the
+    samples.
+    """
+    magic = binary_file.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError(f"Not a capture file: {binary_file.name}")
+    header_length, = _HEADER_LENGTH.unpack(
+                        binary_file.read(_HEADER_LENGTH.size))
+    header = json.loads(binary_file.read(header_length).decode('utf-8'))
+    return header, len(MAGIC) + _HEADER_LENGTH.size + header_length
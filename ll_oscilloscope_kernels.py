@@ -0,0 +1,264 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2023 onwards LabsLand, Inc.
+# All rights reserved.
+#
+# This software is licensed as described in the file LICENSE, which
+# you should have received as part of this distribution.
+#
+"""
+This code provides the loops over the samples that NumPy can only express
+with several passes and temporary masks (the search of the edges between
+two levels, the crossings of several levels with hysteresis and the
+samples over or under a level), compiled with Numba if it is installed.
+
+Each kernel works on the samples of a single capture (1-D) in a single
+pass, without allocating temporary arrays, and gives the same results as
+the NumPy code of ll_oscilloscope_measurements (which uses them when
+HAS_NUMBA, see set_kernel_backend). Without Numba, the kernels are plain
+Python functions: correct, but only useful to test them.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+
+def _compile(function):
+    """
+    Compile the function with Numba, if it is installed. The Python version
+    is still available as 'py_func'.
+    """
+    if numba is None:
+        function.py_func = function
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@_compile
+def first_transition(
+        samples: np.ndarray,
+        amplitude_10_percent: float,
+        amplitude_90_percent: float,
+        rising: bool
+) -> Tuple[int, int]:
+    """
+    Find the first transition between the levels (from the 10% to the 90%
+    level if rising, from the 90% to the 10% level otherwise): the first
+    sample beyond the final level after a sample beyond the initial one,
+    and the latest sample beyond the initial level before it. Return the
+    positions of both samples, or (-1, -1) if there is no transition.
+    """
+    start = -1
+    for position in range(samples.shape[0]):
+        value = samples[position]
+        if rising:
+            is_initial = value <= amplitude_10_percent
+            is_final = value >= amplitude_90_percent
+        else:
+            is_initial = value >= amplitude_90_percent
+            is_final = value <= amplitude_10_percent
+        if is_initial:
+            start = position
+        elif is_final and start >= 0:
+            return start, position
+    return -1, -1
+
+
+@_compile
+def transitions(
+        samples: np.ndarray,
+        amplitude_10_percent: float,
+        amplitude_90_percent: float,
+        rising: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find every transition between the levels, as first_transition. Return
+    the positions where they start and stop.
+    """
+    # Transitions alternate with samples beyond the initial level
+    starts = np.empty(samples.shape[0] // 2 + 1, np.int64)
+    stops = np.empty(samples.shape[0] // 2 + 1, np.int64)
+    count = 0
+    # Latest sample beyond the initial level, if it is the latest sample
+    # beyond any of the levels
+    start = -1
+    for position in range(samples.shape[0]):
+        value = samples[position]
+        if rising:
+            is_initial = value <= amplitude_10_percent
+            is_final = value >= amplitude_90_percent
+        else:
+            is_initial = value >= amplitude_90_percent
+            is_final = value <= amplitude_10_percent
+        if is_initial:
+            start = position
+        elif is_final:
+            if start >= 0:
+                starts[count] = start
+                stops[count] = position
+                count += 1
+            start = -1
+    return starts[:count], stops[:count]
+
+
+@_compile
+def count_over(samples: np.ndarray, level: float) -> int:
+    """
+    Number of samples over the level.
+    """
+    count = 0
+    for position in range(samples.shape[0]):
+        if samples[position] > level:
+            count += 1
+    return count
+
+
+@_compile
+def count_under(samples: np.ndarray, level: float) -> int:
+    """
+    Number of samples under the level.
+    """
+    count = 0
+    for position in range(samples.shape[0]):
+        if samples[position] < level:
+            count += 1
+    return count
+
+
+@_compile
+def crossing_positions(
+        samples: np.ndarray,
+        positions: np.ndarray,
+        level: float
+) -> np.ndarray:
+    """
+    Interpolated position where the samples cross the level between each of
+    the positions and the next sample.
+    """
+    crossings = np.empty(positions.shape[0], np.float64)
+    for index in range(positions.shape[0]):
+        position = positions[index]
+        crossings[index] = position + (level - samples[position]) \
+            / (samples[position + 1] - samples[position])
+    return crossings
+
+
+# Number of crossings found by each call to the kernel
+CROSSINGS_PER_CALL = 65536
+
+
+def level_crossings(
+        samples: np.ndarray,
+        levels: np.ndarray,
+        lowers: np.ndarray,
+        uppers: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the crossings of every level, with hysteresis: the signal is high
+    after a sample over the upper limit of the level and low after a sample
+    under the lower limit, and each change of state is a crossing, at the
+    interpolated position where the signal crossed the level for the last
+    time before the change.
+
+    Return the index of the level, the position and whether it is rising
+    of every crossing, in order.
+    """
+    n_levels = len(levels)
+    # 1 if high, -1 if low, 0 until a sample is out of the limits
+    states = np.zeros(n_levels, np.int64)
+    # Latest sample before an upward and a downward crossing of each level
+    last_upward = np.full(n_levels, -1, np.int64)
+    last_downward = np.full(n_levels, -1, np.int64)
+
+    capacity = max(CROSSINGS_PER_CALL, n_levels)
+    chunks = []
+    position = 0
+    while True:
+        buffers = (
+            np.empty(capacity, np.int64),
+            np.empty(capacity, np.float64),
+            np.empty(capacity, np.bool_),
+        )
+        position, count = _level_crossings_from(
+                                samples,
+                                position,
+                                levels,
+                                lowers,
+                                uppers,
+                                states,
+                                last_upward,
+                                last_downward,
+                                *buffers)
+        chunks.append([buffer[:count] for buffer in buffers])
+        if position == len(samples):
+            break
+    if len(chunks) == 1:
+        return tuple(chunks[0])
+    return tuple(np.concatenate(buffers) for buffers in zip(*chunks))
+
+
+@_compile
+def _level_crossings_from(
+        samples: np.ndarray,
+        first: int,
+        levels: np.ndarray,
+        lowers: np.ndarray,
+        uppers: np.ndarray,
+        states: np.ndarray,
+        last_upward: np.ndarray,
+        last_downward: np.ndarray,
+        level_indexes: np.ndarray,
+        positions: np.ndarray,
+        rising: np.ndarray
+) -> Tuple[int, int]:
+    """
+    Find the crossings from the 'first' sample, until the end of the
+    samples or until the buffers are full, updating the state of each
+    level. Return the next sample and the number of crossings found.
+    """
+    n_levels = levels.shape[0]
+    count = 0
+    for position in range(first, samples.shape[0]):
+        # Room for a crossing of every level in this sample
+        if count + n_levels > level_indexes.shape[0]:
+            return position, count
+
+        value = samples[position]
+        for index in range(n_levels):
+            level = levels[index]
+            if position > 0:
+                previous = samples[position - 1]
+                if previous <= level and value > level:
+                    last_upward[index] = position - 1
+                elif previous >= level and value < level:
+                    last_downward[index] = position - 1
+
+            if value > uppers[index]:
+                state = 1
+            elif value < lowers[index]:
+                state = -1
+            else:
+                continue
+            if state == states[index]:
+                continue
+
+            if states[index] != 0:
+                if state == 1:
+                    start = last_upward[index]
+                else:
+                    start = last_downward[index]
+                level_indexes[count] = index
+                positions[count] = start + (level - samples[start]) \
+                    / (samples[start + 1] - samples[start])
+                rising[count] = state == 1
+                count += 1
+            states[index] = state
+    return samples.shape[0], count
@@ -15,15 +15,39 @@ Some of the functions were based on page 79 at:
 https://ece.engin.umich.edu/wp-content/uploads/sites/4/2019/08/D3000-97000_man.pdf
 
 as well as other documentation.
+
+Every calculate_* function works with a 1-D array of samples, but also with
+N-D arrays of several captures (e.g., a (n_frames, n_samples) array). In
+that case the samples of each capture are along 'axis' (the last one by
+default) and one result per capture is returned.
 """
 
+import bisect
+import contextlib
+import cProfile
+import functools
+import hashlib
+import inspect
+import io
+import itertools
 import logging
+import pstats
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
 
-from typing import List, Optional
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+)
 
 import numpy as np
+from scipy import fft as sp_fft
+from scipy import ndimage
 from scipy import signal
 
+import ll_oscilloscope_kernels as llk
+
 logger = logging.getLogger(__name__)
 
 ERROR_RESULT = -1000
@@ -57,7 +81,13 @@ def calculate_oscilloscope_measurement(
         function: str,
         samples: List[float],
         sampling_rate: Optional[float] = None,
-        other_channel_samples: Optional[List[float]] = None
+        other_channel_samples: Optional[List[float]] = None,
+        axis: int = -1,
+        cache: Optional['ResultCache'] = None,
+        gate: Optional['Gate'] = None,
+        compute_dtype=None,
+        hysteresis: Optional[float] = None,
+        prefilter: Optional['Prefilter'] = None
 ) -> float:
     """
     Given the name of 'function', the samples and optionally the sampling rate
@@ -65,7 +95,25 @@ def calculate_oscilloscope_measurement(
     measurement.
 
     Internally, this function calls the rest of the functions in this module.
-    Data is a list of float.
+    Data is a list of float, or a list of lists (or N-D array) of float with
+    several captures, in which case one result per capture is returned.
+    Arrays and buffers are used without copying them (see as_samples).
+
+    If a gate is provided, only the samples in the gate are measured.
+
+    If a ResultCache is provided, the result is only calculated if it is not
+    in the cache yet.
+
+    The measurement is calculated in 'compute_dtype' (float64 by default,
+    see COMPUTE_DTYPES).
+
+    If 'hysteresis' is provided (a percentage of the amplitude), the rise
+    and fall times, duty cycle and widths are measured from the crossings
+    of the levels with that hysteresis (see find_crossings), so the noise
+    around the levels does not affect them.
+
+    If a Prefilter is provided, the samples are filtered (before applying
+    the gate) and the filtered samples are measured.
     """
     if function == 'none':
         return 0.0
@@ -73,364 +121,4134 @@ def calculate_oscilloscope_measurement(
     if function is None:
         return -1.0
 
-    np_samples = np.array(samples, float)
-
-    functions_using_only_samples = {
-        MeasurementFunctions.voltage_peak_to_peak:
-            calculate_voltage_peak_to_peak,
-        MeasurementFunctions.voltage_average:
-            calculate_voltage_average,
-        MeasurementFunctions.voltage_rms:
-            calculate_voltage_rms,
-        MeasurementFunctions.voltage_max:
-            calculate_voltage_max,
-        MeasurementFunctions.voltage_min:
-            calculate_voltage_min,
-        MeasurementFunctions.voltage_base:
-            calculate_voltage_base,
-        MeasurementFunctions.voltage_top:
-            calculate_voltage_top,
-        MeasurementFunctions.voltage_amplitude:
-            calculate_voltage_amplitude,
-        MeasurementFunctions.preshoot:
-            calculate_preshoot,
-        MeasurementFunctions.overshoot:
-            calculate_overshoot,
-        MeasurementFunctions.positive_duty_cycle:
-            calculate_positive_duty_cycle,
-    }
+    np_samples = as_samples(samples, compute_dtype=compute_dtype)
+    if other_channel_samples is not None:
+        other_channel_samples = as_samples(
+                                    other_channel_samples,
+                                    compute_dtype=compute_dtype)
+    if prefilter is not None:
+        np_samples = prefilter.apply(np_samples, sampling_rate, axis)
+        if other_channel_samples is not None:
+            other_channel_samples = prefilter.apply(
+                                        other_channel_samples,
+                                        sampling_rate,
+                                        axis)
+    if gate is not None:
+        np_samples = gate.apply(np_samples, axis)
+        if other_channel_samples is not None:
+            other_channel_samples = gate.apply(other_channel_samples, axis)
 
-    if function in functions_using_only_samples:
-        return functions_using_only_samples[function](np_samples)
+    if cache is not None:
+        return cache.measurement(
+                    function,
+                    np_samples,
+                    sampling_rate,
+                    other_channel_samples,
+                    axis,
+                    hysteresis,
+                    compute_dtype)
 
-    functions_using_samples_and_sampling_rate = {
-        MeasurementFunctions.rise_time: calculate_rise_time,
-        MeasurementFunctions.fall_time: calculate_fall_time,
-        MeasurementFunctions.frequency: calculate_frequency,
-        MeasurementFunctions.period: calculate_period,
-        MeasurementFunctions.positive_width: calculate_positive_width,
-        MeasurementFunctions.negative_width: calculate_negative_width,
-    }
+    options = {}
+    if hysteresis is not None and function in _HYSTERESIS_FUNCTIONS:
+        options['hysteresis'] = hysteresis
 
-    if function in functions_using_samples_and_sampling_rate:
-        function_to_call = functions_using_samples_and_sampling_rate[function]
-        return function_to_call(np_samples, sampling_rate)
+    if function in _FUNCTIONS_USING_ONLY_SAMPLES:
+        return _FUNCTIONS_USING_ONLY_SAMPLES[function](
+                    np_samples,
+                    axis=axis,
+                    **options)
+
+    if function in _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE:
+        function_to_call = _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE[function]
+        return function_to_call(
+                    np_samples,
+                    sampling_rate,
+                    axis=axis,
+                    **options)
 
     if function == MeasurementFunctions.phase_delay:
         return calculate_phase_delay(
                 np_samples,
                 sampling_rate,
-                other_channel_samples
+                other_channel_samples,
+                axis=axis
         )
 
     # else... just send a clearly wrong number
     return ERROR_RESULT
 
 
-def calculate_voltage_peak_to_peak(samples: np.ndarray) -> float:
+def calculate_oscilloscope_measurements(
+        functions: Iterable[str],
+        samples: List[float],
+        sampling_rate: Optional[float] = None,
+        other_channel_samples: Optional[List[float]] = None,
+        axis: int = -1,
+        cache: Optional['ResultCache'] = None,
+        gate: Optional['Gate'] = None,
+        compute_dtype=None,
+        hysteresis: Optional[float] = None,
+        prefilter: Optional['Prefilter'] = None
+) -> Dict[str, float]:
+    """
+    Same as calculate_oscilloscope_measurement, but for several functions
+    at once. Returns a dictionary of function name to result.
+
+    The intermediate values that several measurements have in common (the
+    bottom and top 10% of the sorted samples, the mean, the max and min, the
+    peak of the spectrum...) are only calculated once, so asking for every
+    measurement costs roughly the same as asking for the most expensive one.
+
+    The samples are filtered once (if a Prefilter is provided) for every
+    measurement.
+
+    To calculate the same measurements on many frames, build a
+    MeasurementPlan once instead.
+    """
+    if cache is not None:
+        samples = as_samples(samples, compute_dtype=compute_dtype)
+        if other_channel_samples is not None:
+            other_channel_samples = as_samples(
+                                        other_channel_samples,
+                                        compute_dtype=compute_dtype)
+        if prefilter is not None:
+            samples = prefilter.apply(samples, sampling_rate, axis)
+            if other_channel_samples is not None:
+                other_channel_samples = prefilter.apply(
+                                            other_channel_samples,
+                                            sampling_rate,
+                                            axis)
+        if gate is not None:
+            samples = gate.apply(samples, axis)
+            if other_channel_samples is not None:
+                other_channel_samples = gate.apply(
+                                            other_channel_samples,
+                                            axis)
+        return cache.measurements(
+                    functions,
+                    samples,
+                    sampling_rate,
+                    other_channel_samples,
+                    axis,
+                    hysteresis,
+                    compute_dtype)
+
+    return MeasurementPlan(
+                functions,
+                sampling_rate,
+                compute_dtype,
+                hysteresis,
+                prefilter).run(
+                samples,
+                other_channel_samples,
+                axis=axis,
+                gate=gate)
+
+
+def calculate_gated_measurements(
+        functions: Iterable[str],
+        samples: List[float],
+        gates: Iterable['Gate'],
+        sampling_rate: Optional[float] = None,
+        other_channel_samples: Optional[List[float]] = None,
+        axis: int = -1,
+        compute_dtype=None,
+        hysteresis: Optional[float] = None,
+        prefilter: Optional['Prefilter'] = None
+) -> List[Dict[str, float]]:
+    """
+    Same as calculate_oscilloscope_measurements, for the samples in each of
+    the gates (e.g., the gates between several pairs of cursors). Returns a
+    list with the dictionary of function name to result of each gate.
+
+    The samples are never copied, and the average and RMS of every gate are
+    calculated at once, so measuring many gates costs much less than
+    measuring each of them separately. If a Prefilter is provided, all the
+    samples are filtered once, before applying the gates.
+    """
+    return MeasurementPlan(
+                functions,
+                sampling_rate,
+                compute_dtype,
+                hysteresis,
+                prefilter).run_gated(
+                samples,
+                gates,
+                other_channel_samples,
+                axis=axis)
+
+
+class Gate(NamedTuple):
+    """
+    Range of samples to measure, like the gate between two cursors of an
+    oscilloscope: from 'start' (included) to 'stop' (excluded, or until the
+    end if None). Negative indexes count from the end, like in slices.
+    """
+    start: int = 0
+    stop: Optional[int] = None
+
+    @classmethod
+    def from_times(
+            cls,
+            start_time: float,
+            stop_time: float,
+            sampling_rate: float,
+            first_sample_time: float = 0.0
+    ) -> 'Gate':
+        """
+        Gate of the samples taken from start_time to stop_time (both
+        included), given the time of the first sample.
+        """
+        # Tolerate the rounding errors of the times (e.g., 0.0012 * 25000)
+        start = np.ceil(
+                    (start_time - first_sample_time) * sampling_rate - 1e-9)
+        stop = np.floor(
+                    (stop_time - first_sample_time) * sampling_rate + 1e-9) + 1
+        return cls(max(int(start), 0), max(int(stop), 0))
+
+    def indices(self, length: int) -> Tuple[int, int]:
+        """
+        Start and stop of the gate in samples of that length.
+        """
+        start, stop, _ = slice(self.start, self.stop).indices(length)
+        if stop <= start:
+            raise ValueError(
+                f"No samples in the gate {self.start}-{self.stop}")
+        return start, stop
+
+    def apply(self, samples: np.ndarray, axis: int = -1) -> np.ndarray:
+        """
+        View of the samples in the gate (along axis).
+        """
+        start, stop = self.indices(samples.shape[axis])
+        index = [slice(None)] * samples.ndim
+        index[axis] = slice(start, stop)
+        return samples[tuple(index)]
+
+
+class FilterKinds:  # pylint: disable=too-few-public-methods
+    """
+    Filters that can be applied to the samples before measuring them
+    """
+    # Butterworth IIR filters of the 'cutoff' frequency
+    lowpass = 'lowpass'
+    highpass = 'highpass'
+    # Median of the 'window' samples around each one
+    median = 'median'
+    # Average of the 'window' samples around each one (boxcar FIR)
+    moving_average = 'moving_average'
+
+
+class Prefilter(NamedTuple):
+    """
+    Filter to apply to the samples before measuring them (one of
+    FilterKinds). The Butterworth filters use 'cutoff' (Hz) and 'order',
+    and are applied forward and backward ('zero_phase', so the edges are not
+    delayed) or only forward. The median and moving average use 'window'
+    samples, centered on each sample.
+    """
+    kind: str
+    cutoff: Optional[float] = None
+    order: int = 4
+    window: Optional[int] = None
+    zero_phase: bool = True
+
+    def apply(
+            self,
+            samples: np.ndarray,
+            sampling_rate: Optional[float] = None,
+            axis: int = -1
+    ) -> np.ndarray:
+        """
+        Filter the samples (along axis). The result has the same shape and,
+        if the samples are floats, the same dtype.
+        """
+        samples = np.asarray(samples)
+        if self.kind in (FilterKinds.lowpass, FilterKinds.highpass):
+            if self.cutoff is None or sampling_rate is None:
+                raise ValueError(
+                    f"A {self.kind} filter needs the cutoff frequency "
+                    "and the sampling rate")
+            sos = _filter_design(
+                        self.kind,
+                        self.order,
+                        float(self.cutoff),
+                        float(sampling_rate))
+            if self.zero_phase:
+                filtered = signal.sosfiltfilt(sos, samples, axis=axis)
+            else:
+                filtered = signal.sosfilt(sos, samples, axis=axis)
+        elif self.kind in (FilterKinds.median, FilterKinds.moving_average):
+            if self.window is None or self.window < 1:
+                raise ValueError(
+                    f"A {self.kind} filter needs a window of samples")
+            if self.kind == FilterKinds.median:
+                size = [1] * samples.ndim
+                size[axis] = self.window
+                filtered = ndimage.median_filter(
+                                samples,
+                                size=size,
+                                mode='nearest')
+            else:
+                filtered = np.moveaxis(
+                                _moving_average(
+                                    np.moveaxis(samples, axis, -1),
+                                    self.window),
+                                -1,
+                                axis)
+        else:
+            raise ValueError(f"Unknown filter: {self.kind}")
+
+        if np.issubdtype(samples.dtype, np.floating):
+            return filtered.astype(samples.dtype, copy=False)
+        return filtered
+
+
+@functools.lru_cache(maxsize=64)
+def _filter_design(
+        kind: str,
+        order: int,
+        cutoff: float,
+        sampling_rate: float
+) -> np.ndarray:
+    """
+    Second-order sections of the Butterworth filter, designed once for each
+    sampling rate and cutoff frequency.
+    """
+    return signal.butter(order, cutoff, kind, fs=sampling_rate, output='sos')
+
+
+def _moving_average(samples: np.ndarray, window: int) -> np.ndarray:
+    """
+    Average of the 'window' samples centered on each sample (along the last
+    axis), from the cumulative sums of the samples. The first and last
+    samples are repeated beyond the edges.
+    """
+    before = window // 2
+    after = window - 1 - before
+    padded = np.concatenate(
+                (
+                    np.repeat(samples[..., :1], before, axis=-1),
+                    samples,
+                    np.repeat(samples[..., -1:], after, axis=-1)
+                ),
+                axis=-1)
+    sums = _cumulative_sums(padded)
+    return (sums[..., window:] - sums[..., :-window]) / window
+
+
+class MeasurementPlan:
+    """
+    Measurements to calculate on many frames of samples (e.g., every frame
+    received from the oscilloscope) with the same sampling rate.
+
+    The function of each measurement and the intermediate values that they
+    need ('intermediates') are resolved once when the plan is built, so
+    running it on a new frame only calculates those intermediate values and
+    the measurements.
+
+    The measurements are calculated in 'compute_dtype' (float64 by default,
+    see COMPUTE_DTYPES). If 'hysteresis' is provided, the rise and fall
+    times, duty cycle and widths are measured from the crossings of the
+    levels with that hysteresis (see find_crossings), all of them found at
+    once.
+
+    If a Prefilter is provided, the samples (and the other channel) are
+    filtered once, before calculating any measurement.
+    """
+
+    def __init__(
+            self,
+            functions: Iterable[str],
+            sampling_rate: Optional[float] = None,
+            compute_dtype=None,
+            hysteresis: Optional[float] = None,
+            prefilter: Optional[Prefilter] = None
+    ):
+        self.functions = list(functions)
+        self.sampling_rate = sampling_rate
+        self.compute_dtype = _compute_dtype(compute_dtype)
+        self.hysteresis = hysteresis
+        self.prefilter = prefilter
+        self._measurements = [
+            (function, _resolve_context_measurement(function))
+            for function in self.functions
+        ]
+        self.intermediates = frozenset(
+                                intermediate
+                                for function in self.functions
+                                for intermediate in
+                                _intermediates(function, hysteresis))
+
+    def run(
+            self,
+            samples: List[float],
+            other_channel_samples: Optional[List[float]] = None,
+            axis: int = -1,
+            gate: Optional['Gate'] = None
+    ) -> Dict[str, float]:
+        """
+        Calculate the measurements of the samples (only the ones in the
+        gate, if provided). Returns a dictionary of function name to result,
+        like calculate_oscilloscope_measurements.
+        """
+        np_samples, other_channel_samples = self._prepare(
+                                                samples,
+                                                other_channel_samples,
+                                                axis)
+        if gate is not None:
+            start, stop = gate.indices(np_samples.shape[-1])
+            np_samples = np_samples[..., start:stop]
+            if other_channel_samples is not None:
+                other_channel_samples = other_channel_samples[..., start:stop]
+
+        return self._measure(_MeasurementContext(
+                                np_samples,
+                                self.sampling_rate,
+                                other_channel_samples,
+                                self.hysteresis))
+
+    def run_gated(
+            self,
+            samples: List[float],
+            gates: Iterable['Gate'],
+            other_channel_samples: Optional[List[float]] = None,
+            axis: int = -1
+    ) -> List[Dict[str, float]]:
+        """
+        Calculate the measurements of the samples in each gate. Returns a
+        list with the dictionary of function name to result of each gate.
+
+        The samples of the gates are never copied, and the mean and mean of
+        squares (average, RMS and anything derived from the average) of
+        every gate are calculated at once from the cumulative sums of the
+        samples.
+        """
+        np_samples, other_channel_samples = self._prepare(
+                                                samples,
+                                                other_channel_samples,
+                                                axis)
+
+        windows = [gate.indices(np_samples.shape[-1]) for gate in gates]
+        if not windows:
+            return []
+        starts, stops = np.array(windows).T
+        counts = stops - starts
+
+        gate_values = {}
+        for name, values in (
+                ('mean', lambda: np_samples),
+                ('mean_of_squares', lambda: np_samples ** 2)):
+            # The squares are only calculated if they are needed
+            if name in self.intermediates:
+                sums = _cumulative_sums(values())
+                gate_values[name] = (
+                    sums[..., stops] - sums[..., starts]) / counts
+
+        results = []
+        for index, (start, stop) in enumerate(windows):
+            context = _MeasurementContext(
+                            np_samples[..., start:stop],
+                            self.sampling_rate,
+                            None if other_channel_samples is None
+                            else other_channel_samples[..., start:stop],
+                            self.hysteresis)
+            for name, values in gate_values.items():
+                context.preset(name, values[..., index][()])
+            results.append(self._measure(context))
+        return results
+
+    def _prepare(
+            self,
+            samples: List[float],
+            other_channel_samples: Optional[List[float]],
+            axis: int
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Samples of both channels in the compute dtype, with the samples of
+        each capture in the last axis, and filtered.
+        """
+        prepared = []
+        for channel in (samples, other_channel_samples):
+            if channel is not None:
+                channel = _samples_in_last_axis(
+                            as_samples(
+                                channel,
+                                compute_dtype=self.compute_dtype),
+                            axis)
+                if self.prefilter is not None:
+                    channel = self.prefilter.apply(channel, self.sampling_rate)
+            prepared.append(channel)
+        return prepared[0], prepared[1]
+
+    def _measure(self, context: '_MeasurementContext') -> Dict[str, float]:
+        return {
+            function: measure(context)
+            for function, measure in self._measurements
+        }
+
+
+def _resolve_context_measurement(
+        function: str
+) -> Callable[['_MeasurementContext'], float]:
+    if function == 'none':
+        return lambda context: 0.0
+    if function is None:
+        return lambda context: -1.0
+    if function in _CONTEXT_MEASUREMENTS:
+        return _CONTEXT_MEASUREMENTS[function]
+    return lambda context: ERROR_RESULT
+
+
+def _cumulative_sums(samples: np.ndarray) -> np.ndarray:
+    """
+    Cumulative sums of the samples (along the last axis), starting with 0.
+    """
+    sums = np.zeros(samples.shape[:-1] + (samples.shape[-1] + 1,))
+    np.cumsum(samples, axis=-1, dtype=np.float64, out=sums[..., 1:])
+    return sums
+
+
+def _samples_in_last_axis(samples: np.ndarray, axis: int) -> np.ndarray:
+    if axis in (-1, samples.ndim - 1):
+        return samples
+    return np.moveaxis(samples, axis, -1)
+
+
+# Number of samples of the windows measured at once by rolling_measurements
+# (e.g., the windows in each rfft)
+ROLLING_CHUNK_SAMPLES = 1 << 22
+
+
+def rolling_measurements(
+        functions: Iterable[str],
+        samples: List[float],
+        window: int,
+        step: Optional[int] = None,
+        sampling_rate: Optional[float] = None,
+        other_channel_samples: Optional[List[float]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Calculate the measurements in windows of 'window' samples, one every
+    'step' samples (the window by default, so they do not overlap), of a
+    long capture (1-D), e.g., to plot how they drift along a recording.
+    Returns a dictionary of function name to an array with the result of
+    each window, the window i starting in the sample i * step.
+
+    The windows are views of the samples, never copied as a whole. The
+    average and RMS are calculated from cumulative sums, the max and min
+    from a sparse table of the extremes (or from the windows themselves, if
+    it is cheaper), and the frequency and period from the peak of the rfft
+    of the windows (as FrequencyMethods.rfft). The rest of measurements are
+    calculated with a MeasurementPlan, a few windows at a time.
+    """
+    functions = list(functions)
+    samples = as_samples(samples)
+    if samples.ndim != 1:
+        raise ValueError(f"Expected 1-D samples, got {samples.shape}")
+    step = window if step is None else step
+    if window < 1 or step < 1 or window > len(samples):
+        raise ValueError(
+            f"Invalid window of {window} samples every {step} samples "
+            f"for {len(samples)} samples")
+
+    starts = np.arange(0, len(samples) - window + 1, step)
+    windows = np.lib.stride_tricks.sliding_window_view(samples, window)[::step]
+    chunk = max(ROLLING_CHUNK_SAMPLES // window, 1)
+
+    results = {}
+    if _ROLLING_CUMULATIVE.intersection(functions):
+        sums = _cumulative_sums(samples)
+        means = (sums[starts + window] - sums[starts]) / window
+        results[MeasurementFunctions.voltage_average] = means
+        if MeasurementFunctions.voltage_rms in functions:
+            sums = _cumulative_sums(samples ** 2)
+            results[MeasurementFunctions.voltage_rms] = np.sqrt(
+                (sums[starts + window] - sums[starts]) / window)
+
+    if _ROLLING_EXTREMES.intersection(functions):
+        maxs, mins = _rolling_extremes(samples, windows, starts, chunk)
+        results[MeasurementFunctions.voltage_max] = maxs
+        results[MeasurementFunctions.voltage_min] = mins
+        results[MeasurementFunctions.voltage_peak_to_peak] = maxs - mins
+
+    if _ROLLING_FREQUENCY.intersection(functions):
+        frequencies = np.concatenate([
+            np.atleast_1d(_rfft_peak_frequency(
+                _rfft_spectrum(windows[first:first + chunk]),
+                window,
+                sampling_rate))
+            for first in range(0, len(windows), chunk)
+        ])
+        results[MeasurementFunctions.frequency] = frequencies
+        # Also ERROR_RESULT for the windows without a peak
+        with np.errstate(divide='ignore'):
+            results[MeasurementFunctions.period] = np.where(
+                                                        frequencies > 0,
+                                                        1 / frequencies,
+                                                        ERROR_RESULT)
+
+    rest = [function for function in functions if function not in results]
+    if rest:
+        other_windows = None
+        if other_channel_samples is not None:
+            other_windows = np.lib.stride_tricks.sliding_window_view(
+                                as_samples(other_channel_samples),
+                                window)[::step]
+        plan = MeasurementPlan(rest, sampling_rate)
+        measured = [
+            plan.run(
+                windows[first:first + chunk],
+                None if other_windows is None
+                else other_windows[first:first + chunk])
+            for first in range(0, len(windows), chunk)
+        ]
+        for function in rest:
+            results[function] = np.concatenate([
+                np.broadcast_to(
+                    np.asarray(chunk_results[function], float),
+                    (len(windows[first:first + chunk]),))
+                for first, chunk_results in zip(
+                    range(0, len(windows), chunk),
+                    measured)
+            ])
+
+    return {function: results[function] for function in functions}
+
+
+_ROLLING_CUMULATIVE = frozenset((
+    MeasurementFunctions.voltage_average,
+    MeasurementFunctions.voltage_rms,
+))
+
+_ROLLING_EXTREMES = frozenset((
+    MeasurementFunctions.voltage_max,
+    MeasurementFunctions.voltage_min,
+    MeasurementFunctions.voltage_peak_to_peak,
+))
+
+_ROLLING_FREQUENCY = frozenset((
+    MeasurementFunctions.frequency,
+    MeasurementFunctions.period,
+))
+
+
+def _rolling_extremes(
+        samples: np.ndarray,
+        windows: np.ndarray,
+        starts: np.ndarray,
+        chunk: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Max and min of each window. If the windows overlap so much that
+    reducing each of them would read every sample many times, they are
+    calculated from a sparse table instead: the extremes of every 2**k
+    samples, so each window is covered by two (overlapping) blocks.
+    """
+    window = windows.shape[-1]
+    if len(windows) * window <= len(samples) * np.log2(window + 1):
+        maxs = np.concatenate([
+            np.max(windows[first:first + chunk], axis=-1)
+            for first in range(0, len(windows), chunk)
+        ])
+        mins = np.concatenate([
+            np.min(windows[first:first + chunk], axis=-1)
+            for first in range(0, len(windows), chunk)
+        ])
+        return maxs, mins
+
+    # Extremes of the 'size' samples from each one, doubling the size
+    block_maxs = block_mins = samples
+    size = 1
+    while size * 2 <= window:
+        block_maxs = np.maximum(block_maxs[:-size], block_maxs[size:])
+        block_mins = np.minimum(block_mins[:-size], block_mins[size:])
+        size *= 2
+    lasts = starts + window - size
+    return (
+        np.maximum(block_maxs[starts], block_maxs[lasts]),
+        np.minimum(block_mins[starts], block_mins[lasts]),
+    )
+
+
+def as_samples(
+        samples,
+        dtype=None,
+        scale: Optional[float] = None,
+        offset: Optional[float] = None,
+        compute_dtype=None
+) -> np.ndarray:
+    """
+    Return the samples as a NumPy array of 'compute_dtype' (float64 by
+    default, see COMPUTE_DTYPES), without copying them if they already are
+    one.
+
+    'samples' can be a list, an array or any object supporting the buffer
+    protocol (bytes, memoryview, array.array...). Raw buffers (bytes,
+    bytearray, or a memoryview when 'dtype' is provided) are read as 'dtype'
+    (float by default), so the ADC codes of a scope can be used directly:
+
+        as_samples(raw_buffer, np.int16, scale=volts_per_code, offset=...)
+
+    When 'scale' or 'offset' are provided, the samples are converted into
+    volts as samples * scale + offset.
+    """
+    if isinstance(samples, (bytes, bytearray)) or (
+            dtype is not None and isinstance(samples, memoryview)):
+        np_samples = np.frombuffer(samples, float if dtype is None else dtype)
+    else:
+        np_samples = np.asarray(samples, dtype)
+
+    compute_dtype = _compute_dtype(compute_dtype)
+    if scale is None and offset is None:
+        return np.asarray(np_samples, compute_dtype)
+
+    volts = np.multiply(
+                np_samples,
+                1.0 if scale is None else scale,
+                dtype=compute_dtype)
+    if offset is not None:
+        volts += offset
+    return volts
+
+
+# Types in which the measurements can be calculated. With float32, half
+# the memory is read and written (enough for the 8-12 bits of the ADCs),
+# while the sums (average, RMS, base and top) and the spectrum are still
+# calculated in float64. Compared with float64:
+#
+#  * voltages (average, RMS, max, min, base, top, amplitude, preshoot,
+#    overshoot) differ in at most 2**-22 (2.4e-7) times the largest
+#    absolute voltage of the samples, due to the rounding of the samples
+#  * times (rise and fall time, positive and negative width), frequency,
+#    period, duty cycle and phase delay are the same, unless a sample is
+#    within that rounding of the 10%/90% levels or the average, or two
+#    delays have correlations within that rounding
+#  * the times interpolated between the samples (calculate_edge_statistics)
+#    differ in the rounding of the samples they are interpolated from
+#
+# The samples of the test captures are exact in float32, so all of their
+# results are the same (and, with added noise, within those bounds).
+COMPUTE_DTYPES = (np.float64, np.float32)
+
+
+def _compute_dtype(compute_dtype) -> np.dtype:
+    if compute_dtype is None:
+        return np.dtype(np.float64)
+    compute_dtype = np.dtype(compute_dtype)
+    if compute_dtype not in COMPUTE_DTYPES:
+        raise ValueError(f"Unsupported compute dtype: {compute_dtype}")
+    return compute_dtype
+
+
+class _MeasurementContext:
+    """
+    Intermediate values of a set of samples, calculated lazily the first time
+    that a measurement needs them and reused by the rest of measurements.
+
+    The samples of each capture must be in the last axis.
+    """
+
+    def __init__(
+            self,
+            samples: np.ndarray,
+            sampling_rate: Optional[float],
+            other_channel_samples: Optional[np.ndarray],
+            hysteresis: Optional[float] = None
+    ):
+        self.samples = samples
+        self.sampling_rate = sampling_rate
+        self.other_channel_samples = other_channel_samples
+        self.hysteresis = hysteresis
+        self._values = {}
+
+    def _get(self, name: str, calculate: Callable):
+        if name not in self._values:
+            self._values[name] = calculate()
+        return self._values[name]
+
+    def preset(self, name: str, value):
+        """
+        Use a value calculated somewhere else (e.g., from cumulative sums).
+        """
+        self._values[name] = value
+
+    @property
+    def mean(self) -> float:
+        """
+        Average of the samples, accumulated in float64.
+        """
+        return self._get(
+                    'mean',
+                    lambda: np.mean(self.samples, axis=-1, dtype=np.float64))
+
+    @property
+    def mean_of_squares(self) -> float:
+        """
+        Average of the squared samples, accumulated in float64.
+        """
+        return self._get(
+                    'mean_of_squares',
+                    lambda: np.mean(
+                                self.samples ** 2,
+                                axis=-1,
+                                dtype=np.float64))
+
+    @property
+    def max(self) -> float:
+        """
+        Maximum sample.
+        """
+        return self._get('max', lambda: np.max(self.samples, axis=-1))
+
+    @property
+    def min(self) -> float:
+        """
+        Minimum sample.
+        """
+        return self._get('min', lambda: np.min(self.samples, axis=-1))
+
+    @property
+    def base_and_top(self) -> Tuple[float, float]:
+        """
+        VBase and VTop: means of the bottom and top 10% of the samples.
+        """
+        return self._get(
+                    'base_and_top',
+                    lambda: _calculate_base_and_top(self.samples))
+
+    @property
+    def positive_samples(self) -> int:
+        """
+        Number of samples over the mean.
+        """
+        return self._get(
+                    'positive_samples',
+                    lambda: _count_over(self.samples, self.mean))
+
+    @property
+    def negative_samples(self) -> int:
+        """
+        Number of samples under the mean.
+        """
+        return self._get(
+                    'negative_samples',
+                    lambda: _count_under(self.samples, self.mean))
+
+    @property
+    def edge_levels(self) -> Tuple[float, float]:
+        """
+        The 10% and 90% levels used to find the edges.
+        """
+        return self._get(
+                    'edge_levels',
+                    lambda: _edge_levels(self.mean, self.min, self.max))
+
+    @property
+    def crossings(self) -> np.ndarray:
+        """
+        Crossings of the 10%, 90% and mean levels (see _hysteresis_crossings).
+        """
+        return self._get(
+                    'crossings',
+                    lambda: _hysteresis_crossings(
+                                self.samples,
+                                self.mean,
+                                self.min,
+                                self.max,
+                                self.hysteresis))
+
+    @property
+    def welch_peak(self) -> Tuple[np.ndarray, int]:
+        """
+        Frequencies of the Welch's method and the index of the peak.
+        """
+        return self._get(
+                    'welch_peak',
+                    lambda: _welch_peak(self.samples, self.sampling_rate))
+
+    @property
+    def frequency(self) -> float:
+        """
+        Frequency of the peak of the Welch's power spectral density.
+        """
+        frequencies, peak_index = self.welch_peak
+        return frequencies[peak_index]
+
+
+def _measure_preshoot(context: _MeasurementContext) -> float:
+    vbase, _ = context.base_and_top
+    return vbase - context.min
+
+
+def _measure_overshoot(context: _MeasurementContext) -> float:
+    _, vtop = context.base_and_top
+    return context.max - vtop
+
+
+def _measure_voltage_amplitude(context: _MeasurementContext) -> float:
+    vbase, vtop = context.base_and_top
+    return vtop - vbase
+
+
+def _measure_positive_duty_cycle(context: _MeasurementContext) -> float:
+    if context.hysteresis is not None:
+        return _from_crossings(context.crossings, _crossings_duty_cycle)
+    return (context.positive_samples / context.samples.shape[-1]) * 100
+
+
+def _measure_rise_time(context: _MeasurementContext) -> float:
+    if context.hysteresis is not None:
+        return _from_crossings(
+                    context.crossings,
+                    lambda crossings: _crossings_edge_time(
+                                        crossings,
+                                        context.sampling_rate,
+                                        True))
+    return _first_edge_time(
+                context.samples,
+                context.edge_levels,
+                True,
+                context.sampling_rate)
+
+
+def _measure_fall_time(context: _MeasurementContext) -> float:
+    if context.hysteresis is not None:
+        return _from_crossings(
+                    context.crossings,
+                    lambda crossings: _crossings_edge_time(
+                                        crossings,
+                                        context.sampling_rate,
+                                        False))
+    return _first_edge_time(
+                context.samples,
+                context.edge_levels,
+                False,
+                context.sampling_rate)
+
+
+def _measure_positive_width(context: _MeasurementContext) -> float:
+    if context.hysteresis is not None:
+        return _from_crossings(
+                    context.crossings,
+                    lambda crossings: _crossings_width(
+                                        crossings,
+                                        context.sampling_rate,
+                                        True))
+    _, peak_index = context.welch_peak
+    return context.positive_samples / peak_index / context.sampling_rate
+
+
+def _measure_negative_width(context: _MeasurementContext) -> float:
+    if context.hysteresis is not None:
+        return _from_crossings(
+                    context.crossings,
+                    lambda crossings: _crossings_width(
+                                        crossings,
+                                        context.sampling_rate,
+                                        False))
+    _, peak_index = context.welch_peak
+    return context.negative_samples / peak_index / context.sampling_rate
+
+
+def _measure_phase_delay(context: _MeasurementContext) -> float:
+    return _phase_delay_to_degrees(
+                _phase_delay_in_samples(
+                    context.samples,
+                    context.other_channel_samples),
+                context.sampling_rate,
+                context.frequency)
+
+
+_CONTEXT_MEASUREMENTS = {
+    MeasurementFunctions.voltage_peak_to_peak:
+        lambda context: context.max - context.min,
+    MeasurementFunctions.voltage_average:
+        lambda context: context.mean,
+    MeasurementFunctions.voltage_rms:
+        lambda context: np.sqrt(context.mean_of_squares),
+    MeasurementFunctions.voltage_max:
+        lambda context: context.max,
+    MeasurementFunctions.voltage_min:
+        lambda context: context.min,
+    MeasurementFunctions.voltage_base:
+        lambda context: context.base_and_top[0],
+    MeasurementFunctions.voltage_top:
+        lambda context: context.base_and_top[1],
+    MeasurementFunctions.voltage_amplitude: _measure_voltage_amplitude,
+    MeasurementFunctions.preshoot: _measure_preshoot,
+    MeasurementFunctions.overshoot: _measure_overshoot,
+    MeasurementFunctions.positive_duty_cycle: _measure_positive_duty_cycle,
+    MeasurementFunctions.rise_time: _measure_rise_time,
+    MeasurementFunctions.fall_time: _measure_fall_time,
+    MeasurementFunctions.frequency:
+        lambda context: context.frequency,
+    MeasurementFunctions.period:
+        lambda context: 1 / context.frequency,
+    MeasurementFunctions.positive_width: _measure_positive_width,
+    MeasurementFunctions.negative_width: _measure_negative_width,
+    MeasurementFunctions.phase_delay: _measure_phase_delay,
+}
+
+
+# Intermediate values used by each measurement: the cached properties of
+# _MeasurementContext that it reads, directly or through other ones
+_MEASUREMENT_INTERMEDIATES = {
+    MeasurementFunctions.voltage_peak_to_peak: ('max', 'min'),
+    MeasurementFunctions.voltage_average: ('mean',),
+    MeasurementFunctions.voltage_rms: ('mean_of_squares',),
+    MeasurementFunctions.voltage_max: ('max',),
+    MeasurementFunctions.voltage_min: ('min',),
+    MeasurementFunctions.voltage_base: ('base_and_top',),
+    MeasurementFunctions.voltage_top: ('base_and_top',),
+    MeasurementFunctions.voltage_amplitude: ('base_and_top',),
+    MeasurementFunctions.preshoot: ('base_and_top', 'min'),
+    MeasurementFunctions.overshoot: ('base_and_top', 'max'),
+    MeasurementFunctions.positive_duty_cycle: ('mean', 'positive_samples'),
+    MeasurementFunctions.rise_time: ('mean', 'max', 'min', 'edge_levels'),
+    MeasurementFunctions.fall_time: ('mean', 'max', 'min', 'edge_levels'),
+    MeasurementFunctions.frequency: ('welch_peak',),
+    MeasurementFunctions.period: ('welch_peak',),
+    MeasurementFunctions.positive_width:
+        ('welch_peak', 'mean', 'positive_samples'),
+    MeasurementFunctions.negative_width:
+        ('welch_peak', 'mean', 'negative_samples'),
+    MeasurementFunctions.phase_delay: ('welch_peak',),
+}
+
+# Intermediate values used by the measurements with hysteresis (see
+# _HYSTERESIS_FUNCTIONS), instead of the ones above
+_HYSTERESIS_INTERMEDIATES = ('mean', 'max', 'min', 'crossings')
+
+
+def _intermediates(
+        function: str,
+        hysteresis: Optional[float] = None
+) -> Tuple[str, ...]:
+    """
+    Intermediate values used by the measurement 'function'.
+    """
+    if hysteresis is not None and function in _HYSTERESIS_FUNCTIONS:
+        return _HYSTERESIS_INTERMEDIATES
+    return _MEASUREMENT_INTERMEDIATES.get(function, ())
+
+
+def _per_sample(value: np.ndarray) -> np.ndarray:
+    """
+    Given a value per capture (e.g., the mean), add back the last axis so it
+    can be compared with the samples of each capture.
+    """
+    return np.expand_dims(value, -1)
+
+
+def calculate_voltage_peak_to_peak(
+        samples: np.ndarray,
+        axis: int = -1
+) -> float:
     """
     Calculate the voltage peak to peak of an array.
     """
-    return np.max(samples) - min(samples)
+    return np.max(samples, axis=axis) - np.min(samples, axis=axis)
 
 
-def calculate_voltage_average(samples: np.ndarray) -> float:
+def calculate_voltage_average(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the voltage average of the samples
     """
-    return np.mean(samples)
+    return np.mean(samples, axis=axis, dtype=np.float64)
 
 
-def calculate_voltage_rms(samples: np.ndarray) -> float:
+def calculate_voltage_rms(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the RMS (Root Mean Square)
     """
     samples_squared = samples ** 2
-    mean_squared = np.mean(samples_squared)
+    mean_squared = np.mean(samples_squared, axis=axis, dtype=np.float64)
     return np.sqrt(mean_squared)
 
 
-def calculate_voltage_max(samples: np.ndarray) -> float:
+def calculate_voltage_max(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the max voltage of the samples
     """
-    return np.max(samples)
+    return np.max(samples, axis=axis)
 
 
-def calculate_voltage_min(samples: np.ndarray) -> float:
+def calculate_voltage_min(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the min voltage of the samples
     """
-    return np.min(samples)
+    return np.min(samples, axis=axis)
 
 
-def calculate_voltage_base(samples: np.ndarray) -> float:
+def calculate_voltage_base(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the VBase (voltage base) of the samples.
 
     We use as definition the average of the bottom 10% of the sample values.
     """
-    # VBase is the mean of the bottom 10% of the values
-    sorted_samples = np.sort(samples)
-    bottom_10_percent_samples = sorted_samples[:round(0.1*len(samples))]
-    vbase = np.mean(bottom_10_percent_samples)
+    vbase, _ = _calculate_base_and_top(np.moveaxis(samples, axis, -1))
     return vbase
 
 
-def calculate_voltage_top(samples: np.ndarray) -> float:
+def calculate_voltage_top(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the VTop (voltage top) of the samples.
 
     We use as definition the average of the top 10% of the sample values.
     """
-    sorted_samples = np.sort(samples)
-    top_10_percent_samples = sorted_samples[-round(0.1*len(samples)):]
-    vtop = np.mean(top_10_percent_samples)
+    _, vtop = _calculate_base_and_top(np.moveaxis(samples, axis, -1))
     return vtop
 
 
-def calculate_voltage_amplitude(samples: np.ndarray) -> float:
+def calculate_voltage_amplitude(
+        samples: np.ndarray,
+        axis: int = -1
+) -> float:
     """
     Calculate the voltage amplitude of the samples.
 
     We use as definition the difference between the VTop and VBase
     """
     # Don't call calculate_voltage_base and calculate_voltage_top to avoid
-    # sorting twice
-    sorted_samples = np.sort(samples)
-    top_10_percent_samples = sorted_samples[-round(0.1*len(samples)):]
-    vtop = np.mean(top_10_percent_samples)
-    bottom_10_percent_samples = sorted_samples[:round(0.1*len(samples))]
-    vbase = np.mean(bottom_10_percent_samples)
+    # partitioning twice
+    vbase, vtop = _calculate_base_and_top(np.moveaxis(samples, axis, -1))
     return vtop - vbase
 
 
-def calculate_preshoot(samples: np.ndarray) -> float:
+def _calculate_base_and_top(samples: np.ndarray) -> Tuple[float, float]:
+    """
+    Calculate both the VBase and the VTop (along the last axis) selecting
+    the extreme samples only once.
+    """
+    # VBase is the mean of the bottom 10% of the values, and VTop the
+    # mean of the top 10% of the values
+    bottom_10_percent_samples, top_10_percent_samples = _extremes(samples)
+    vbase = np.mean(bottom_10_percent_samples, axis=-1, dtype=np.float64)
+    vtop = np.mean(top_10_percent_samples, axis=-1, dtype=np.float64)
+    return vbase, vtop
+
+
+def _extremes(samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the bottom 10% and the top 10% of the samples (along the last
+    axis), in no particular order.
+
+    They are the same samples as sorted_samples[:10%] and
+    sorted_samples[-10%:], but instead of sorting (O(n log n)) two partitions
+    (O(n)) are used: the first one places the bottom 10% before the rest of
+    the samples, and the second one (in place, only on the rest of the
+    samples) places the top 10% at the end.
+    """
+    length = samples.shape[-1]
+    ten_percent = round(0.1*length)
+    if ten_percent == 0:
+        # As with sorted_samples[:0] and sorted_samples[-0:]
+        return samples[..., :0], samples
+
+    partitioned_samples = np.partition(samples, ten_percent - 1, axis=-1)
+    remaining_samples = partitioned_samples[..., ten_percent:]
+    remaining_samples.partition(length - 2 * ten_percent, axis=-1)
+    return (
+        partitioned_samples[..., :ten_percent],
+        partitioned_samples[..., length - ten_percent:]
+    )
+
+
+def calculate_preshoot(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the preshoot of the samples.
 
     We use as definition the difference between VBase and Vmin
     """
-    vbase = calculate_voltage_base(samples)
-    vmin = calculate_voltage_min(samples)
+    vbase, _ = _calculate_base_and_top(np.moveaxis(samples, axis, -1))
+    vmin = calculate_voltage_min(samples, axis=axis)
     return vbase - vmin
 
 
-def calculate_overshoot(samples: np.ndarray) -> float:
+def calculate_overshoot(samples: np.ndarray, axis: int = -1) -> float:
     """
     Calculate the overshoot of the samples.
 
     We use as definition the difference between Vmax and VTop
     """
-    vmax = calculate_voltage_max(samples)
-    vtop = calculate_voltage_top(samples)
+    vmax = calculate_voltage_max(samples, axis=axis)
+    _, vtop = _calculate_base_and_top(np.moveaxis(samples, axis, -1))
     return vmax - vtop
 
 
-def calculate_rise_time(samples: np.ndarray, sampling_rate: float) -> float:
+def calculate_rise_time(
+        samples: np.ndarray,
+        sampling_rate: float,
+        axis: int = -1,
+        hysteresis: Optional[float] = None
+) -> float:
     """
     Calculate the rise time of the samples.
+
+    This is the time of the first rising edge: from the latest sample under
+    the 10% level to the next sample over the 90% level.
+    If 'hysteresis' is provided (a percentage of the amplitude), the edge
+    goes from the crossing of the 10% level to the crossing of the 90%
+    level, with that hysteresis and interpolated between the samples (see
+    find_crossings).
     """
-    dc_offset = np.mean(samples)
-    samples_without_offset = samples - dc_offset
+    samples = np.moveaxis(samples, axis, -1)
+    if hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    lambda crossings: _crossings_edge_time(
+                                        crossings,
+                                        sampling_rate,
+                                        True))
+    return _first_edge_time(
+                samples,
+                _samples_edge_levels(samples),
+                True,
+                sampling_rate)
 
-    # We are using the amplitude without bases,
-    # of the signal is from the maximum to the minimum
-    amplitude = max(samples_without_offset) - min(samples_without_offset)
 
-    # Identify the amplitude value corresponding to the 10% level
-    # of the signal. Find 10% of the  peak amplitude.
-    amplitude_10_percent = (
-            dc_offset
-            + 0.1 * amplitude
-            + min(samples_without_offset)
-    )
+def calculate_fall_time(
+        samples: np.ndarray,
+        sampling_rate: float,
+        axis: int = -1,
+        hysteresis: Optional[float] = None
+) -> float:
+    """
+    Calculate the fall time of the samples.
 
-    # Identify the index the amplitude value corresponding to the
-    # 90% level of the signal. Find 90%  of the peak amplitude.
-    amplitude_90_percent = (
-            dc_offset
-            + 0.9 * amplitude
-            + min(samples_without_offset)
-    )
+    This is the time of the first falling edge: from the latest sample over
+    the 90% level to the next sample under the 10% level.
+    If 'hysteresis' is provided (a percentage of the amplitude), the edge
+    goes from the crossing of the 90% level to the crossing of the 10%
+    level, with that hysteresis and interpolated between the samples (see
+    find_crossings).
+    """
+    samples = np.moveaxis(samples, axis, -1)
+    if hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    lambda crossings: _crossings_edge_time(
+                                        crossings,
+                                        sampling_rate,
+                                        False))
+    return _first_edge_time(
+                samples,
+                _samples_edge_levels(samples),
+                False,
+                sampling_rate)
 
-    # Find the index corresponding to the first occurrence of the
-    # amplitude crossing the 90% level (rising edge).
-    latest_under_10 = None
-    next_over_90 = None
-    for position, sample in enumerate(samples):
-        if sample <= amplitude_10_percent:
-            latest_under_10 = position
-        elif latest_under_10 is not None:
-            if sample >= amplitude_90_percent:
-                # We were under 10% in latest_under_10
-                # and now we are over 90%.
-                next_over_90 = position
-                break
 
-    if next_over_90 is None or latest_under_10 is None:
-        # Error: no change found
-        return ERROR_RESULT
+def calculate_rise_times(
+        samples: np.ndarray,
+        sampling_rate: float
+) -> np.ndarray:
+    """
+    Calculate the rise time of every rising edge in the samples (1-D).
+    """
+    return find_rising_edges(samples).durations(sampling_rate)
 
-    # Calculate the rise time by subtracting the time corresponding
-    # to the 10% level from the time corresponding to the 90% level.
-    # This can be done by multiplying the index difference by the
-    # sampling period.
-    sampling_period = 1 / sampling_rate
-    rise_time = (next_over_90 - latest_under_10) * sampling_period
-    return rise_time
+
+def calculate_fall_times(
+        samples: np.ndarray,
+        sampling_rate: float
+) -> np.ndarray:
+    """
+    Calculate the fall time of every falling edge in the samples (1-D).
+    """
+    return find_falling_edges(samples).durations(sampling_rate)
 
 
-def calculate_fall_time(samples: np.ndarray, sampling_rate: float) -> float:
+class EdgeStatistics(NamedTuple):
     """
-    Calculate the fall time of the samples.
+    Statistics of a measurement over every cycle of the samples, like the
+    statistics mode of an oscilloscope. Without any cycle, the count is 0
+    and the rest are ERROR_RESULT.
     """
-    dc_offset = np.mean(samples)
-    samples_without_offset = samples - dc_offset
+    mean: float
+    min: float
+    max: float
+    std: float
+    count: int
 
-    # We are using the amplitude without bases,
-    # of the signal is from the maximum to the minimum
-    amplitude = max(samples_without_offset) - min(samples_without_offset)
+    @classmethod
+    def of(cls, values: np.ndarray) -> 'EdgeStatistics':
+        """
+        Statistics of the values of every cycle.
+        """
+        if len(values) == 0:
+            return cls(ERROR_RESULT, ERROR_RESULT, ERROR_RESULT, ERROR_RESULT, 0)
+        return cls(
+                float(np.mean(values)),
+                float(np.min(values)),
+                float(np.max(values)),
+                float(np.std(values)),
+                len(values))
 
-    # Identify the amplitude value corresponding to the 10% level
-    # of the signal. Find 10% of the  peak amplitude.
-    amplitude_10_percent = (
-            dc_offset
-            + 0.1 * amplitude
-            + min(samples_without_offset)
-    )
 
-    # Identify the index the amplitude value corresponding to the
-    # 90% level of the signal. Find 90%  of the peak amplitude.
-    amplitude_90_percent = (
-            dc_offset
-            + 0.9 * amplitude
-            + min(samples_without_offset)
-    )
+def calculate_edge_statistics(
+        samples: np.ndarray,
+        sampling_rate: float,
+        compute_dtype=None
+) -> Dict[str, EdgeStatistics]:
+    """
+    Calculate the statistics of the rise time, fall time, positive width and
+    negative width over every cycle of the samples (1-D), in 'compute_dtype'
+    (see COMPUTE_DTYPES). Returns a dictionary of function name to
+    EdgeStatistics.
 
-    # Find the index corresponding to the first occurrence of the
-    # amplitude crossing the 90% level (rising edge).
-    latest_over_90 = None
-    next_under_10 = None
-    for position, sample in enumerate(samples):
-        if sample >= amplitude_90_percent:
-            latest_over_90 = position
-        elif latest_over_90 is not None:
-            if sample <= amplitude_10_percent:
-                # We were under 10% in latest_over_90
-                # and now we are over 90%.
-                next_under_10 = position
-                break
+    Unlike calculate_rise_time and the rest, the times are measured between
+    the crossings of the 10%, 50% and 90% levels, linearly interpolated
+    between the samples. The widths are measured at the 50% level.
+    """
+    samples = as_samples(samples, compute_dtype=compute_dtype)
+    amplitude_10_percent, amplitude_90_percent = _samples_edge_levels(samples)
+    amplitude_50_percent = (amplitude_10_percent + amplitude_90_percent) / 2
 
-    if next_under_10 is None or latest_over_90 is None:
-        # Error: no change found
-        return ERROR_RESULT
+    edge_levels = (amplitude_10_percent, amplitude_90_percent)
+    rising_edges = _transitions(samples, edge_levels, True)
+    falling_edges = _transitions(samples, edge_levels, False)
+
+    # Each edge starts in the latest sample beyond the initial level and
+    # stops in the first sample beyond the final level, so the signal
+    # crosses the initial level right after the start and the final level
+    # right before the stop
+    rise_times = (
+        _crossing_positions(
+            samples, rising_edges.stops - 1, amplitude_90_percent)
+        - _crossing_positions(
+            samples, rising_edges.starts, amplitude_10_percent))
+    fall_times = (
+        _crossing_positions(
+            samples, falling_edges.stops - 1, amplitude_10_percent)
+        - _crossing_positions(
+            samples, falling_edges.starts, amplitude_90_percent))
+
+    # The rising and falling edges alternate, so each rising edge is
+    # followed by a falling edge (positive width) and vice versa
+    rising_middles = _middle_crossing_positions(
+                        samples,
+                        rising_edges,
+                        amplitude_50_percent,
+                        rising=True)
+    falling_middles = _middle_crossing_positions(
+                        samples,
+                        falling_edges,
+                        amplitude_50_percent,
+                        rising=False)
 
     sampling_period = 1 / sampling_rate
-    fall_time = (next_under_10 - latest_over_90) * sampling_period
-    return fall_time
+    return {
+        MeasurementFunctions.rise_time:
+            EdgeStatistics.of(rise_times * sampling_period),
+        MeasurementFunctions.fall_time:
+            EdgeStatistics.of(fall_times * sampling_period),
+        MeasurementFunctions.positive_width:
+            EdgeStatistics.of(
+                _widths(rising_middles, falling_middles) * sampling_period),
+        MeasurementFunctions.negative_width:
+            EdgeStatistics.of(
+                _widths(falling_middles, rising_middles) * sampling_period),
+    }
 
 
-def calculate_frequency(samples: np.ndarray, sampling_rate: float) -> float:
+def _crossing_positions(
+        samples: np.ndarray,
+        positions: np.ndarray,
+        level: float
+) -> np.ndarray:
     """
-    Calculate the frequency of the samples using Welch's method:
-
-    https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.welch.html
+    Interpolated position where the samples cross the level between each of
+    the positions and the next sample.
     """
-    frequencies, psd = signal.welch(
-                            samples,
-                            sampling_rate,
-                            nperseg=len(samples))
-    peak_index = np.argmax(psd)
-    return frequencies[peak_index]
+    if _kernel_backend == KernelBackends.numba:
+        return llk.crossing_positions(samples, positions, float(level))
+    before = samples[positions].astype(np.float64)
+    after = samples[positions + 1].astype(np.float64)
+    return positions + (level - before) / (after - before)
 
 
-def calculate_period(samples: np.ndarray, sampling_rate: float) -> float:
+def _middle_crossing_positions(
+        samples: np.ndarray,
+        edges: 'Edges',
+        level: float,
+        rising: bool
+) -> np.ndarray:
     """
-    Calculate the period of the samples (1/frequency).
+    Interpolated position where the samples cross the middle level during
+    each edge (the latest crossing, if the noise makes it cross several
+    times).
     """
-    frequency = calculate_frequency(samples, sampling_rate)
-    return 1 / frequency
+    if rising:
+        crossings = np.flatnonzero(
+                        (samples[:-1] <= level) & (samples[1:] > level))
+    else:
+        crossings = np.flatnonzero(
+                        (samples[:-1] >= level) & (samples[1:] < level))
+    positions = crossings[np.searchsorted(crossings, edges.stops) - 1]
+    return _crossing_positions(samples, positions, level)
 
 
-def calculate_positive_duty_cycle(samples: np.ndarray) -> float:
+def _widths(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
     """
-    Calculate the positive duty cycle (% of samples that are "HIGH").
+    Distance from each start to the next stop, if there is one.
+    """
+    next_stops = np.searchsorted(stops, starts)
+    has_stop = next_stops < len(stops)
+    return stops[next_stops[has_stop]] - starts[has_stop]
 
-    This does not mean positive (as in "more than 5V"), but only that
-    they are on the high side.
+
+class Crossings(NamedTuple):
     """
-    mean = np.mean(samples)
-    positive_samples = np.sum(samples > mean)
+    Crossings of a level, found with hysteresis (see find_crossings): the
+    interpolated position (in samples) of each crossing and whether it is
+    rising.
+    """
+    level: float
+    positions: np.ndarray
+    rising: np.ndarray
 
-    return (positive_samples / len(samples)) * 100
+    def times(self, sampling_rate: float) -> np.ndarray:
+        """
+        Time in seconds of every crossing, since the first sample.
+        """
+        return self.positions / sampling_rate
 
 
-def calculate_positive_width(
+def find_crossings(
         samples: np.ndarray,
-        sampling_rate: float
-) -> float:
+        levels: Iterable[float] = (10.0, 50.0, 90.0),
+        hysteresis: float = 0.0,
+        absolute: bool = False
+) -> List[Crossings]:
     """
-    Calculate the positive width, using the Welch's method as in frequency.
+    Find every crossing of each of the levels (1-D), as a comparator with
+    hysteresis: the signal becomes high after a sample over the level plus
+    half the hysteresis, and low after a sample under the level minus half
+    the hysteresis. Each change is a crossing of the level, at the position
+    (interpolated between the samples) where the signal crossed it for the
+    last time. This way, the noise within the hysteresis band around a
+    level never produces extra crossings.
+
+    The levels and the hysteresis are percentages of the amplitude from the
+    min to the max of the samples, or volts if 'absolute'. Returns the
+    Crossings of each level, in the same order.
     """
-    _, psd = signal.welch(samples, sampling_rate, nperseg=len(samples))
-    peak_index = np.argmax(psd)
+    samples = as_samples(samples)
+    levels = np.array(levels, np.float64)
+    if not absolute:
+        vmin = np.min(samples)
+        amplitude = np.max(samples) - vmin
+        levels = vmin + levels / 100 * amplitude
+        hysteresis = hysteresis / 100 * amplitude
+    return [
+        Crossings(level, positions, rising)
+        for level, (positions, rising) in zip(
+            levels,
+            _level_crossings(samples, levels, hysteresis))
+    ]
+
+
+def _level_crossings(
+        samples: np.ndarray,
+        levels: np.ndarray,
+        hysteresis: float
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Positions and directions of the crossings of each level (in volts) with
+    the hysteresis (in volts), in a single pass if the kernels are used.
+    """
+    levels = np.asarray(levels, np.float64)
+    lowers = levels - hysteresis / 2
+    uppers = levels + hysteresis / 2
+    if _kernel_backend == KernelBackends.numba:
+        level_indexes, positions, rising = llk.level_crossings(
+                                                samples,
+                                                levels,
+                                                lowers,
+                                                uppers)
+        return [
+            (positions[level_indexes == index],
+             rising[level_indexes == index])
+            for index in range(len(levels))
+        ]
+
+    crossings = []
+    for level, lower, upper in zip(levels, lowers, uppers):
+        # One-element arrays, so the samples are compared in float64
+        level, lower, upper = (
+            np.full(1, value) for value in (level, lower, upper))
+        is_over = samples > upper
+        beyond = np.flatnonzero(is_over | (samples < lower))
+        is_high = is_over[beyond]
+        changes = np.flatnonzero(is_high[1:] != is_high[:-1]) + 1
+        stops = beyond[changes]
+        rising = is_high[changes]
+
+        # Latest crossing of the level itself before each change
+        upward = np.flatnonzero((samples[:-1] <= level) & (samples[1:] > level))
+        downward = np.flatnonzero(
+                        (samples[:-1] >= level) & (samples[1:] < level))
+        starts = np.where(
+                    rising,
+                    upward[np.searchsorted(upward, stops) - 1]
+                    if len(upward) else 0,
+                    downward[np.searchsorted(downward, stops) - 1]
+                    if len(downward) else 0)
+        crossings.append(
+            (_crossing_positions(samples, starts, level[0]), rising))
+    return crossings
+
+
+# Measurements that can use the crossings with hysteresis instead of the
+# samples beyond each level
+_HYSTERESIS_FUNCTIONS = frozenset((
+    MeasurementFunctions.rise_time,
+    MeasurementFunctions.fall_time,
+    MeasurementFunctions.positive_duty_cycle,
+    MeasurementFunctions.positive_width,
+    MeasurementFunctions.negative_width,
+))
+
+
+def _hysteresis_crossings(
+        samples: np.ndarray,
+        mean: np.ndarray,
+        vmin: np.ndarray,
+        vmax: np.ndarray,
+        hysteresis: float
+) -> np.ndarray:
+    """
+    Crossings of the 10% level, the 90% level and the average of each
+    capture (in the last axis), with the hysteresis as a percentage of the
+    amplitude from the min to the max. Returns an array of objects with the
+    list of Crossings of each capture.
+    """
+    shape = samples.shape[:-1]
+    amplitude_10_percent, amplitude_90_percent = _edge_levels(mean, vmin, vmax)
+    levels = np.stack(
+                np.broadcast_arrays(
+                    amplitude_10_percent,
+                    amplitude_90_percent,
+                    mean),
+                axis=-1)
+    band = hysteresis / 100 * np.broadcast_to(vmax - vmin, shape)
+
+    crossings = np.empty(shape, object)
+    for index in np.ndindex(*shape):
+        crossings[index] = [
+            Crossings(level, positions, rising)
+            for level, (positions, rising) in zip(
+                levels[index],
+                _level_crossings(samples[index], levels[index], band[index]))
+        ]
+    return crossings
+
+
+def _samples_hysteresis_crossings(
+        samples: np.ndarray,
+        hysteresis: float
+) -> np.ndarray:
+    return _hysteresis_crossings(
+                samples,
+                np.mean(samples, axis=-1, dtype=np.float64),
+                np.min(samples, axis=-1),
+                np.max(samples, axis=-1),
+                hysteresis)
+
+
+def _from_crossings(
+        crossings: np.ndarray,
+        measure: Callable[[List[Crossings]], float]
+) -> np.ndarray:
+    """
+    Measure the crossings of each capture (see _hysteresis_crossings).
+    """
+    results = np.empty(crossings.shape)
+    for index in np.ndindex(*crossings.shape):
+        results[index] = measure(crossings[index])
+    return results[()]
+
+
+def _crossings_edge_time(
+        crossings: List[Crossings],
+        sampling_rate: float,
+        rising: bool
+) -> float:
+    """
+    Time from the latest crossing of the initial level (10% if rising, 90%
+    otherwise) to the first crossing of the final level after it, in the
+    same direction.
+    """
+    crossings_10_percent, crossings_90_percent, _ = crossings
+    if rising:
+        initial, final = crossings_10_percent, crossings_90_percent
+    else:
+        initial, final = crossings_90_percent, crossings_10_percent
+    starts = initial.positions[initial.rising == rising]
+    stops = final.positions[final.rising == rising]
+    if len(starts) == 0:
+        return ERROR_RESULT
+    stops = stops[stops > starts[0]]
+    if len(stops) == 0:
+        return ERROR_RESULT
+    start = starts[np.searchsorted(starts, stops[0]) - 1]
+    return (stops[0] - start) / sampling_rate
+
+
+def _crossings_width(
+        crossings: List[Crossings],
+        sampling_rate: float,
+        positive: bool
+) -> float:
+    """
+    Average time from each crossing of the average to the next one (from a
+    rising one to a falling one if positive, the other way otherwise).
+    """
+    middle = crossings[2]
+    widths = _widths(
+                middle.positions[middle.rising == positive],
+                middle.positions[middle.rising != positive])
+    if len(widths) == 0:
+        return ERROR_RESULT
+    return np.mean(widths) / sampling_rate
+
+
+def _crossings_duty_cycle(crossings: List[Crossings]) -> float:
+    """
+    Percentage of the time over the average, from the first to the last
+    rising crossing of the average.
+    """
+    middle = crossings[2]
+    starts = middle.positions[middle.rising]
+    if len(starts) < 2:
+        return ERROR_RESULT
+    stops = middle.positions[~middle.rising]
+    high = np.sum(_widths(starts[:-1], stops))
+    return high / (starts[-1] - starts[0]) * 100
+
+
+def _crossings_frequency(
+        crossings: List[Crossings],
+        sampling_rate: float
+) -> float:
+    """
+    Frequency from the rising crossings of the average.
+    """
+    middle = crossings[2]
+    starts = middle.positions[middle.rising]
+    if len(starts) < 2:
+        return ERROR_RESULT
+    return (len(starts) - 1) / (starts[-1] - starts[0]) * sampling_rate
+
+
+class Edges(NamedTuple):
+    """
+    Transitions found in a signal. Each transition starts in the latest
+    sample beyond the initial level (e.g., under 10% for rising edges) and
+    stops in the first sample beyond the final level (e.g., over 90%).
+    """
+    starts: np.ndarray
+    stops: np.ndarray
+
+    def durations(self, sampling_rate: float) -> np.ndarray:
+        """
+        Duration in seconds of every transition.
+        """
+        sampling_period = 1 / sampling_rate
+        return (self.stops - self.starts) * sampling_period
+
+
+def find_rising_edges(samples: np.ndarray) -> Edges:
+    """
+    Find every transition from the 10% level to the 90% level (1-D).
+    """
+    return _transitions(samples, _samples_edge_levels(samples), True)
+
+
+def find_falling_edges(samples: np.ndarray) -> Edges:
+    """
+    Find every transition from the 90% level to the 10% level (1-D).
+    """
+    return _transitions(samples, _samples_edge_levels(samples), False)
+
+
+def _samples_edge_levels(samples: np.ndarray) -> Tuple[float, float]:
+    return _edge_levels(
+                np.mean(samples, axis=-1, dtype=np.float64),
+                np.min(samples, axis=-1),
+                np.max(samples, axis=-1))
+
+
+def _edge_levels(
+        dc_offset: float,
+        vmin: float,
+        vmax: float
+) -> Tuple[float, float]:
+    """
+    Return the values of the 10% and 90% levels of the signal.
+    """
+    # We are using the amplitude without bases, of the signal is from the
+    # maximum to the minimum (of the samples without the DC offset)
+    min_without_offset = vmin - dc_offset
+    amplitude = (vmax - dc_offset) - min_without_offset
+
+    # Identify the amplitude value corresponding to the 10% level
+    # of the signal. Find 10% of the  peak amplitude.
+    amplitude_10_percent = dc_offset + 0.1 * amplitude + min_without_offset
+
+    # Identify the amplitude value corresponding to the 90% level
+    # of the signal. Find 90%  of the peak amplitude.
+    amplitude_90_percent = dc_offset + 0.9 * amplitude + min_without_offset
+
+    return amplitude_10_percent, amplitude_90_percent
+
+
+def _rising_edge_masks(
+        samples: np.ndarray,
+        amplitude_10_percent: float,
+        amplitude_90_percent: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    under_10 = samples <= _per_sample(amplitude_10_percent)
+    over_90 = (samples >= _per_sample(amplitude_90_percent)) & ~under_10
+    return under_10, over_90
+
+
+def _falling_edge_masks(
+        samples: np.ndarray,
+        amplitude_10_percent: float,
+        amplitude_90_percent: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    over_90 = samples >= _per_sample(amplitude_90_percent)
+    under_10 = (samples <= _per_sample(amplitude_10_percent)) & ~over_90
+    return over_90, under_10
+
+
+def _find_transitions(initial: np.ndarray, final: np.ndarray) -> Edges:
+    """
+    Given two exclusive masks of the samples beyond the initial and the final
+    levels, find every transition from the first to the second.
+    """
+    # Only the samples beyond any of the levels matter: a transition is a
+    # sample beyond the final level whose previous relevant sample was beyond
+    # the initial level.
+    positions = np.flatnonzero(initial | final)
+    is_final = final[positions]
+    transitions = np.flatnonzero(~is_final[:-1] & is_final[1:])
+    return Edges(positions[transitions], positions[transitions + 1])
+
+
+def _edge_masks(
+        samples: np.ndarray,
+        edge_levels: Tuple[float, float],
+        rising: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    if rising:
+        return _rising_edge_masks(samples, *edge_levels)
+    return _falling_edge_masks(samples, *edge_levels)
+
+
+def _transitions(
+        samples: np.ndarray,
+        edge_levels: Tuple[float, float],
+        rising: bool
+) -> Edges:
+    """
+    Find every rising or falling transition between the edge levels (1-D).
+    """
+    if _kernel_backend == KernelBackends.numba:
+        amplitude_10_percent, amplitude_90_percent = edge_levels
+        return Edges(*llk.transitions(
+                            np.asarray(samples),
+                            float(amplitude_10_percent),
+                            float(amplitude_90_percent),
+                            rising))
+    return _find_transitions(*_edge_masks(samples, edge_levels, rising))
+
+
+def _first_edge_time(
+        samples: np.ndarray,
+        edge_levels: Tuple[float, float],
+        rising: bool,
+        sampling_rate: float
+) -> float:
+    """
+    Return the duration of the first rising or falling transition between
+    the edge levels of each capture (or ERROR_RESULT if there is none).
+    """
+    sampling_period = 1 / sampling_rate
+    if _kernel_backend == KernelBackends.numba:
+        starts, stops = _per_capture(
+                            lambda *arguments: llk.first_transition(
+                                                    *arguments, rising),
+                            samples,
+                            *edge_levels)
+        edge_times = (stops - starts) * sampling_period
+        return np.where(stops >= 0, edge_times, ERROR_RESULT)[()]
+
+    initial, final = _edge_masks(samples, edge_levels, rising)
+    positions = np.arange(initial.shape[-1])
+
+    # The first transition stops in the first sample beyond the final level
+    # after any sample beyond the initial level...
+    first_initial = np.argmax(initial, axis=-1)
+    final_after_initial = final & (positions > _per_sample(first_initial))
+    stops = np.argmax(final_after_initial, axis=-1)
+    found = np.take_along_axis(
+                    final_after_initial,
+                    _per_sample(stops),
+                    axis=-1)[..., 0]
+
+    # ... and starts in the latest sample beyond the initial level before it
+    starts = np.max(
+                np.where(
+                    initial & (positions < _per_sample(stops)),
+                    positions,
+                    -1),
+                axis=-1)
+
+    # Calculate the time by subtracting the time corresponding to the
+    # initial level from the time corresponding to the final level.
+    # This can be done by multiplying the index difference by the
+    # sampling period.
+    edge_times = (stops - starts) * sampling_period
+
+    # Error (ERROR_RESULT) if no change found
+    return np.where(found, edge_times, ERROR_RESULT)[()]
+
+
+class KernelBackends:  # pylint: disable=too-few-public-methods
+    """
+    Backends of the loops over the samples: the search of the edges, the
+    crossings of the levels and the samples over or under the average
+    """
+    # Numba if it is installed, NumPy otherwise
+    auto = 'auto'
+    # Vectorized, with temporary masks
+    numpy = 'numpy'
+    # Compiled (see ll_oscilloscope_kernels), a single pass per capture
+    numba = 'numba'
+
+
+_kernel_backend = KernelBackends.numba if llk.HAS_NUMBA \
+    else KernelBackends.numpy
+
+
+def set_kernel_backend(backend: str = KernelBackends.auto):
+    """
+    Choose the backend of the loops over the samples (one of
+    KernelBackends). Both backends give the same results.
+    """
+    global _kernel_backend  # pylint: disable=global-statement
+    if backend == KernelBackends.auto:
+        backend = KernelBackends.numba if llk.HAS_NUMBA \
+            else KernelBackends.numpy
+    elif backend == KernelBackends.numba and not llk.HAS_NUMBA:
+        raise ValueError("The numba backend requires Numba")
+    elif backend not in (KernelBackends.numpy, KernelBackends.numba):
+        raise ValueError(f"Unknown kernel backend: {backend}")
+    _kernel_backend = backend
+
+
+def _per_capture(kernel: Callable, samples: np.ndarray, *levels) -> Tuple:
+    """
+    Call the kernel with the samples (in the last axis) and the levels of
+    each capture. Return an array per value returned by the kernel.
+    """
+    shape = samples.shape[:-1]
+    levels = [np.broadcast_to(level, shape) for level in levels]
+    results = [
+        kernel(samples[index], *(float(level[index]) for level in levels))
+        for index in np.ndindex(*shape)
+    ]
+    return tuple(
+        np.array(values).reshape(shape)[()]
+        for values in zip(*results)
+    )
+
+
+def _count_over(samples: np.ndarray, level: np.ndarray) -> np.ndarray:
+    """
+    Number of samples of each capture over its level.
+    """
+    if _kernel_backend == KernelBackends.numba:
+        counts, = _per_capture(
+                        lambda *arguments: (llk.count_over(*arguments),),
+                        samples,
+                        level)
+        return counts
+    return np.sum(samples > _per_sample(level), axis=-1)
+
+
+def _count_under(samples: np.ndarray, level: np.ndarray) -> np.ndarray:
+    """
+    Number of samples of each capture under its level.
+    """
+    if _kernel_backend == KernelBackends.numba:
+        counts, = _per_capture(
+                        lambda *arguments: (llk.count_under(*arguments),),
+                        samples,
+                        level)
+        return counts
+    return np.sum(samples < _per_sample(level), axis=-1)
+
+
+class SpectrumCache:
+    """
+    Least recently used cache of the spectrums calculated by the spectral
+    measurements (frequency, period, positive and negative widths and phase
+    delay), so asking for several of them on the same samples only
+    calculates the spectrum once.
+
+    The key of each spectrum is the kind of spectrum, the sampling rate and
+    the samples: their shape and type, and a hash of their content (so the
+    same samples are found even in different arrays, e.g., after converting
+    the same list again, and modified arrays are never confused).
+
+    At most 'maxsize' spectrums are kept (0 to disable the cache), taking
+    at most 'maxbytes' bytes (larger spectrums are not kept). The hits and
+    misses are counted to check how useful the cache is.
+    """
+
+    def __init__(self, maxsize: int = 16, maxbytes: int = 32 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._spectrums = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(
+            self,
+            kind: str,
+            samples: np.ndarray,
+            sampling_rate: Optional[float],
+            calculate: Callable
+    ):
+        """
+        Return the spectrum of 'kind' of the samples, calling 'calculate' if
+        it was not in the cache.
+        """
+        if self.maxsize <= 0 or self.maxbytes <= 0:
+            return calculate()
+
+        key = (kind, sampling_rate) + samples_key(samples)
+        with self._lock:
+            if key in self._spectrums:
+                self.hits += 1
+                self._spectrums.move_to_end(key)
+                return self._spectrums[key][0]
+            self.misses += 1
+
+        spectrum = calculate()
+        arrays = spectrum if isinstance(spectrum, tuple) else (spectrum,)
+        for array in arrays:
+            # The same arrays are returned every time
+            array.flags.writeable = False
+        size = sum(array.nbytes for array in arrays)
+        if size > self.maxbytes:
+            return spectrum
+
+        with self._lock:
+            if key in self._spectrums:
+                self._bytes -= self._spectrums[key][1]
+            self._spectrums[key] = spectrum, size
+            self._bytes += size
+            while len(self._spectrums) > self.maxsize \
+                    or self._bytes > self.maxbytes:
+                _, (_, evicted_size) = self._spectrums.popitem(last=False)
+                self._bytes -= evicted_size
+        return spectrum
+
+    def clear(self):
+        """
+        Remove every spectrum and reset the counters.
+        """
+        with self._lock:
+            self._spectrums.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict[str, int]:
+        """
+        Counters of the cache.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._spectrums),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'maxbytes': self.maxbytes,
+            }
+
+
+# Number of samples of a non-contiguous array copied at once to hash them
+_HASH_BLOCK_SAMPLES = 1 << 16
+
+
+def samples_key(samples: np.ndarray) -> Tuple:
+    """
+    Identify some samples by their shape, type and a hash of their content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    _hash_samples(digest, samples)
+    return samples.shape, samples.dtype.str, digest.digest()
+
+
+def _hash_samples(digest, samples: np.ndarray):
+    """
+    Hash the samples in C order, directly from their memory if it is
+    contiguous, or in copies of at most _HASH_BLOCK_SAMPLES samples
+    otherwise (e.g., a column of a capture or a row of a batch along
+    another axis), so the key is the same for any layout.
+    """
+    if samples.flags.c_contiguous:
+        digest.update(memoryview(samples))
+    elif samples.size <= _HASH_BLOCK_SAMPLES:
+        digest.update(np.ascontiguousarray(samples))
+    elif samples[0].size > _HASH_BLOCK_SAMPLES:
+        for row in samples:
+            _hash_samples(digest, row)
+    else:
+        rows = _HASH_BLOCK_SAMPLES // samples[0].size
+        for start in range(0, len(samples), rows):
+            digest.update(np.ascontiguousarray(samples[start:start + rows]))
+
+
+spectrum_cache = SpectrumCache()
+
+
+# Change it when the results of any measurement change, so the results
+# stored on disk by a previous version are not used
+_RESULT_CACHE_VERSION = 1
+
+# When the results on disk exceed max_disk_bytes, the least recently used
+# ones are removed until they take this fraction of it, so the next results
+# can be stored without removing any
+_RESULT_CACHE_LOW_WATER = 0.9
+
+# Number of results read at once to choose the ones to remove
+_RESULT_CACHE_EVICTION_BATCH = 256
+
+
+class ResultCache:
+    """
+    Cache of the results of the measurements, so the same measurements of
+    the same samples (e.g., stored captures requested again and again) are
+    only calculated once.
+
+    The results are kept in memory (the 'maxsize' most recently used ones)
+    and, if 'path' is provided, in a SQLite database, which keeps the most
+    recently used results up to 'max_disk_bytes' and can be shared by
+    several processes.
+
+    The key of each result is a blake2b hash of the function, the sampling
+    rate, the axis, the compute dtype and the samples of both channels (see
+    samples_key).
+    """
+
+    def __init__(
+            self,
+            maxsize: int = 1024,
+            path: Optional[str] = None,
+            max_disk_bytes: int = 64 * 1024 * 1024
+    ):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._connection = None
+        self._disk_bytes = 0
+        if path is not None:
+            self._connection = sqlite3.connect(
+                                    path,
+                                    check_same_thread=False,
+                                    isolation_level=None)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key BLOB PRIMARY KEY, value BLOB NOT NULL, '
+                'accessed REAL NOT NULL)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_accessed '
+                'ON results (accessed)')
+            self._disk_bytes = self._stored_bytes()
+
+    def keys(
+            self,
+            functions: Iterable[str],
+            samples: np.ndarray,
+            sampling_rate: Optional[float] = None,
+            other_channel_samples: Optional[List[float]] = None,
+            axis: int = -1,
+            hysteresis: Optional[float] = None,
+            compute_dtype=None
+    ) -> Dict[str, bytes]:
+        """
+        Return the key of the result of each function (hashing the samples,
+        in 'compute_dtype', only once). The other channel is only part of
+        the key of the phase delay, the only measurement using it, and the
+        hysteresis of the measurements using it.
+        """
+        compute_dtype = _compute_dtype(compute_dtype)
+        # The same key for 25000, 25000.0 and np.float64(25000.0)
+        if sampling_rate is not None:
+            sampling_rate = float(sampling_rate)
+        if hysteresis is not None:
+            hysteresis = float(hysteresis)
+        identity = (
+            _RESULT_CACHE_VERSION,
+            sampling_rate,
+            int(axis),
+            compute_dtype.str,
+            samples_key(as_samples(samples, compute_dtype=compute_dtype)),
+        )
+        other_channel = None
+        if other_channel_samples is not None:
+            other_channel = samples_key(as_samples(
+                                other_channel_samples,
+                                compute_dtype=compute_dtype))
+
+        keys = {}
+        for function in functions:
+            function_identity = (function,) + identity
+            if function == MeasurementFunctions.phase_delay:
+                function_identity += (other_channel,)
+            if hysteresis is not None and function in _HYSTERESIS_FUNCTIONS:
+                function_identity += (('hysteresis', hysteresis),)
+            keys[function] = hashlib.blake2b(
+                                repr(function_identity).encode('utf-8'),
+                                digest_size=16).digest()
+        return keys
+
+    def get(self, key: bytes):
+        """
+        Return the result with that key, or None if it is not in the cache.
+        """
+        with self._lock:
+            if key in self._results:
+                self.memory_hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+
+            value = self._read(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+            return value
+
+    def put(self, key: bytes, value):
+        """
+        Store the result with that key.
+        """
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        with self._lock:
+            self._remember(key, value)
+            self._write(key, value)
+
+    def measurement(
+            self,
+            function: str,
+            samples: np.ndarray,
+            sampling_rate: Optional[float] = None,
+            other_channel_samples: Optional[List[float]] = None,
+            axis: int = -1,
+            hysteresis: Optional[float] = None,
+            compute_dtype=None
+    ):
+        """
+        Same as calculate_oscilloscope_measurement, using the cache.
+        """
+        return self.measurements(
+                    [function],
+                    samples,
+                    sampling_rate,
+                    other_channel_samples,
+                    axis,
+                    hysteresis,
+                    compute_dtype)[function]
+
+    def measurements(
+            self,
+            functions: Iterable[str],
+            samples: np.ndarray,
+            sampling_rate: Optional[float] = None,
+            other_channel_samples: Optional[List[float]] = None,
+            axis: int = -1,
+            hysteresis: Optional[float] = None,
+            compute_dtype=None
+    ) -> Dict[str, float]:
+        """
+        Same as calculate_oscilloscope_measurements, using the cache. Only
+        the measurements not in the cache are calculated.
+        """
+        functions = list(functions)
+        keys = self.keys(
+                    functions,
+                    samples,
+                    sampling_rate,
+                    other_channel_samples,
+                    axis,
+                    hysteresis,
+                    compute_dtype)
+        results = {function: self.get(keys[function]) for function in keys}
+        missing = [
+            function for function, result in results.items() if result is None
+        ]
+        if missing:
+            calculated = MeasurementPlan(
+                            missing,
+                            sampling_rate,
+                            compute_dtype,
+                            hysteresis).run(
+                                samples,
+                                other_channel_samples,
+                                axis=axis)
+            for function, result in calculated.items():
+                self.put(keys[function], result)
+            results.update(calculated)
+        return {function: results[function] for function in functions}
+
+    def info(self) -> Dict[str, float]:
+        """
+        Counters of the cache.
+        """
+        with self._lock:
+            requests = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (
+                    (self.memory_hits + self.disk_hits) / requests
+                    if requests else 0.0),
+                'size': len(self._results),
+                'maxsize': self.maxsize,
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+            }
+
+    def clear(self):
+        """
+        Remove every result (also from disk) and reset the counters.
+        """
+        with self._lock:
+            self._results.clear()
+            if self._connection is not None:
+                self._connection.execute('DELETE FROM results')
+                self._disk_bytes = 0
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def close(self):
+        """
+        Close the database, if any.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _remember(self, key: bytes, value):
+        if self.maxsize <= 0:
+            return
+        self._results[key] = value
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def _read(self, key: bytes):
+        if self._connection is None:
+            return None
+        row = self._connection.execute(
+                    'SELECT value FROM results WHERE key = ?',
+                    (key,)).fetchone()
+        if row is None:
+            return None
+        self._connection.execute(
+            'UPDATE results SET accessed = ? WHERE key = ?',
+            (time.time(), key))
+        # 0-d arrays are returned as NumPy scalars
+        return np.load(io.BytesIO(row[0]), allow_pickle=False)[()]
+
+    def _write(self, key: bytes, value):
+        if self._connection is None:
+            return
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(value), allow_pickle=False)
+        # A result stored again replaces the previous one
+        replaced = self._connection.execute(
+                        'SELECT LENGTH(key) + LENGTH(value) FROM results '
+                        'WHERE key = ?',
+                        (key,)).fetchone()
+        self._connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+            (key, buffer.getvalue(), time.time()))
+        self._disk_bytes += len(key) + len(buffer.getvalue())
+        if replaced is not None:
+            self._disk_bytes -= replaced[0]
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict()
+
+    def _stored_bytes(self) -> int:
+        return self._connection.execute(
+                    'SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0) '
+                    'FROM results').fetchone()[0]
+
+    def _evict(self):
+        """
+        Remove the least recently used results until they take
+        _RESULT_CACHE_LOW_WATER of max_disk_bytes (other processes may be
+        using the database, so the size is checked again).
+        """
+        self._disk_bytes = self._stored_bytes()
+        excess = self._disk_bytes \
+            - int(self.max_disk_bytes * _RESULT_CACHE_LOW_WATER)
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+
+        self._connection.execute('BEGIN')
+        try:
+            while excess > 0:
+                rows = self._connection.execute(
+                            'SELECT key, LENGTH(key) + LENGTH(value) '
+                            'FROM results ORDER BY accessed LIMIT ?',
+                            (_RESULT_CACHE_EVICTION_BATCH,)).fetchall()
+                if not rows:
+                    break
+                evicted = []
+                for key, size in rows:
+                    if excess <= 0:
+                        break
+                    evicted.append((key,))
+                    excess -= size
+                    self._disk_bytes -= size
+                self._connection.executemany(
+                    'DELETE FROM results WHERE key = ?',
+                    evicted)
+        finally:
+            self._connection.execute('COMMIT')
+
+
+class FrequencyMethods:  # pylint: disable=too-few-public-methods
+    """
+    Methods to estimate the frequency of a signal
+    """
+    # Peak of the Welch's power spectral density. The resolution is one
+    # bin (sampling_rate / number of samples).
+    welch = 'welch'
+    # Time between the first and the last time the signal crosses its mean
+    # upwards, interpolating linearly between samples. Cheapest (O(n)) and
+    # very accurate with clean signals, but not with noisy ones.
+    zero_crossing = 'zero_crossing'
+    # Peak of the spectrum (with a Hann window), interpolated with a
+    # parabola between the bins around it for sub-bin accuracy.
+    rfft = 'rfft'
+    # First peak of the autocorrelation, interpolated with a parabola.
+    autocorrelation = 'autocorrelation'
+    # zero_crossing when the signal crosses its mean regularly (not noisy),
+    # rfft otherwise.
+    auto = 'auto'
+
+
+def calculate_frequency(
+        samples: np.ndarray,
+        sampling_rate: float,
+        axis: int = -1,
+        method: str = FrequencyMethods.welch,
+        hysteresis: Optional[float] = None
+) -> float:
+    """
+    Calculate the frequency of the samples using Welch's method:
+
+    https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.welch.html
+
+    or any other of FrequencyMethods.
+
+    The zero_crossing method uses the crossings of the average with
+    'hysteresis' (a percentage of the amplitude, see find_crossings) if it
+    is provided. The rest of methods are not affected by the noise around
+    the average, so they do not use it.
+    """
+    samples = np.moveaxis(samples, axis, -1)
+    if method == FrequencyMethods.zero_crossing and hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    lambda crossings: _crossings_frequency(
+                                        crossings,
+                                        sampling_rate))
+    if method == FrequencyMethods.welch:
+        frequencies, peak_index = _welch_peak(samples, sampling_rate)
+        return frequencies[peak_index]
+
+    if method == FrequencyMethods.zero_crossing:
+        frequency, _ = _zero_crossing_frequency(samples, sampling_rate)
+        return frequency
+
+    if method == FrequencyMethods.rfft:
+        return _rfft_frequency(samples, sampling_rate)
+
+    if method == FrequencyMethods.autocorrelation:
+        return _autocorrelation_frequency(samples, sampling_rate)
+
+    if method == FrequencyMethods.auto:
+        frequency, regular = _zero_crossing_frequency(samples, sampling_rate)
+        if np.all(regular):
+            return frequency
+        return np.where(
+                    regular,
+                    frequency,
+                    _rfft_frequency(samples, sampling_rate))[()]
+
+    raise ValueError(f"Unknown frequency method: {method}")
+
+
+def _welch_peak(
+        samples: np.ndarray,
+        sampling_rate: float
+) -> Tuple[np.ndarray, int]:
+    """
+    Return the frequencies of the Welch's method and the index of the peak of
+    the power spectral density (along the last axis), always calculated in
+    float64.
+    """
+    frequencies, psd = spectrum_cache.get(
+                            'welch',
+                            samples,
+                            sampling_rate,
+                            lambda: signal.welch(
+                                np.asarray(samples, np.float64),
+                                sampling_rate,
+                                nperseg=samples.shape[-1],
+                                axis=-1))
+    peak_index = np.argmax(psd, axis=-1)
+    return frequencies, peak_index
+
+
+def _zero_crossing_frequency(
+        samples: np.ndarray,
+        sampling_rate: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimate the frequency from the upward crossings of the mean (along the
+    last axis). Also return whether the crossings are regular: if the signal
+    is noisy around the mean, it crosses it several times in a row, and some
+    crossings are much closer than the rest.
+    """
+    length = samples.shape[-1]
+    frames = samples.reshape(-1, length)
+    centered = frames - np.mean(frames, axis=-1, keepdims=True)
+
+    # An upward crossing is between a sample under the mean and the next one
+    crossings = (centered[:, :-1] < 0) & (centered[:, 1:] >= 0)
+    counts = np.sum(crossings, axis=-1)
+    first = np.argmax(crossings, axis=-1)
+    last = length - 2 - np.argmax(crossings[:, ::-1], axis=-1)
+
+    def interpolated_position(position):
+        before = np.take_along_axis(centered, position[:, None], -1)[:, 0]
+        after = np.take_along_axis(centered, position[:, None] + 1, -1)[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return position + (-before) / (after - before)
+
+    found = counts >= 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_interval = (
+            (interpolated_position(last) - interpolated_position(first))
+            / (counts - 1))
+        frequency = np.where(
+                        found,
+                        sampling_rate / mean_interval,
+                        ERROR_RESULT)
+
+    # The crossings are regular if none of them is too close to the previous
+    rows, positions = np.nonzero(crossings)
+    same_row = rows[1:] == rows[:-1]
+    min_interval = np.full(len(frames), np.inf)
+    np.minimum.at(
+        min_interval,
+        rows[1:][same_row],
+        np.diff(positions)[same_row])
+    regular = found & (min_interval >= 0.5 * mean_interval)
+
+    shape = samples.shape[:-1]
+    return frequency.reshape(shape)[()], regular.reshape(shape)[()]
+
+
+def _parabolic_peak_offset(
+        before: np.ndarray,
+        peak: np.ndarray,
+        after: np.ndarray
+) -> np.ndarray:
+    """
+    Offset (between -0.5 and 0.5) of the vertex of the parabola that goes
+    through three equally spaced points around a peak.
+    """
+    denominator = before - 2 * peak + after
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = 0.5 * (before - after) / denominator
+    return np.clip(np.nan_to_num(offset), -0.5, 0.5)
+
+
+def _values_around(values: np.ndarray, position: np.ndarray) -> Tuple:
+    """
+    Values in position - 1, position and position + 1 (along the last axis),
+    repeating the one in the border if needed.
+    """
+    last = values.shape[-1] - 1
+    return tuple(
+        np.take_along_axis(
+            values,
+            _per_sample(np.clip(position + shift, 0, last)),
+            axis=-1)[..., 0]
+        for shift in (-1, 0, 1))
+
+
+def _rfft_frequency(samples: np.ndarray, sampling_rate: float) -> float:
+    """
+    Estimate the frequency from the peak of the spectrum (along the last
+    axis), with parabolic interpolation between bins.
+    """
+    spectrum = spectrum_cache.get(
+                    'rfft',
+                    samples,
+                    None,
+                    lambda: _rfft_spectrum(samples))
+    return _rfft_peak_frequency(spectrum, samples.shape[-1], sampling_rate)
+
+
+def _rfft_spectrum(samples: np.ndarray) -> np.ndarray:
+    """
+    Magnitude of the spectrum of the samples (along the last axis), without
+    the DC component and with a Hann window.
+    """
+    centered = samples - np.mean(samples, axis=-1, keepdims=True)
+    # Without a rounding error of the mean of a constant signal, its
+    # spectrum is 0
+    centered = np.where(
+                    _per_sample(np.ptp(samples, axis=-1) == 0),
+                    0,
+                    centered)
+    return np.abs(sp_fft.rfft(
+                    centered * np.hanning(samples.shape[-1]),
+                    axis=-1))
+
+
+def _rfft_peak_frequency(
+        spectrum: np.ndarray,
+        length: int,
+        sampling_rate: float
+) -> float:
+    """
+    Frequency of the peak of the spectrum of 'length' samples (see
+    _rfft_spectrum), or ERROR_RESULT if there is no peak (a constant
+    signal).
+    """
+    # The DC component was removed
+    peak_index = np.argmax(spectrum[..., 1:], axis=-1) + 1
+    # With a Hann window, the interpolation is more accurate with the
+    # logarithm of the magnitude
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = _parabolic_peak_offset(
+                    *np.log(_values_around(spectrum, peak_index)))
+    frequency = (peak_index + offset) * sampling_rate / length
+    has_peak = np.max(spectrum[..., 1:], axis=-1) > 0
+    return np.where(has_peak, frequency, ERROR_RESULT)[()]
+
+
+def _autocorrelation_frequency(
+        samples: np.ndarray,
+        sampling_rate: float
+) -> float:
+    """
+    Estimate the frequency from the first peak of the autocorrelation (along
+    the last axis): after it gets negative for the first time, the first
+    peak that is close (90%) to the highest one. Later peaks can be a bit
+    higher than the first one (e.g., when the period is not a whole number
+    of samples), but they are multiples of the period.
+    """
+    length = samples.shape[-1]
+    centered = samples - np.mean(samples, axis=-1, keepdims=True)
+    fft_length = sp_fft.next_fast_len(2 * length - 1, real=True)
+    power = spectrum_cache.get(
+                'power',
+                samples,
+                None,
+                lambda: np.abs(sp_fft.rfft(centered, fft_length, axis=-1)) ** 2)
+    autocorrelation = sp_fft.irfft(power, fft_length, axis=-1)[..., :length]
+
+    positions = np.arange(length)
+    first_negative = np.argmax(autocorrelation < 0, axis=-1)
+    after_first_negative = np.where(
+                                positions >= _per_sample(first_negative),
+                                autocorrelation,
+                                -np.inf)
+    near_highest = after_first_negative >= _per_sample(
+                        0.9 * np.max(after_first_negative, axis=-1))
+    first_near_highest = np.argmax(near_highest, axis=-1)
+    # The first peak is the highest value of the first group of values close
+    # to the highest one
+    first_group_end = np.argmax(
+                        ~near_highest
+                        & (positions > _per_sample(first_near_highest)),
+                        axis=-1)
+    first_group_end = np.where(
+                        first_group_end == 0,
+                        length,
+                        first_group_end)
+    peak_index = np.argmax(
+                    np.where(
+                        (positions >= _per_sample(first_near_highest))
+                        & (positions < _per_sample(first_group_end)),
+                        autocorrelation,
+                        -np.inf),
+                    axis=-1)
+    offset = _parabolic_peak_offset(
+                *_values_around(autocorrelation, peak_index))
+    found = (first_negative > 0) & (peak_index > 0)
+    with np.errstate(divide='ignore'):
+        return np.where(
+                    found,
+                    sampling_rate / (peak_index + offset),
+                    ERROR_RESULT)[()]
+
+
+def calculate_period(
+        samples: np.ndarray,
+        sampling_rate: float,
+        axis: int = -1,
+        method: str = FrequencyMethods.welch,
+        hysteresis: Optional[float] = None
+) -> float:
+    """
+    Calculate the period of the samples (1/frequency).
+    """
+    frequency = calculate_frequency(
+                    samples,
+                    sampling_rate,
+                    axis=axis,
+                    method=method,
+                    hysteresis=hysteresis)
+    return 1 / frequency
+
+
+def calculate_positive_duty_cycle(
+        samples: np.ndarray,
+        axis: int = -1,
+        hysteresis: Optional[float] = None
+) -> float:
+    """
+    Calculate the positive duty cycle (% of samples that are "HIGH").
+
+    This does not mean positive (as in "more than 5V"), but only that
+    they are on the high side.
+
+    If 'hysteresis' is provided (a percentage of the amplitude), it is the
+    % of time between the crossings of the average with that hysteresis
+    (see find_crossings) that the signal is high, over complete periods.
+    """
+    samples = np.moveaxis(samples, axis, -1)
+    if hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    _crossings_duty_cycle)
+    mean = np.mean(samples, axis=-1, dtype=np.float64)
+    positive_samples = _count_over(samples, mean)
+
+    return (positive_samples / samples.shape[-1]) * 100
+
+
+def calculate_positive_width(
+        samples: np.ndarray,
+        sampling_rate: float,
+        axis: int = -1,
+        hysteresis: Optional[float] = None
+) -> float:
+    """
+    Calculate the positive width, using the Welch's method as in frequency.
+
+    If 'hysteresis' is provided (a percentage of the amplitude), it is the
+    average time between the crossings of the average with that hysteresis
+    (see find_crossings) instead.
+    """
+    samples = np.moveaxis(samples, axis, -1)
+    if hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    lambda crossings: _crossings_width(
+                                        crossings,
+                                        sampling_rate,
+                                        True))
+    _, peak_index = _welch_peak(samples, sampling_rate)
 
     # peak_index now is how many periods are there in
     # the 20ms (or whatever 10 x 1/ sampling_rate is)
     # that we have. 1 KHz will get us peak_index=20
 
     # time that the signal is "HIGH" in a period
-    mean = np.mean(samples)
-    positive_samples = np.sum(samples > mean)
+    mean = np.mean(samples, axis=-1, dtype=np.float64)
+    positive_samples = _count_over(samples, mean)
 
     return positive_samples / peak_index / sampling_rate
 
 
 def calculate_negative_width(
         samples: np.ndarray,
-        sampling_rate: float
+        sampling_rate: float,
+        axis: int = -1,
+        hysteresis: Optional[float] = None
 ) -> float:
     """
     Calculate the negative width, using the Welch's method as in frequency.
+
+    If 'hysteresis' is provided (a percentage of the amplitude), it is the
+    average time between the crossings of the average with that hysteresis
+    (see find_crossings) instead.
     """
-    _, psd = signal.welch(samples, sampling_rate, nperseg=len(samples))
-    peak_index = np.argmax(psd)
+    samples = np.moveaxis(samples, axis, -1)
+    if hysteresis is not None:
+        return _from_crossings(
+                    _samples_hysteresis_crossings(samples, hysteresis),
+                    lambda crossings: _crossings_width(
+                                        crossings,
+                                        sampling_rate,
+                                        False))
+    _, peak_index = _welch_peak(samples, sampling_rate)
 
     # peak_index now is how many periods are there in
     # the 20ms (or whatever 10 x 1/ sampling_rate is)
     # that we have. 1 KHz will get us peak_index=20
 
     # time that the signal is "HIGH" in a period
-    mean = np.mean(samples)
-    negative_samples = np.sum(samples < mean)
+    mean = np.mean(samples, axis=-1, dtype=np.float64)
+    negative_samples = _count_under(samples, mean)
 
     return negative_samples / peak_index / sampling_rate
 
 
+class CorrelationMethods:  # pylint: disable=too-few-public-methods
+    """
+    Methods to calculate the cross-correlation of the phase delay
+    """
+    # Choose the fastest one depending on the number of samples
+    auto = 'auto'
+    # Time domain, O(n * m)
+    direct = 'direct'
+    # Frequency domain, O(n log n)
+    fft = 'fft'
+
+
 def calculate_phase_delay(
         samples: np.ndarray,
         sampling_rate: float,
-        other_channel_samples: List[float]
+        other_channel_samples: List[float],
+        axis: int = -1,
+        method: str = CorrelationMethods.auto,
+        max_delay_periods: Optional[float] = None
 ) -> float:
     """
     Calculate the phase delay between two signals.
+
+    The delay is the maximum of the cross-correlation of both signals,
+    calculated with 'method' (one of CorrelationMethods). If
+    'max_delay_periods' is provided, only the delays up to that number of
+    periods (in both directions) are considered (e.g., 1 to only consider
+    the delays within one period).
+    """
+    samples = np.moveaxis(samples, axis, -1)
+    # Both channels in float32 if the samples are (see COMPUTE_DTYPES)
+    other_channel_samples = np.moveaxis(
+                                np.asarray(
+                                    other_channel_samples,
+                                    np.result_type(samples, np.float32)),
+                                axis,
+                                -1)
+    signal_frequency = calculate_frequency(samples, sampling_rate)
+
+    max_delay = None
+    if max_delay_periods is not None:
+        max_delay = _max_delay(
+                        max_delay_periods,
+                        sampling_rate,
+                        signal_frequency)
+
+    phase_delay_samples = _phase_delay_in_samples(
+                                samples,
+                                other_channel_samples,
+                                method,
+                                max_delay)
+    return _phase_delay_to_degrees(
+                phase_delay_samples,
+                sampling_rate,
+                signal_frequency)
+
+
+def calculate_phase_delay_matrix(
+        channels: np.ndarray,
+        sampling_rate: float,
+        reference: int = 0,
+        max_delay_periods: Optional[float] = None
+) -> np.ndarray:
+    """
+    Calculate the phase delay between every pair of channels (a sequence of
+    channels of the same length, or a (n_channels, n_samples) array).
+
+    Element [i, j] is the phase delay of channel i with respect to channel j
+    (as calculate_phase_delay(channels[i], sampling_rate, channels[j])),
+    so row 'reference' has the delays of every channel with respect to the
+    reference one. The frequency is only calculated for the reference
+    channel, and the cross-correlations are calculated from a single rfft
+    per channel.
     """
+    channels = as_samples(channels)
+    if channels.ndim != 2:
+        raise ValueError(
+            f"Expected (n_channels, n_samples) samples, got {channels.shape}")
+    n_channels, length = channels.shape
+    if not -n_channels <= reference < n_channels:
+        raise ValueError(
+            f"Reference {reference} out of {n_channels} channels")
+    signal_frequency = calculate_frequency(channels[reference], sampling_rate)
+
+    delays = np.arange(length - 1, -length, -1)
+    in_range = None
+    if max_delay_periods is not None:
+        max_delay = _max_delay(
+                        max_delay_periods,
+                        sampling_rate,
+                        signal_frequency)
+        in_range = np.abs(delays) <= np.floor(max_delay)
+
+    fft_length = sp_fft.next_fast_len(2 * length - 1, real=True)
+    spectra = sp_fft.rfft(channels, fft_length, axis=-1)
+
+    phase_delay_samples = np.empty((n_channels, n_channels), delays.dtype)
+    for index in range(n_channels):
+        # Channel 'index' against every channel at once
+        cross_correlation = _cross_correlation_from_spectra(
+                                spectra[index],
+                                spectra,
+                                fft_length,
+                                length,
+                                length)
+        if in_range is not None:
+            cross_correlation = np.where(in_range, cross_correlation, -np.inf)
+        phase_delay_samples[index] = delays[_fft_cross_correlation_argmax(
+                                                cross_correlation,
+                                                channels[index],
+                                                channels)]
+
+    return _phase_delay_to_degrees(
+                phase_delay_samples,
+                sampling_rate,
+                signal_frequency)
+
+
+def _max_delay(
+        max_delay_periods: float,
+        sampling_rate: float,
+        signal_frequency
+):
+    """
+    Number of samples in 'max_delay_periods' periods of the signal, or
+    infinite (no limit) if the frequency could not be measured (e.g., a DC
+    signal).
+    """
+    signal_frequency = np.asarray(signal_frequency, np.float64)
+    measured = np.isfinite(signal_frequency) & (signal_frequency > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_delay = max_delay_periods * sampling_rate / signal_frequency
+    max_delay = np.where(measured, max_delay, np.inf)
+    if max_delay.ndim == 0:
+        return float(max_delay)
+    return max_delay
+
+
+def _phase_delay_in_samples(
+        samples: np.ndarray,
+        other_channel_samples: np.ndarray,
+        method: str = CorrelationMethods.auto,
+        max_delay: Optional[float] = None
+) -> int:
+    """
+    Calculate the delay between two signals (along the last axis) in terms of
+    sample shifts, optionally only up to 'max_delay' samples.
+    """
+    length = samples.shape[-1]
+    other_length = other_channel_samples.shape[-1]
+
+    # Position i of the full cross-correlation is a delay of
+    # length - i - 1 samples
+    delays = length - 1 - np.arange(length + other_length - 1)
+
+    if max_delay is not None and np.ndim(max_delay) == 0 \
+            and np.isfinite(max_delay):
+        # Only the positions of the delays in [-max_delay, max_delay]
+        first = max(length - 1 - int(np.floor(max_delay)), 0)
+        last = min(length - 1 + int(np.floor(max_delay)), len(delays) - 1)
+        delays = delays[first:last + 1]
+    else:
+        first = 0
+
+    if method == CorrelationMethods.auto:
+        method = _choose_correlation_method(
+                        length,
+                        other_length,
+                        len(delays))
+    elif method not in (CorrelationMethods.direct, CorrelationMethods.fft):
+        raise ValueError(f"Unknown correlation method: {method}")
+
     # Compute the cross-correlation between the two signals
-    cross_correlation = np.correlate(
-                            samples,
-                            other_channel_samples,
-                            mode='full')
+    if method == CorrelationMethods.fft:
+        cross_correlation = _fft_cross_correlation(
+                                samples,
+                                other_channel_samples)
+        cross_correlation = cross_correlation[..., first:first + len(delays)]
+    else:
+        cross_correlation = _direct_cross_correlation(
+                                samples,
+                                other_channel_samples,
+                                first,
+                                len(delays))
+
+    if max_delay is not None and np.ndim(max_delay) > 0:
+        # A different maximum delay for each capture
+        cross_correlation = np.where(
+                                np.abs(delays) <= _per_sample(max_delay),
+                                cross_correlation,
+                                -np.inf)
 
     # Find the index of the maximum value in the cross-correlation function
-    max_index = np.argmax(cross_correlation)
+    if method == CorrelationMethods.fft:
+        max_index = _fft_cross_correlation_argmax(
+                        cross_correlation,
+                        samples,
+                        other_channel_samples)
+    else:
+        max_index = np.argmax(cross_correlation, axis=-1)
 
     # Calculate the phase delay in terms of sample shifts
-    phase_delay_samples = len(samples) - max_index - 1
+    return delays[max_index]
 
-    # Convert the phase delay to degrees
-    time_delay = phase_delay_samples / sampling_rate
-    signal_frequency = calculate_frequency(samples, sampling_rate)
 
+def _choose_correlation_method(
+        length: int,
+        other_length: int,
+        positions: int
+) -> str:
+    """
+    Choose the fastest method to calculate 'positions' positions of the
+    cross-correlation of two signals.
+    """
+    fft_length = sp_fft.next_fast_len(length + other_length - 1, real=True)
+    direct_cost = min(length, other_length) * positions
+    fft_cost = fft_length * np.log2(fft_length)
+    # Measured: the direct method is faster until it has to do ~25 times
+    # more operations
+    if direct_cost > 25 * fft_cost:
+        return CorrelationMethods.fft
+    return CorrelationMethods.direct
+
+
+def _direct_cross_correlation(
+        samples: np.ndarray,
+        other_channel_samples: np.ndarray,
+        first: int,
+        positions: int
+) -> np.ndarray:
+    """
+    Calculate 'positions' positions of the full cross-correlation (as in
+    np.correlate(mode='full')), starting in the 'first' one.
+    """
+    other_length = other_channel_samples.shape[-1]
+
+    # The samples used by those positions (with zeros when out of the
+    # signal), so a 'valid' correlation calculates exactly them.
+    start = first - (other_length - 1)
+    padded_length = positions + other_length - 1
+    shape = np.broadcast_shapes(
+                samples.shape[:-1],
+                other_channel_samples.shape[:-1])
+    padded_samples = np.zeros(shape + (padded_length,))
+    source_start = max(start, 0)
+    source_stop = min(start + padded_length, samples.shape[-1])
+    if source_start < source_stop:
+        padded_samples[..., source_start - start:source_stop - start] = \
+            samples[..., source_start:source_stop]
+
+    other_channel_samples = np.broadcast_to(
+                                other_channel_samples,
+                                shape + (other_length,))
+    if not shape:
+        return np.correlate(
+                    padded_samples,
+                    other_channel_samples,
+                    mode='valid')
+
+    # np.correlate only supports 1-D arrays
+    cross_correlation = np.empty(shape + (positions,))
+    for index in np.ndindex(*shape):
+        cross_correlation[index] = np.correlate(
+                                        padded_samples[index],
+                                        other_channel_samples[index],
+                                        mode='valid')
+    return cross_correlation
+
+
+def _fft_cross_correlation(
+        samples: np.ndarray,
+        other_channel_samples: np.ndarray
+) -> np.ndarray:
+    """
+    Calculate the full cross-correlation (as in np.correlate(mode='full'))
+    in the frequency domain.
+    """
+    length = samples.shape[-1]
+    other_length = other_channel_samples.shape[-1]
+    fft_length = sp_fft.next_fast_len(length + other_length - 1, real=True)
+    return _cross_correlation_from_spectra(
+                sp_fft.rfft(samples, fft_length, axis=-1),
+                sp_fft.rfft(other_channel_samples, fft_length, axis=-1),
+                fft_length,
+                length,
+                other_length)
+
+
+def _cross_correlation_from_spectra(
+        spectrum: np.ndarray,
+        other_spectrum: np.ndarray,
+        fft_length: int,
+        length: int,
+        other_length: int
+) -> np.ndarray:
+    """
+    Calculate the full cross-correlation of two signals of 'length' and
+    'other_length' samples from their rfft of 'fft_length'.
+    """
+    circular_cross_correlation = sp_fft.irfft(
+                                    spectrum * np.conj(other_spectrum),
+                                    fft_length,
+                                    axis=-1)
+    # The negative shifts are at the end of the circular cross-correlation
+    return np.concatenate(
+                (
+                    circular_cross_correlation[
+                        ..., fft_length - (other_length - 1):],
+                    circular_cross_correlation[..., :length]
+                ),
+                axis=-1)
+
+
+def _fft_cross_correlation_argmax(
+        cross_correlation: np.ndarray,
+        samples: np.ndarray,
+        other_channel_samples: np.ndarray
+) -> np.ndarray:
+    """
+    Same as np.argmax, but considering equal the values that only differ in
+    the rounding errors of the FFT. This way, when several shifts have the
+    same correlation (common with quantized samples), the first one is
+    chosen as in the direct method.
+    """
+    fft_length = sp_fft.next_fast_len(
+                    samples.shape[-1] + other_channel_samples.shape[-1] - 1,
+                    real=True)
+    # The cross-correlation is bounded by the product of the norms, and
+    # the FFT error is proportional to it
+    norms = np.sqrt(
+                np.sum(samples ** 2, axis=-1)
+                * np.sum(other_channel_samples ** 2, axis=-1))
+    tolerance = 16 * np.finfo(cross_correlation.dtype).eps \
+        * np.log2(fft_length) * norms
+    max_values = np.max(cross_correlation, axis=-1)
+    return np.argmax(
+                cross_correlation >= _per_sample(max_values - tolerance),
+                axis=-1)
+
+
+def _phase_delay_to_degrees(
+        phase_delay_samples: int,
+        sampling_rate: float,
+        signal_frequency: float
+) -> float:
+    """
+    Convert a delay in samples to degrees of the signal frequency.
+    """
+    time_delay = phase_delay_samples / sampling_rate
     phase_delay_degrees = (time_delay * signal_frequency) * 360
     return phase_delay_degrees
+
+
+_FUNCTIONS_USING_ONLY_SAMPLES = {
+    MeasurementFunctions.voltage_peak_to_peak:
+        calculate_voltage_peak_to_peak,
+    MeasurementFunctions.voltage_average:
+        calculate_voltage_average,
+    MeasurementFunctions.voltage_rms:
+        calculate_voltage_rms,
+    MeasurementFunctions.voltage_max:
+        calculate_voltage_max,
+    MeasurementFunctions.voltage_min:
+        calculate_voltage_min,
+    MeasurementFunctions.voltage_base:
+        calculate_voltage_base,
+    MeasurementFunctions.voltage_top:
+        calculate_voltage_top,
+    MeasurementFunctions.voltage_amplitude:
+        calculate_voltage_amplitude,
+    MeasurementFunctions.preshoot:
+        calculate_preshoot,
+    MeasurementFunctions.overshoot:
+        calculate_overshoot,
+    MeasurementFunctions.positive_duty_cycle:
+        calculate_positive_duty_cycle,
+}
+
+_FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE = {
+    MeasurementFunctions.rise_time: calculate_rise_time,
+    MeasurementFunctions.fall_time: calculate_fall_time,
+    MeasurementFunctions.frequency: calculate_frequency,
+    MeasurementFunctions.period: calculate_period,
+    MeasurementFunctions.positive_width: calculate_positive_width,
+    MeasurementFunctions.negative_width: calculate_negative_width,
+}
+
+
+class StreamingMeasurements:
+    """
+    Measurements of a signal that is received in chunks, such as the samples
+    of an oscilloscope acquiring continuously.
+
+    Every call to push() updates the running statistics with the new chunk
+    only, so the cost of a refresh depends on the size of the chunk and not
+    on the amount of samples received. If 'window_chunks' is provided, only
+    the latest 'window_chunks' chunks are taken into account (as in a sliding
+    window), otherwise every sample since the creation (or the latest reset)
+    is.
+
+    Some measurements are approximations of the ones in the rest of the
+    module:
+
+     - voltage_base and voltage_top (and the ones using them) are calculated
+       from a histogram of 'histogram_bins' bins, so the error is bounded by
+       the width of a bin.
+     - positive_duty_cycle is also calculated from the histogram.
+     - the 10% and 90% levels of the rise and fall times are calculated with
+       the minimum, maximum and average at the time each chunk is received.
+     - the frequency (and period and widths) is calculated from the time
+       between the rising edges, instead of the Welch's method.
+
+    The phase delay is not supported.
+    """
+
+    def __init__(
+            self,
+            sampling_rate: float,
+            window_chunks: Optional[int] = None,
+            histogram_bins: int = 1024
+    ):
+        if window_chunks is not None and window_chunks < 1:
+            raise ValueError(
+                f"The window must have at least 1 chunk, not {window_chunks}")
+        self.sampling_rate = sampling_rate
+        self.window_chunks = window_chunks
+        self.histogram_bins = histogram_bins
+        self._count = 0
+        self._mean = 0.0
+        self._mean_of_squares = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+        self._histogram = _StreamingHistogram(self.histogram_bins)
+        # absolute position of the first sample still in the window
+        self._first_position = 0
+        # chunks still in the window, with their statistics
+        self._chunks = deque()
+        forgetting = self.window_chunks is not None
+        self._rising_edges = _StreamingEdges(_rising_edge_masks, forgetting)
+        self._falling_edges = _StreamingEdges(_falling_edge_masks, forgetting)
+
+    def reset(self):
+        """
+        Forget every sample received.
+        """
+        self._count = 0
+        self._mean = 0.0
+        self._mean_of_squares = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+        self._histogram = _StreamingHistogram(self.histogram_bins)
+        # absolute position of the first sample still in the window
+        self._first_position = 0
+        # chunks still in the window, with their statistics
+        self._chunks = deque()
+        forgetting = self.window_chunks is not None
+        self._rising_edges = _StreamingEdges(_rising_edge_masks, forgetting)
+        self._falling_edges = _StreamingEdges(_falling_edge_masks, forgetting)
+
+    def push(self, chunk: List[float]):
+        """
+        Add a new chunk of samples.
+        """
+        chunk = as_samples(chunk)
+        if len(chunk) == 0:
+            return
+
+        chunk_statistics = _ChunkStatistics(
+                                chunk,
+                                self._first_position + self._count)
+        self._add_to_mean(chunk_statistics, sign=1)
+        self._min = min(self._min, chunk_statistics.min)
+        self._max = max(self._max, chunk_statistics.max)
+        self._histogram.add(chunk)
+
+        levels = _edge_levels(self._mean, self._min, self._max)
+        self._rising_edges.push(chunk, chunk_statistics.position, levels)
+        self._falling_edges.push(chunk, chunk_statistics.position, levels)
+
+        if self.window_chunks is not None:
+            self._chunks.append(chunk_statistics)
+            while len(self._chunks) > self.window_chunks:
+                self._remove_oldest_chunk()
+
+    def _remove_oldest_chunk(self):
+        chunk_statistics = self._chunks.popleft()
+        self._add_to_mean(chunk_statistics, sign=-1)
+        self._first_position += chunk_statistics.count
+        self._histogram.remove(chunk_statistics.samples)
+        self._min = min(chunk.min for chunk in self._chunks)
+        self._max = max(chunk.max for chunk in self._chunks)
+        self._rising_edges.forget_before(self._first_position)
+        self._falling_edges.forget_before(self._first_position)
+
+    def _add_to_mean(self, chunk_statistics: '_ChunkStatistics', sign: int):
+        # Welford's update, for a whole chunk at once (or the inverse
+        # operation when a chunk leaves the window)
+        count = self._count + sign * chunk_statistics.count
+        if count == 0:
+            self._count = 0
+            self._mean = 0.0
+            self._mean_of_squares = 0.0
+            return
+
+        weight = sign * chunk_statistics.count / count
+        self._mean += (chunk_statistics.mean - self._mean) * weight
+        self._mean_of_squares += (
+                chunk_statistics.mean_of_squares
+                - self._mean_of_squares) * weight
+        self._count = count
+
+    @property
+    def count(self) -> int:
+        """
+        Number of samples currently taken into account.
+        """
+        return self._count
+
+    def measure(self, function: str) -> float:
+        """
+        Provide the current result of the measurement 'function' (one of
+        MeasurementFunctions).
+        """
+        if function == 'none':
+            return 0.0
+
+        if function is None:
+            return -1.0
+
+        if self._count == 0 or function not in self._MEASUREMENTS:
+            return ERROR_RESULT
+
+        return self._MEASUREMENTS[function](self)
+
+    def measurements(self, functions: Iterable[str]) -> Dict[str, float]:
+        """
+        Provide the current result of several measurements.
+        """
+        return {function: self.measure(function) for function in functions}
+
+    def _base_and_top(self) -> Tuple[float, float]:
+        return self._histogram.base_and_top(round(0.1 * self._count))
+
+    def _voltage_peak_to_peak(self) -> float:
+        return self._max - self._min
+
+    def _voltage_average(self) -> float:
+        return self._mean
+
+    def _voltage_rms(self) -> float:
+        return np.sqrt(max(self._mean_of_squares, 0.0))
+
+    def _voltage_max(self) -> float:
+        return self._max
+
+    def _voltage_min(self) -> float:
+        return self._min
+
+    def _voltage_base(self) -> float:
+        return self._base_and_top()[0]
+
+    def _voltage_top(self) -> float:
+        return self._base_and_top()[1]
+
+    def _voltage_amplitude(self) -> float:
+        vbase, vtop = self._base_and_top()
+        return vtop - vbase
+
+    def _preshoot(self) -> float:
+        return self._base_and_top()[0] - self._min
+
+    def _overshoot(self) -> float:
+        return self._max - self._base_and_top()[1]
+
+    def _positive_duty_cycle(self) -> float:
+        return self._histogram.count_over(self._mean) / self._count * 100
+
+    def _rise_time(self) -> float:
+        return self._first_edge_duration(self._rising_edges)
+
+    def _fall_time(self) -> float:
+        return self._first_edge_duration(self._falling_edges)
+
+    def _frequency(self) -> float:
+        edges = self._rising_edges
+        if edges.count < 2:
+            return ERROR_RESULT
+        return (edges.count - 1) / (edges.last_stop - edges.first_stop) \
+            * self.sampling_rate
+
+    def _period(self) -> float:
+        return self._with_frequency(lambda frequency: 1 / frequency)
+
+    def _positive_width(self) -> float:
+        return self._with_frequency(
+                    lambda frequency: (
+                        self._positive_duty_cycle() / 100 / frequency))
+
+    def _negative_width(self) -> float:
+        return self._with_frequency(
+                    lambda frequency: (
+                        (100 - self._positive_duty_cycle()) / 100 / frequency))
+
+    def _with_frequency(self, calculate: Callable[[float], float]) -> float:
+        frequency = self._frequency()
+        if frequency == ERROR_RESULT:
+            return ERROR_RESULT
+        return calculate(frequency)
+
+    def _first_edge_duration(self, edges: '_StreamingEdges') -> float:
+        if edges.count == 0:
+            return ERROR_RESULT
+        sampling_period = 1 / self.sampling_rate
+        return (edges.first_stop - edges.first_start) * sampling_period
+
+    _MEASUREMENTS = {
+        MeasurementFunctions.voltage_peak_to_peak: _voltage_peak_to_peak,
+        MeasurementFunctions.voltage_average: _voltage_average,
+        MeasurementFunctions.voltage_rms: _voltage_rms,
+        MeasurementFunctions.voltage_max: _voltage_max,
+        MeasurementFunctions.voltage_min: _voltage_min,
+        MeasurementFunctions.voltage_base: _voltage_base,
+        MeasurementFunctions.voltage_top: _voltage_top,
+        MeasurementFunctions.voltage_amplitude: _voltage_amplitude,
+        MeasurementFunctions.preshoot: _preshoot,
+        MeasurementFunctions.overshoot: _overshoot,
+        MeasurementFunctions.positive_duty_cycle: _positive_duty_cycle,
+        MeasurementFunctions.rise_time: _rise_time,
+        MeasurementFunctions.fall_time: _fall_time,
+        MeasurementFunctions.frequency: _frequency,
+        MeasurementFunctions.period: _period,
+        MeasurementFunctions.positive_width: _positive_width,
+        MeasurementFunctions.negative_width: _negative_width,
+    }
+
+
+class _ChunkStatistics:
+    """
+    Statistics of a single chunk received by StreamingMeasurements.
+    """
+
+    def __init__(self, samples: np.ndarray, position: int):
+        self.samples = samples
+        self.position = position
+        self.count = len(samples)
+        self.mean = np.mean(samples)
+        self.mean_of_squares = np.mean(samples ** 2)
+        self.min = np.min(samples)
+        self.max = np.max(samples)
+
+
+class _StreamingHistogram:
+    """
+    Histogram of fixed number of bins, whose width doubles (merging pairs of
+    bins) every time that a sample does not fit. For every bin, it stores
+    how many samples are there and their sum.
+    """
+
+    def __init__(self, bins: int):
+        self.bins = bins
+        self.width = None
+        self.start = None
+        self.counts = np.zeros(bins)
+        self.sums = np.zeros(bins)
+
+    def add(self, samples: np.ndarray):
+        """
+        Count 'samples', widening the bins first if any does not fit.
+        """
+        self._fit(np.min(samples), np.max(samples))
+        positions = self._positions(samples)
+        self.counts += np.bincount(positions, minlength=self.bins)
+        self.sums += np.bincount(positions, samples, minlength=self.bins)
+
+    def remove(self, samples: np.ndarray):
+        """
+        Stop counting 'samples', which must have been added before.
+        """
+        positions = self._positions(samples)
+        self.counts -= np.bincount(positions, minlength=self.bins)
+        self.sums -= np.bincount(positions, samples, minlength=self.bins)
+        # Rounding errors must not leave negative values
+        np.maximum(self.counts, 0, out=self.counts)
+
+    def _positions(self, samples: np.ndarray) -> np.ndarray:
+        positions = np.floor((samples - self.start) / self.width)
+        return np.clip(positions, 0, self.bins - 1).astype(int)
+
+    def _fit(self, vmin: float, vmax: float):
+        if self.width is None:
+            self.width = (vmax - vmin) / self.bins
+            if self.width == 0:
+                self.width = max(abs(vmin), 1.0) * 1e-9
+            self.start = np.floor(vmin / self.width) * self.width
+
+        while vmin < self.start or vmax >= self.start + self.bins * self.width:
+            # Double the width of the bins, keeping the start in a multiple
+            # of the new width so the existing bins are merged in pairs.
+            width = 2 * self.width
+            start = np.floor(min(vmin, self.start) / width) * width
+            offset = int(round((self.start - start) / self.width))
+            merged_positions = (offset + np.arange(self.bins)) // 2
+            self.counts = np.bincount(
+                                merged_positions,
+                                self.counts,
+                                minlength=self.bins)[:self.bins]
+            self.sums = np.bincount(
+                                merged_positions,
+                                self.sums,
+                                minlength=self.bins)[:self.bins]
+            self.width = width
+            self.start = start
+
+    def base_and_top(self, ten_percent: int) -> Tuple[float, float]:
+        """
+        Means of the lowest and highest 'ten_percent' samples, as in
+        calculate_base_and_top.
+        """
+        if ten_percent == 0:
+            # Same as sorted_samples[:0] and sorted_samples[-0:]
+            total = np.sum(self.counts)
+            return np.nan, np.sum(self.sums) / total
+        vbase = self._tail_mean(self.counts, self.sums, ten_percent)
+        vtop = self._tail_mean(
+                    self.counts[::-1],
+                    self.sums[::-1],
+                    ten_percent)
+        return vbase, vtop
+
+    @staticmethod
+    def _tail_mean(counts: np.ndarray, sums: np.ndarray, size: int) -> float:
+        """
+        Mean of the first 'size' samples of the histogram. In the last bin
+        needed, the samples are assumed to be at the mean of the bin.
+        """
+        cumulative_counts = np.cumsum(counts)
+        last_bin = int(np.searchsorted(cumulative_counts, size))
+        last_bin = min(last_bin, len(counts) - 1)
+        full_count = cumulative_counts[last_bin] - counts[last_bin]
+        full_sum = np.sum(sums[:last_bin])
+        remaining = size - full_count
+        if counts[last_bin] > 0:
+            full_sum += sums[last_bin] / counts[last_bin] * remaining
+        return full_sum / size
+
+    def count_over(self, value: float) -> float:
+        """
+        Approximate number of samples over 'value'. In the bin of 'value',
+        the samples are assumed to be distributed uniformly.
+        """
+        position = (value - self.start) / self.width
+        value_bin = min(max(int(np.floor(position)), 0), self.bins - 1)
+        fraction_over = 1 - min(max(position - value_bin, 0.0), 1.0)
+        return (np.sum(self.counts[value_bin + 1:])
+                + self.counts[value_bin] * fraction_over)
+
+
+class _StreamingEdges:
+    """
+    Transitions (as in find_rising_edges or find_falling_edges) found in
+    every chunk, including those between two chunks.
+
+    Only the number of transitions, the first one and the stop of the last
+    one are needed, so they are kept as running values. The transitions of
+    each chunk are only kept if 'forgetting' (with a window of chunks), to
+    calculate those values again without the chunks that left the window.
+    """
+
+    def __init__(self, edge_masks: Callable, forgetting: bool = False):
+        self.edge_masks = edge_masks
+        self.forgetting = forgetting
+        # Position and type (final or initial) of the latest sample beyond
+        # any of the levels, from the previous chunks
+        self.latest_position = None
+        self.latest_is_final = None
+        self.starts = deque()
+        self.stops = deque()
+        # Running values of the transitions taken into account
+        self.count = 0
+        self.first_start = None
+        self.first_stop = None
+        self.last_stop = None
+
+    def _clear(self):
+        self.count = 0
+        self.first_start = None
+        self.first_stop = None
+        self.last_stop = None
+
+    def _add(self, starts: np.ndarray, stops: np.ndarray):
+        if len(starts) == 0:
+            return
+        if self.count == 0:
+            self.first_start = starts[0]
+            self.first_stop = stops[0]
+        self.last_stop = stops[-1]
+        self.count += len(starts)
+
+    def push(
+            self,
+            chunk: np.ndarray,
+            position: int,
+            levels: Tuple[float, float]
+    ):
+        """
+        Add the transitions of 'chunk', whose first sample is at 'position',
+        including the one that may start in the previous chunk.
+        """
+        initial, final = self.edge_masks(chunk, *levels)
+        positions = np.flatnonzero(initial | final)
+        if len(positions) == 0:
+            return
+        is_final = final[positions]
+        positions = positions + position
+
+        if self.latest_position is not None:
+            positions = np.concatenate(([self.latest_position], positions))
+            is_final = np.concatenate(([self.latest_is_final], is_final))
+
+        transitions = np.flatnonzero(~is_final[:-1] & is_final[1:])
+        starts = positions[transitions]
+        stops = positions[transitions + 1]
+        if self.forgetting:
+            self.starts.append(starts)
+            self.stops.append(stops)
+        self._add(starts, stops)
+        self.latest_position = positions[-1]
+        self.latest_is_final = is_final[-1]
+
+    def forget_before(self, position: int):
+        """
+        Forget the transitions starting before 'position'.
+        """
+        while self.starts and (
+                len(self.starts[0]) == 0 or self.starts[0][-1] < position):
+            self.starts.popleft()
+            self.stops.popleft()
+
+        if self.starts:
+            kept = self.starts[0] >= position
+            self.starts[0] = self.starts[0][kept]
+            self.stops[0] = self.stops[0][kept]
+
+        # At most one entry per chunk in the window
+        self._clear()
+        for starts, stops in zip(self.starts, self.stops):
+            self._add(starts, stops)
+
+
+class EnvelopePyramid:
+    """
+    Multi-level envelope of a (long) capture, built once, like the peak
+    detect mode of an oscilloscope: level 0 are the samples, and each
+    block of 'factor' blocks of a level is a block of the next one, with
+    its min, max, sum and sum of squares.
+
+    The max, min, peak to peak, average and RMS voltages of the whole
+    capture or of any window of it (start and stop indexes) are answered
+    exactly from the largest blocks inside the window, without reading
+    the samples again. The voltage base and top (and the measurements
+    derived from them) are calculated with the means of the blocks of a
+    level, so they are approximations, good when the blocks are short
+    compared to the period of the signal. The rest of measurements need the
+    resolution of the samples, so they are calculated with the samples of
+    the window.
+    """
+
+    def __init__(
+            self,
+            samples: List[float],
+            sampling_rate: Optional[float] = None,
+            factor: int = 16
+    ):
+        if factor < 2:
+            raise ValueError(f"The factor must be at least 2, not {factor}")
+
+        self.samples = as_samples(samples)
+        self.sampling_rate = sampling_rate
+        self.factor = factor
+
+        # Min, max, sum and sum of squares of the blocks of each level
+        # (level 0, the samples, is not stored)
+        self._levels = []
+        mins = maxs = sums = self.samples
+        sums_of_squares = np.square(self.samples)
+        while len(sums) > 1:
+            starts = np.arange(0, len(sums), factor)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+            sums = np.add.reduceat(sums, starts)
+            sums_of_squares = np.add.reduceat(sums_of_squares, starts)
+            self._levels.append((mins, maxs, sums, sums_of_squares))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def levels(self) -> int:
+        """
+        Number of levels, including the samples.
+        """
+        return len(self._levels) + 1
+
+    def max(self, start: int = 0, stop: Optional[int] = None) -> float:
+        """
+        Max of the samples of the window.
+        """
+        return self._reduce(start, stop, 1, np.max)
+
+    def min(self, start: int = 0, stop: Optional[int] = None) -> float:
+        """
+        Min of the samples of the window.
+        """
+        return self._reduce(start, stop, 0, np.min)
+
+    def peak_to_peak(self, start: int = 0, stop: Optional[int] = None) -> float:
+        """
+        Peak to peak voltage of the samples of the window.
+        """
+        return self.max(start, stop) - self.min(start, stop)
+
+    def mean(self, start: int = 0, stop: Optional[int] = None) -> float:
+        """
+        Average voltage of the samples of the window.
+        """
+        start, stop = self._window(start, stop)
+        return self._reduce(start, stop, 2, np.sum) / (stop - start)
+
+    def rms(self, start: int = 0, stop: Optional[int] = None) -> float:
+        """
+        RMS voltage of the samples of the window.
+        """
+        start, stop = self._window(start, stop)
+        return np.sqrt(self._reduce(start, stop, 3, np.sum) / (stop - start))
+
+    def envelope(
+            self,
+            level: int,
+            start: int = 0,
+            stop: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Min and max of the blocks of the level in the window (the blocks
+        partially in the window are included), e.g., to plot the capture.
+        """
+        first, last = self._blocks(level, start, stop)
+        if level == 0:
+            samples = self.samples[first:last]
+            return samples, samples
+        mins, maxs, _, _ = self._levels[level - 1]
+        return mins[first:last], maxs[first:last]
+
+    def decimated(
+            self,
+            level: int,
+            start: int = 0,
+            stop: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Mean of the blocks of the level in the window (the blocks partially
+        in the window are included).
+        """
+        first, last = self._blocks(level, start, stop)
+        if level == 0:
+            return self.samples[first:last]
+        _, _, sums, _ = self._levels[level - 1]
+        block = self.factor ** level
+        counts = np.full(last - first, block)
+        counts[-1] = min(last * block, len(self.samples)) - (last - 1) * block
+        return sums[first:last] / counts
+
+    def measure(
+            self,
+            function: str,
+            start: int = 0,
+            stop: Optional[int] = None,
+            level: int = 1
+    ) -> float:
+        """
+        Provide the result of the measurement 'function' (one of
+        MeasurementFunctions) in the window. The approximate measurements
+        (base, top...) use the means of the blocks of 'level', where the
+        blocks partially in the window only take its samples into account.
+        """
+        if function == 'none':
+            return 0.0
+
+        if function is None:
+            return -1.0
+
+        if function in _PYRAMID_MEASUREMENTS:
+            return _PYRAMID_MEASUREMENTS[function](self, start, stop)
+
+        if function in _PYRAMID_DECIMATED_MEASUREMENTS:
+            return _PYRAMID_DECIMATED_MEASUREMENTS[function](
+                        self,
+                        self._window_means(level, start, stop),
+                        start,
+                        stop)
+
+        if function in _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE:
+            start, stop = self._window(start, stop)
+            return _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE[function](
+                        self.samples[start:stop],
+                        self.sampling_rate)
+
+        return ERROR_RESULT
+
+    def _window_means(
+            self,
+            level: int,
+            start: int,
+            stop: Optional[int]
+    ) -> np.ndarray:
+        """
+        Like decimated, but the means of the first and last blocks are
+        calculated with the samples inside the window only.
+        """
+        start, stop = self._window(start, stop)
+        means = self.decimated(level, start, stop)
+        if level == 0:
+            return means
+        block = self.factor ** level
+        first_stop = min((start // block + 1) * block, stop)
+        last_start = max((-(-stop // block) - 1) * block, start)
+        means[0] = np.mean(self.samples[start:first_stop])
+        means[-1] = np.mean(self.samples[last_start:stop])
+        return means
+
+    def _window(self, start: int, stop: Optional[int]) -> Tuple[int, int]:
+        start, stop, _ = slice(start, stop).indices(len(self.samples))
+        if stop <= start:
+            raise ValueError(f"Empty window: {start}-{stop}")
+        return start, stop
+
+    def _blocks(
+            self,
+            level: int,
+            start: int,
+            stop: Optional[int]
+    ) -> Tuple[int, int]:
+        if not 0 <= level < self.levels:
+            raise ValueError(f"Invalid level: {level}")
+        start, stop = self._window(start, stop)
+        block = self.factor ** level
+        return start // block, -(-stop // block)
+
+    def _reduce(
+            self,
+            start: int,
+            stop: Optional[int],
+            statistic: int,
+            reduce: Callable[[np.ndarray], float]
+    ) -> float:
+        """
+        Reduce a statistic (0: min, 1: max, 2: sum, 3: sum of squares) of
+        the window: the largest blocks inside the window are taken from the
+        highest levels, and the rest from the lower ones.
+        """
+        start, stop = self._window(start, stop)
+        partial_results = []
+        level = 0
+        while level < len(self._levels):
+            block = self.factor ** (level + 1)
+            aligned_start = -(-start // block) * block
+            aligned_stop = stop if stop == len(self.samples) \
+                else stop // block * block
+            if aligned_start >= aligned_stop:
+                break
+            # The parts outside the blocks of the next level
+            for part_start, part_stop in (
+                    (start, aligned_start),
+                    (aligned_stop, stop)):
+                if part_start < part_stop:
+                    partial_results.append(reduce(self._values(
+                                                level,
+                                                statistic,
+                                                part_start,
+                                                part_stop)))
+            start, stop = aligned_start, aligned_stop
+            level += 1
+
+        partial_results.append(
+            reduce(self._values(level, statistic, start, stop)))
+        return reduce(partial_results)
+
+    def _values(
+            self,
+            level: int,
+            statistic: int,
+            start: int,
+            stop: int
+    ) -> np.ndarray:
+        """
+        Values of a statistic of the blocks of a level between start and
+        stop (which are the limits of blocks of that level).
+        """
+        block = self.factor ** level
+        first, last = start // block, -(-stop // block)
+        if level == 0:
+            samples = self.samples[first:last]
+            return np.square(samples) if statistic == 3 else samples
+        return self._levels[level - 1][statistic][first:last]
+
+
+_PYRAMID_MEASUREMENTS = {
+    MeasurementFunctions.voltage_peak_to_peak: EnvelopePyramid.peak_to_peak,
+    MeasurementFunctions.voltage_average: EnvelopePyramid.mean,
+    MeasurementFunctions.voltage_rms: EnvelopePyramid.rms,
+    MeasurementFunctions.voltage_max: EnvelopePyramid.max,
+    MeasurementFunctions.voltage_min: EnvelopePyramid.min,
+}
+
+_PYRAMID_DECIMATED_MEASUREMENTS = {
+    MeasurementFunctions.voltage_base:
+        lambda pyramid, decimated, start, stop:
+            _calculate_base_and_top(decimated)[0],
+    MeasurementFunctions.voltage_top:
+        lambda pyramid, decimated, start, stop:
+            _calculate_base_and_top(decimated)[1],
+    MeasurementFunctions.voltage_amplitude:
+        lambda pyramid, decimated, start, stop:
+            calculate_voltage_amplitude(decimated),
+    MeasurementFunctions.preshoot:
+        lambda pyramid, decimated, start, stop:
+            _calculate_base_and_top(decimated)[0]
+            - pyramid.min(start, stop),
+    MeasurementFunctions.overshoot:
+        lambda pyramid, decimated, start, stop:
+            pyramid.max(start, stop)
+            - _calculate_base_and_top(decimated)[1],
+    MeasurementFunctions.positive_duty_cycle:
+        lambda pyramid, decimated, start, stop:
+            calculate_positive_duty_cycle(decimated),
+}
+
+
+# Upper bounds of the buckets of the histograms of the instrumentation
+_SECONDS_BUCKETS = (
+    0.00001, 0.00003, 0.0001, 0.0003, 0.001, 0.003,
+    0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0,
+)
+_SAMPLES_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class _Histogram:
+    """
+    Histogram with cumulative buckets, like the ones of Prometheus.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, value: float):
+        """
+        Count 'value' in the first bucket whose upper bound is not lower.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        """
+        Copy of the histogram. The count of each bucket (by upper bound,
+        the last one infinite) includes the values of the lower buckets, as
+        the exposition format of Prometheus expects.
+        """
+        cumulative = list(itertools.accumulate(self.counts))
+        return {
+            'buckets': dict(zip(self.buckets + (float('inf'),), cumulative)),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class Instrumentation:
+    """
+    Number of calls, number of samples and wall time of every calculate_*
+    function and of the measurements calculated together (by
+    calculate_oscilloscope_measurements or a MeasurementPlan, where the
+    intermediate values are calculated by the first measurement that needs
+    them), while enable_instrumentation() is in effect.
+
+    Calls taking 'slow_call_seconds' or more are logged as warnings.
+    """
+
+    def __init__(self, slow_call_seconds: Optional[float] = None):
+        self.slow_call_seconds = slow_call_seconds
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def record(self, function: str, n_samples: int, seconds: float):
+        """
+        Record a call of the function.
+        """
+        with self._lock:
+            if function not in self._functions:
+                self._functions[function] = (
+                    _Histogram(_SECONDS_BUCKETS),
+                    _Histogram(_SAMPLES_BUCKETS))
+            seconds_histogram, samples_histogram = self._functions[function]
+            seconds_histogram.add(seconds)
+            samples_histogram.add(n_samples)
+
+        if self.slow_call_seconds is not None \
+                and seconds >= self.slow_call_seconds:
+            logger.warning(
+                "%s took %.3f s with %d samples",
+                function,
+                seconds,
+                n_samples)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Return the number of calls and the histograms of the wall time and
+        number of samples of every function.
+        """
+        with self._lock:
+            return {
+                function: {
+                    'calls': seconds_histogram.count,
+                    'seconds': seconds_histogram.snapshot(),
+                    'samples': samples_histogram.snapshot(),
+                }
+                for function, (seconds_histogram, samples_histogram)
+                in self._functions.items()
+            }
+
+    def prometheus(self, prefix: str = 'll_oscilloscope_measurement') -> str:
+        """
+        Return the snapshot in the text format of Prometheus.
+        """
+        lines = []
+        snapshot = self.snapshot()
+        for metric, description in (
+                ('seconds', 'Wall time of the measurement functions'),
+                ('samples', 'Number of samples of the measurement functions')):
+            name = f"{prefix}_{metric}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for function, values in snapshot.items():
+                histogram = values[metric]
+                for bucket, count in histogram['buckets'].items():
+                    bound = '+Inf' if bucket == float('inf') else repr(bucket)
+                    lines.append(
+                        f'{name}_bucket{{function="{function}",'
+                        f'le="{bound}"}} {count}')
+                lines.append(
+                    f'{name}_sum{{function="{function}"}} '
+                    f"{histogram['sum']!r}")
+                lines.append(
+                    f'{name}_count{{function="{function}"}} '
+                    f"{histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Forget every recorded call.
+        """
+        with self._lock:
+            self._functions.clear()
+
+
+instrumentation = Instrumentation()
+
+# Original functions and context measurements replaced by
+# enable_instrumentation
+_UNINSTRUMENTED = {}
+_UNINSTRUMENTED_CONTEXT_MEASUREMENTS = {}
+
+
+def enable_instrumentation():
+    """
+    Record every call in 'instrumentation'.
+
+    The functions of this module (and the dispatch tables) are replaced by
+    instrumented ones, so there is no cost at all while the instrumentation
+    is disabled. MeasurementPlans built before enabling it are not
+    instrumented.
+    """
+    if _UNINSTRUMENTED:
+        return
+
+    module = globals()
+    instrumented = {}
+    for name in list(module):
+        function = module[name]
+        if name.startswith('calculate_') and callable(function):
+            _UNINSTRUMENTED[name] = function
+            instrumented[function] = _instrumented(name, function)
+            module[name] = instrumented[function]
+
+    for table in (
+            _FUNCTIONS_USING_ONLY_SAMPLES,
+            _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE):
+        for key, function in table.items():
+            table[key] = instrumented[function]
+
+    for key, measure in _CONTEXT_MEASUREMENTS.items():
+        _UNINSTRUMENTED_CONTEXT_MEASUREMENTS[key] = measure
+        _CONTEXT_MEASUREMENTS[key] = _instrumented_context_measurement(
+                                        key,
+                                        measure)
+
+
+def disable_instrumentation():
+    """
+    Restore the original functions, without instrumentation.
+    """
+    globals().update(_UNINSTRUMENTED)
+    _CONTEXT_MEASUREMENTS.update(_UNINSTRUMENTED_CONTEXT_MEASUREMENTS)
+
+    for table in (
+            _FUNCTIONS_USING_ONLY_SAMPLES,
+            _FUNCTIONS_USING_SAMPLES_AND_SAMPLING_RATE):
+        for key, function in table.items():
+            table[key] = getattr(function, '__wrapped__', function)
+
+    _UNINSTRUMENTED.clear()
+    _UNINSTRUMENTED_CONTEXT_MEASUREMENTS.clear()
+
+
+def _instrumented(name: str, function: Callable) -> Callable:
+    # The samples are the 'samples' argument, or the first of the 'channels'
+    parameters = list(inspect.signature(function).parameters)
+    samples_parameter = 'channels' if 'channels' in parameters else 'samples'
+    samples_position = parameters.index(samples_parameter)
+
+    @functools.wraps(function)
+    def instrumented_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            if len(args) > samples_position:
+                samples = args[samples_position]
+            else:
+                samples = kwargs.get(samples_parameter)
+            if samples_parameter == 'channels' and _n_samples(samples):
+                samples = samples[0]
+            instrumentation.record(name, _n_samples(samples), seconds)
+    return instrumented_function
+
+
+def _instrumented_context_measurement(
+        name: str,
+        measure: Callable[[_MeasurementContext], float]
+) -> Callable[[_MeasurementContext], float]:
+    @functools.wraps(measure)
+    def instrumented_measure(context: _MeasurementContext) -> float:
+        start = time.perf_counter()
+        try:
+            return measure(context)
+        finally:
+            instrumentation.record(
+                name,
+                context.samples.size,
+                time.perf_counter() - start)
+    return instrumented_measure
+
+
+def _n_samples(samples) -> int:
+    if hasattr(samples, 'size'):
+        return samples.size
+    if hasattr(samples, '__len__'):
+        return len(samples)
+    return 0
+
+
+class ProfileReport:
+    """
+    cProfile report of the code run inside profile_measurements().
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def stats(self) -> pstats.Stats:
+        """
+        Statistics of the profile, to sort and print them.
+        """
+        return pstats.Stats(self.profiler)
+
+    def text(self, sort_by: str = 'cumulative', limit: int = 30) -> str:
+        """
+        The most expensive calls, as printed by pstats.
+        """
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output) \
+            .sort_stats(sort_by) \
+            .print_stats(limit)
+        return output.getvalue()
+
+
+@contextlib.contextmanager
+def profile_measurements() -> Iterator[ProfileReport]:
+    """
+    Profile the code inside the context (e.g., one batch of measurements)
+    with cProfile:
+
+        with profile_measurements() as report:
+            calculate_oscilloscope_measurements(...)
+        print(report.text())
+    """
+    report = ProfileReport()
+    report.profiler.enable()
+    try:
+        yield report
+    finally:
+        report.profiler.disable()
@@ -38,10 +38,11 @@ setup(name='ll-oscilloscope-measurements',
       author_email='dev@labsland.com',
       url='https://github.com/labsland/ll-oscilloscope-measurements/',
       license=cp_license,
-      py_modules=['ll_oscilloscope_measurements'],
+      py_modules=['ll_oscilloscope_measurements', 'll_oscilloscope_io', 'll_oscilloscope_batch', 'll_oscilloscope_async', 'll_oscilloscope_kernels'],
       install_requires=['numpy', 'scipy'],
-      extra_requires={
-          'test': ['pytest']
+      extras_require={
+          'test': ['pytest'],
+          'numba': ['numba'],
       }
 )
 
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+import ll_oscilloscope_async as llasync
+import ll_oscilloscope_measurements as llom
+
+FUNCTIONS = ['voltage_rms', 'frequency', 'rise_time']
+
+
+class LlOscilloscopeAsyncTest(unittest.TestCase):
+
+    def setUp(self):
+        times = np.arange(500) / 25000.0
+        self.samples = [np.sin(2 * np.pi * frequency * times) for frequency in (1000, 2000, 3000)]
+
+    def test_measure_async(self):
+        async def measure():
+            return await llasync.measure_async(FUNCTIONS, self.samples[0], 25000.0)
+
+        self.assertEqual(
+            asyncio.run(measure()),
+            llom.calculate_oscilloscope_measurements(FUNCTIONS, self.samples[0], 25000.0))
+
+    def test_concurrent_requests_share_the_calculation(self):
+        calculate = mock.Mock(wraps=llom.calculate_oscilloscope_measurements)
+
+        async def measure():
+            async with llasync.MeasurementService(max_workers=2) as service:
+                requests = [service.measure(FUNCTIONS, list(samples), 25000.0) for samples in self.samples * 3]
+                return await asyncio.gather(*requests)
+
+        with mock.patch.object(llom, 'calculate_oscilloscope_measurements', calculate):
+            results = asyncio.run(measure())
+        self.assertEqual(calculate.call_count, 3)
+        self.assertEqual(results[:3], results[3:6])
+        self.assertAlmostEqual(results[1]['frequency'], 2000)
+
+    def test_cancel_waiting_requests(self):
+        release = threading.Event()
+        calculate = mock.Mock(side_effect=lambda *args: release.wait() and {})
+
+        async def measure():
+            service = llasync.MeasurementService(ThreadPoolExecutor(2), max_running=1)
+            running = asyncio.ensure_future(service.measure(FUNCTIONS, self.samples[0]))
+            waiting = asyncio.ensure_future(service.measure(FUNCTIONS, self.samples[1]))
+            await asyncio.sleep(0.1)
+            self.assertEqual(service.pending, 2)
+
+            waiting.cancel()
+            release.set()
+            await running
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(service.pending, 0)
+
+        with mock.patch.object(llom, 'calculate_oscilloscope_measurements', calculate):
+            asyncio.run(measure())
+        # The cancelled request was never calculated
+        self.assertEqual(calculate.call_count, 1)
+
+    def test_busy_service(self):
+        release = threading.Event()
+        calculate = mock.Mock(side_effect=lambda *args: release.wait() and {})
+        threads = []
+        original_samples_key = llom.samples_key
+
+        def samples_key(samples):
+            threads.append(threading.current_thread())
+            return original_samples_key(samples)
+
+        async def measure():
+            service = llasync.MeasurementService(ThreadPoolExecutor(2), max_running=1, max_pending=2)
+            self.assertEqual(service.max_pending, 2)
+            requests = [asyncio.ensure_future(service.measure(FUNCTIONS, samples)) for samples in self.samples[:2]]
+            await asyncio.sleep(0.1)
+            self.assertEqual(service.requests, 2)
+            with self.assertRaises(llasync.ServiceBusyError):
+                await service.measure(FUNCTIONS, self.samples[2])
+
+            release.set()
+            await asyncio.gather(*requests)
+            self.assertEqual(service.requests, 0)
+            await service.measure(FUNCTIONS, self.samples[2])
+            service.close()
+
+        with mock.patch.object(llom, 'calculate_oscilloscope_measurements', calculate), \
+                mock.patch.object(llom, 'samples_key', samples_key):
+            asyncio.run(measure())
+        # The samples are hashed in the executor, not in the event loop
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.current_thread(), threads)
+
+        self.assertEqual(llasync.MeasurementService(max_workers=3).max_running, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import ll_oscilloscope_batch as llbatch
+import ll_oscilloscope_io as llio
+import ll_oscilloscope_measurements as llom
+
+DATA_DIRECTORY = "./tests/data/oscilloscope_measurements/"
+
+FUNCTIONS = ['voltage_rms', 'voltage_amplitude', 'frequency', 'rise_time', 'phase_delay']
+
+
+class LlOscilloscopeBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = [
+            DATA_DIRECTORY + name + ".csv"
+            for name in ("sine_1vpp_1khz", "square_1vpp_1khz", "triangle_1vpp_1khz", "sine_1vpp_1khz_delayed_10")
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_measure_batch(self):
+        captures = [llio.read_csv(path) for path in self.paths] * 10
+        expected = [
+            llom.calculate_oscilloscope_measurements(
+                FUNCTIONS, capture.column('Channel1'), 25000.0, capture.column('Channel2'))
+            for capture in captures
+        ]
+
+        original_threshold = llbatch.SHARED_MEMORY_THRESHOLD
+        for threshold in (original_threshold, 0):
+            # With a threshold of 0 every capture is sent through shared memory
+            llbatch.SHARED_MEMORY_THRESHOLD = threshold
+            try:
+                results = llbatch.measure_batch(
+                    FUNCTIONS,
+                    (capture.column('Channel1') for capture in captures),
+                    25000.0,
+                    (capture.column('Channel2') for capture in captures),
+                    workers=2)
+                self.assertEqual(list(results), expected)
+            finally:
+                llbatch.SHARED_MEMORY_THRESHOLD = original_threshold
+
+    def test_measure_batch_with_cache(self):
+        captures = [llio.read_csv(path).column('Channel1') for path in self.paths]
+        cache = llom.ResultCache()
+        expected = list(llbatch.measure_batch(FUNCTIONS, captures[:2], 25000.0, captures[:2], workers=1))
+        list(llbatch.measure_batch(FUNCTIONS, captures[1:2], 25000.0, captures[1:2], workers=1, cache=cache))
+
+        results = list(llbatch.measure_batch(FUNCTIONS, captures, 25000.0, captures, workers=1, cache=cache))
+        self.assertEqual(results[:2], expected)
+        self.assertEqual(cache.info()['memory_hits'], len(FUNCTIONS))
+        self.assertEqual(cache.info()['misses'], 4 * len(FUNCTIONS))
+
+    def test_tasks_in_flight(self):
+        captures = [llio.read_csv(path).column('Channel1') for path in self.paths] * 3
+        read = []
+
+        def generate():
+            for capture in captures:
+                read.append(capture)
+                yield capture
+
+        original_captures_per_task = llbatch.CAPTURES_PER_TASK
+        llbatch.CAPTURES_PER_TASK = 1
+        try:
+            with ThreadPoolExecutor(1) as executor:
+                results = llbatch.measure_batch(['voltage_rms'], generate(), executor=executor, tasks_in_flight=3)
+                self.assertEqual(next(results), {'voltage_rms': llom.calculate_voltage_rms(captures[0])})
+                # Only the tasks in flight were read, whatever the executor
+                self.assertEqual(len(read), 3)
+                self.assertEqual(len(list(results)), len(captures) - 1)
+        finally:
+            llbatch.CAPTURES_PER_TASK = original_captures_per_task
+
+    def test_measure_files(self):
+        binary_path = os.path.join(self.directory, "sine.llosc")
+        llio.convert_csv_to_binary(self.paths[0], binary_path)
+        paths = self.paths + [binary_path]
+
+        results = list(llbatch.measure_files(FUNCTIONS, paths, other_channel='Channel2', workers=2))
+        self.assertEqual([result['path'] for result in results], paths)
+        self.assertEqual(results[-1], dict(results[0], path=binary_path))
+        self.assertAlmostEqual(results[1]['frequency'], 1000)
+
+        csv_path = os.path.join(self.directory, "results.csv")
+        self.assertEqual(llbatch.write_csv(results, csv_path), len(paths))
+        with open(csv_path, encoding='utf-8') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        self.assertEqual(rows[0]['path'], paths[0])
+        self.assertAlmostEqual(float(rows[0]['voltage_rms']), results[0]['voltage_rms'])
+
+        json_path = os.path.join(self.directory, "results.json")
+        self.assertEqual(llbatch.write_json(results, json_path), len(paths))
+        with open(json_path, encoding='utf-8') as json_file:
+            self.assertEqual(json.load(json_file), results)
+
+
+if __name__ == '__main__':
+    unittest.main()
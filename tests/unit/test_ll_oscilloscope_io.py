@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import ll_oscilloscope_io as llio
+import ll_oscilloscope_measurements as llom
+
+DATA_DIRECTORY = "./tests/data/oscilloscope_measurements/"
+
+
+class LlOscilloscopeIoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_csv(self):
+        capture = llio.read_csv(DATA_DIRECTORY + "sine_1vpp_1khz.csv")
+        self.assertEqual(capture.names, ['Time', 'Channel1', 'Channel2'])
+        self.assertEqual(capture.data.shape, (3, 500))
+        self.assertTrue(capture.column('Channel1').flags.c_contiguous)
+        self.assertAlmostEqual(capture.sampling_rate, 25000.0)
+        self.assertEqual(capture.column('Time')[0], -0.01)
+        self.assertEqual(capture.column('Channel1')[0], -0.09375)
+        self.assertAlmostEqual(llom.calculate_frequency(capture.column('Channel1'), capture.sampling_rate), 1000)
+
+    def test_read_csv_in_chunks(self):
+        original_chunk_rows = llio.CSV_CHUNK_ROWS
+        llio.CSV_CHUNK_ROWS = 64
+        try:
+            chunked = llio.read_csv(DATA_DIRECTORY + "square_1vpp_1khz.csv")
+        finally:
+            llio.CSV_CHUNK_ROWS = original_chunk_rows
+        capture = llio.read_csv(DATA_DIRECTORY + "square_1vpp_1khz.csv")
+        np.testing.assert_array_equal(chunked.data, capture.data)
+
+    def test_convert_csv_to_binary(self):
+        csv_path = DATA_DIRECTORY + "rampup_1vpp_1khz.csv"
+        binary_path = os.path.join(self.directory, "rampup.llosc")
+        capture = llio.read_csv(csv_path)
+
+        converted = llio.convert_csv_to_binary(csv_path, binary_path)
+        opened = llio.open_binary(binary_path)
+        for binary in (converted, opened):
+            self.assertIsInstance(binary.data, np.memmap)
+            self.assertEqual(binary.names, capture.names)
+            self.assertEqual(binary.sampling_rate, capture.sampling_rate)
+            np.testing.assert_array_equal(binary.data, capture.data)
+        self.assertEqual((os.path.getsize(binary_path) - 3 * 500 * 8) % llio.ALIGNMENT, 0)
+
+        # Measuring the memory mapped samples, whole or in chunks
+        streaming = llom.StreamingMeasurements(opened.sampling_rate)
+        for chunk in opened.chunks('Channel1', 100):
+            streaming.push(chunk)
+        self.assertEqual(
+            streaming.measure('voltage_max'),
+            llom.calculate_voltage_max(opened.column('Channel1')))
+
+    def test_write_binary(self):
+        path = os.path.join(self.directory, "adc.llosc")
+        codes = np.arange(-100, 100, dtype=np.int16)
+        llio.write_binary(path, {'ch0': codes, 'ch1': -codes}, sampling_rate=1e6, dtype=np.int16)
+
+        capture = llio.open_binary(path)
+        self.assertEqual(capture.data.dtype, np.int16)
+        self.assertEqual(capture.sampling_rate, 1e6)
+        np.testing.assert_array_equal(capture.column('ch1'), -codes)
+
+        with open(path, 'r+b') as binary_file:
+            binary_file.write(b'other')
+        with self.assertRaises(ValueError):
+            llio.open_binary(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
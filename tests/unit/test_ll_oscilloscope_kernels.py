@@ -0,0 +1,104 @@
+import glob
+import unittest
+import numpy as np
+import ll_oscilloscope_io as llio
+import ll_oscilloscope_kernels as llk
+import ll_oscilloscope_measurements as llom
+
+DATA_DIRECTORY = "./tests/data/oscilloscope_measurements/"
+
+
+class LlOscilloscopeKernelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.captures = [llio.read_csv(path) for path in sorted(glob.glob(DATA_DIRECTORY + "*.csv"))]
+        self.functions = [
+            value for name, value in vars(llom.MeasurementFunctions).items() if not name.startswith('_')
+        ]
+
+    def tearDown(self):
+        llom.set_kernel_backend()
+
+    def measure_everything(self):
+        results = []
+        for capture in self.captures:
+            samples = capture.column('Channel1')
+            batch = np.stack([samples, capture.column('Channel2')])
+            results.append((
+                llom.calculate_oscilloscope_measurements(self.functions, samples, 25000.0, capture.column('Channel2')),
+                llom.calculate_oscilloscope_measurements(self.functions, batch, 25000.0, batch[::-1]),
+                {function: llom.calculate_oscilloscope_measurement(function, samples, 25000.0, batch[1])
+                 for function in self.functions},
+                llom.calculate_edge_statistics(samples, 25000.0),
+                llom.find_rising_edges(samples),
+                llom.find_falling_edges(samples),
+                llom.calculate_oscilloscope_measurements(self.functions, batch, 25000.0, batch[::-1], hysteresis=5),
+                llom.find_crossings(samples, (10, 50, 90), hysteresis=5),
+                llom.find_crossings(samples.astype(np.float32), (0.0,), hysteresis=0.01, absolute=True),
+            ))
+        return results
+
+    def assertSameResults(self, results, expected):
+        for result, expected_result in zip(results, expected):
+            for value, expected_value in zip(result, expected_result):
+                if isinstance(value, dict):
+                    self.assertEqual(list(value), list(expected_value))
+                    value, expected_value = list(value.values()), list(expected_value.values())
+                for item, expected_item in zip(value, expected_value):
+                    if isinstance(item, llom.Crossings):
+                        for field, expected_field in zip(item, expected_item):
+                            np.testing.assert_array_equal(field, expected_field)
+                    else:
+                        np.testing.assert_array_equal(item, expected_item)
+
+    def test_kernels_match_numpy(self):
+        llom.set_kernel_backend(llom.KernelBackends.numpy)
+        expected = self.measure_everything()
+
+        # Without Numba, the kernels are plain Python functions, slow but
+        # with the same results
+        llom._kernel_backend = llom.KernelBackends.numba
+        self.assertSameResults(self.measure_everything(), expected)
+
+    def test_kernels(self):
+        samples = np.array([0.0, 0.5, 1.0, 0.0, 0.05, 1.0, 0.95, 0.5, 0.0])
+        self.assertEqual(llk.first_transition(samples, 0.1, 0.9, True), (0, 2))
+        self.assertEqual(llk.first_transition(samples, 0.1, 0.9, False), (2, 3))
+        self.assertEqual(llk.first_transition(samples[:2], 0.1, 0.9, True), (-1, -1))
+        starts, stops = llk.transitions(samples, 0.1, 0.9, True)
+        np.testing.assert_array_equal(starts, [0, 4])
+        np.testing.assert_array_equal(stops, [2, 5])
+        self.assertEqual(llk.count_over(samples, 0.5), 3)
+        self.assertEqual(llk.count_under(samples, 0.5), 4)
+        np.testing.assert_array_equal(llk.crossing_positions(samples, np.array([0, 6]), 0.5), [1, 7])
+
+        # Only the samples out of the limits of each level (0.45-0.55 and
+        # 0.9-1) change the state, so 0.95 is never crossed
+        level_indexes, positions, rising = llk.level_crossings(
+            samples, np.array([0.5, 0.95]), np.array([0.45, 0.9]), np.array([0.55, 1.0]))
+        np.testing.assert_array_equal(level_indexes, [0, 0, 0, 0])
+        np.testing.assert_array_equal(positions, [1, 2.5, 4 + 0.45 / 0.95, 7])
+        np.testing.assert_array_equal(rising, [True, False, True, False])
+
+        original_crossings_per_call = llk.CROSSINGS_PER_CALL
+        llk.CROSSINGS_PER_CALL = 2
+        try:
+            chunked = llk.level_crossings(
+                samples, np.array([0.5, 0.95]), np.array([0.45, 0.9]), np.array([0.55, 1.0]))
+        finally:
+            llk.CROSSINGS_PER_CALL = original_crossings_per_call
+        for values, expected_values in zip(chunked, (level_indexes, positions, rising)):
+            np.testing.assert_array_equal(values, expected_values)
+
+    def test_backends(self):
+        llom.set_kernel_backend(llom.KernelBackends.numpy)
+        with self.assertRaises(ValueError):
+            llom.set_kernel_backend('cuda')
+        if llk.HAS_NUMBA:
+            expected = self.measure_everything()
+            # The compiled kernels give the same results as NumPy
+            llom.set_kernel_backend(llom.KernelBackends.numba)
+            self.assertSameResults(self.measure_everything(), expected)
+        else:
+            with self.assertRaises(ValueError):
+                llom.set_kernel_backend(llom.KernelBackends.numba)
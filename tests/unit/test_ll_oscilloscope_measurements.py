@@ -1,6 +1,12 @@
 from typing import List, NamedTuple, Optional
 from functools import partial
+import array
+import os
+import tempfile
 import unittest
+from unittest import mock
+import numpy as np
+from scipy import signal
 import ll_oscilloscope_measurements as llom
 
 class WaveForm(NamedTuple):
@@ -450,3 +456,741 @@ class LlOscilloscopeMeasurementsTest(unittest.TestCase):
         calculate_and_test(self.square_1vpp_200hz, other_channel_samples=self.square_1vpp_200hz.chan0, expected=0, delta=7)
         calculate_and_test(self.square_1vpp_200hz, other_channel_samples=self.square_1vpp_200hz_delayed_125.chan0, expected=0, delta=7)
         calculate_and_test(self.square_1vpp_200hz, other_channel_samples=self.square_1vpp_200hz_delayed_62.chan0, expected=-180, delta=7)
+
+    def test_calculate_oscilloscope_measurements(self):
+        functions = [
+            function for function in vars(llom.MeasurementFunctions)
+            if not function.startswith('_')
+        ]
+        self.assertEqual(len(functions), 18)
+
+        for waveform in (self.sine_1vpp_1khz, self.square_1vpp_200hz_2v_offset, self.triangle_5vpp_1khz, self.rampup_1vpp_200hz):
+            other_channel_samples = self.sine_1vpp_1khz_delayed_10.chan0
+            results = llom.calculate_oscilloscope_measurements(functions + ['none', 'invalid'], waveform.chan0, 25000.0, other_channel_samples)
+
+            for function in functions:
+                expected = llom.calculate_oscilloscope_measurement(function, waveform.chan0, 25000.0, other_channel_samples)
+                self.assertAlmostEqual(results[function], expected, places=9, msg=function)
+
+            self.assertEqual(results['none'], 0.0)
+            self.assertEqual(results['invalid'], llom.ERROR_RESULT)
+
+    def test_rise_and_fall_times_of_every_edge(self):
+        samples = np.array(self.square_1vpp_1khz.chan0)
+
+        rise_times = llom.calculate_rise_times(samples, 25000.0)
+        fall_times = llom.calculate_fall_times(samples, 25000.0)
+        self.assertGreater(len(rise_times), 1)
+        self.assertGreater(len(fall_times), 1)
+        self.assertEqual(rise_times[0], llom.calculate_rise_time(samples, 25000.0))
+        self.assertEqual(fall_times[0], llom.calculate_fall_time(samples, 25000.0))
+
+        edges = llom.find_rising_edges(samples)
+        self.assertTrue((edges.starts < edges.stops).all())
+        self.assertTrue((edges.stops[:-1] < edges.starts[1:]).all())
+
+        flat = np.zeros(100)
+        self.assertEqual(llom.calculate_rise_time(flat, 25000.0), llom.ERROR_RESULT)
+        self.assertEqual(len(llom.calculate_fall_times(flat, 25000.0)), 0)
+
+    def test_edge_statistics(self):
+        # A clipped sine wave of 1 kHz, with edges of known duration
+        times = np.arange(5000) / 25000.0
+        samples = np.clip(2 * np.sin(2 * np.pi * 1000 * times), -1, 1)
+        statistics = llom.calculate_edge_statistics(samples, 25000.0)
+
+        edge_time = 2 * np.arcsin(0.4) / (2 * np.pi * 1000)
+        for function in ('rise_time', 'fall_time'):
+            self.assertAlmostEqual(statistics[function].mean, edge_time, delta=0.1 * edge_time)
+            self.assertGreaterEqual(statistics[function].count, 199)
+        for function in ('positive_width', 'negative_width'):
+            self.assertAlmostEqual(statistics[function].mean, 0.0005)
+            self.assertAlmostEqual(statistics[function].std, 0)
+            self.assertGreaterEqual(statistics[function].count, 199)
+
+        statistics = llom.calculate_edge_statistics(self.square_1vpp_1khz.chan0, 25000.0)
+        rise_times = llom.calculate_rise_times(self.square_1vpp_1khz.chan0, 25000.0)
+        self.assertEqual(statistics['rise_time'].count, len(rise_times))
+        self.assertLessEqual(statistics['rise_time'].max, np.max(rise_times))
+        self.assertAlmostEqual(statistics['positive_width'].mean, 0.0005, delta=0.00004)
+
+        self.assertEqual(
+            llom.calculate_edge_statistics(np.zeros(100), 25000.0)['rise_time'],
+            llom.EdgeStatistics(llom.ERROR_RESULT, llom.ERROR_RESULT, llom.ERROR_RESULT, llom.ERROR_RESULT, 0))
+
+    def test_envelope_pyramid(self):
+        samples = np.tile(self.square_1vpp_1khz.chan0, 41)
+        pyramid = llom.EnvelopePyramid(samples, 25000.0, factor=4)
+        self.assertEqual(pyramid.levels, 9)
+
+        for start, stop in ((0, None), (3, 5), (100, 20000), (999, 1234), (7, len(samples))):
+            window = samples[start:stop]
+            self.assertEqual(pyramid.max(start, stop), np.max(window))
+            self.assertEqual(pyramid.min(start, stop), np.min(window))
+            self.assertAlmostEqual(pyramid.measure('voltage_average', start, stop), np.mean(window))
+            self.assertAlmostEqual(pyramid.measure('voltage_rms', start, stop), llom.calculate_voltage_rms(window))
+            self.assertEqual(pyramid.measure('rise_time', start, stop), llom.calculate_rise_time(window, 25000.0))
+        self.assertEqual(pyramid.measure('voltage_peak_to_peak'), llom.calculate_voltage_peak_to_peak(samples))
+        self.assertEqual(pyramid.measure('frequency'), llom.calculate_frequency(samples, 25000.0))
+
+        # The base and top with the blocks of the samples are exact
+        self.assertEqual(pyramid.measure('voltage_top', level=0), llom.calculate_voltage_top(samples))
+        self.assertAlmostEqual(pyramid.measure('voltage_amplitude'), llom.calculate_voltage_amplitude(samples), delta=0.05)
+
+        mins, maxs = pyramid.envelope(2, 0, 100)
+        self.assertEqual(len(mins), 7)
+        self.assertEqual(maxs[0], np.max(samples[:16]))
+        np.testing.assert_allclose(pyramid.decimated(1, 0, 8), [np.mean(samples[:4]), np.mean(samples[4:8])])
+
+        # The blocks partially in the window only use the samples inside it
+        bounds = [3] + list(range(4, 84, 4)) + [83]
+        means = [np.mean(samples[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+        self.assertAlmostEqual(pyramid.measure('voltage_base', 3, 83), llom.calculate_voltage_base(means))
+        self.assertAlmostEqual(pyramid.measure('voltage_top', 3, 83), llom.calculate_voltage_top(means))
+
+        self.assertEqual(pyramid.measure('phase_delay'), llom.ERROR_RESULT)
+        with self.assertRaises(ValueError):
+            pyramid.max(10, 10)
+
+    def test_gated_measurements(self):
+        samples = np.array(self.sine_1vpp_200hz_2v_offset.chan0)
+        functions = ['voltage_average', 'voltage_rms', 'voltage_amplitude', 'positive_duty_cycle', 'frequency']
+        gates = [llom.Gate(0, 250), llom.Gate(100, 400), llom.Gate(-125), llom.Gate.from_times(0.002, 0.012, 25000.0)]
+        self.assertEqual(gates[3], llom.Gate(50, 301))
+
+        results = llom.calculate_gated_measurements(functions, samples, gates, 25000.0)
+        self.assertEqual(len(results), len(gates))
+        for gate, result in zip(gates, results):
+            window = samples[gate.start:gate.stop]
+            expected = llom.calculate_oscilloscope_measurements(functions, window, 25000.0)
+            self.assertEqual(llom.calculate_oscilloscope_measurements(functions, samples, 25000.0, gate=gate), expected)
+            self.assertEqual(llom.calculate_oscilloscope_measurement('voltage_amplitude', samples, gate=gate), expected['voltage_amplitude'])
+            for function in functions:
+                self.assertAlmostEqual(result[function], expected[function], msg=function)
+
+        # Several captures, and the other channel for the phase delay
+        frames = np.array([samples, samples[::-1]])
+        results = llom.calculate_gated_measurements(['voltage_rms', 'phase_delay'], frames.T, gates[:2], 25000.0, frames.T, axis=0)
+        np.testing.assert_allclose(results[1]['voltage_rms'], llom.calculate_voltage_rms(frames[:, 100:400]))
+        np.testing.assert_allclose(results[1]['phase_delay'], 0)
+
+        # Only the cumulative sums of the intermediates needed
+        with mock.patch.object(llom, '_cumulative_sums', wraps=llom._cumulative_sums) as cumulative_sums:
+            llom.calculate_gated_measurements(['voltage_average'], samples, gates, 25000.0)
+        cumulative_sums.assert_called_once()
+        np.testing.assert_array_equal(cumulative_sums.call_args[0][0], samples)
+
+        with self.assertRaises(ValueError):
+            llom.calculate_gated_measurements(functions, samples, [llom.Gate(300, 200)])
+
+    def test_float32_compute_dtype(self):
+        functions = [
+            value for name, value in vars(llom.MeasurementFunctions).items() if not name.startswith('_')
+        ]
+        voltages = ['voltage_peak_to_peak', 'voltage_average', 'voltage_rms', 'voltage_max', 'voltage_min',
+                    'voltage_base', 'voltage_top', 'voltage_amplitude', 'preshoot', 'overshoot']
+        rng = np.random.default_rng(0)
+        for waveform in (self.sine_1vpp_200hz_2v_offset, self.square_1vpp_1khz, self.rampup_1vpp_1khz,
+                         self.square_1vpp_1khz_delayed_10):
+            expected = llom.calculate_oscilloscope_measurements(functions, waveform.chan0, 25000.0, waveform.chan1)
+            results = llom.calculate_oscilloscope_measurements(
+                functions, waveform.chan0, 25000.0, waveform.chan1, compute_dtype=np.float32)
+            # The samples of the captures are exact in float32
+            self.assertEqual(results, expected)
+
+            # Otherwise, the voltages are within the documented bounds
+            samples = np.array(waveform.chan0) + rng.normal(0, 0.003, len(waveform.chan0))
+            plan64 = llom.MeasurementPlan(functions, 25000.0)
+            plan32 = llom.MeasurementPlan(functions, 25000.0, compute_dtype='float32')
+            expected = plan64.run(samples, waveform.chan1)
+            results = plan32.run(samples, waveform.chan1)
+            bound = 2 ** -22 * np.max(np.abs(samples))
+            for function in functions:
+                if function in voltages:
+                    self.assertAlmostEqual(results[function], expected[function], delta=bound, msg=function)
+                else:
+                    self.assertEqual(results[function], expected[function], msg=function)
+
+            # Also with a cache, and for the statistics of the edges
+            cache = llom.ResultCache()
+            for _ in range(2):
+                self.assertEqual(llom.calculate_oscilloscope_measurements(
+                    functions, samples, 25000.0, waveform.chan1, cache=cache, compute_dtype=np.float32), results)
+            self.assertEqual(cache.info()['memory_hits'], len(functions))
+            expected = llom.calculate_edge_statistics(samples, 25000.0)
+            statistics = llom.calculate_edge_statistics(samples, 25000.0, compute_dtype=np.float32)
+            # Interpolated between rounded samples
+            for function, function_statistics in statistics.items():
+                np.testing.assert_allclose(function_statistics, expected[function], rtol=1e-5, err_msg=function)
+            with mock.patch.object(llom, '_transitions', wraps=llom._transitions) as transitions:
+                llom.calculate_edge_statistics(samples.astype(np.float32), 25000.0, compute_dtype=np.float32)
+            self.assertEqual(transitions.call_args[0][0].dtype, np.float32)
+
+        self.assertEqual(llom.as_samples([1, 2], compute_dtype=np.float32).dtype, np.float32)
+        with self.assertRaises(ValueError):
+            llom.MeasurementPlan(functions, compute_dtype=np.float16)
+
+    def test_several_captures(self):
+        functions = [
+            function for function in vars(llom.MeasurementFunctions)
+            if not function.startswith('_')
+        ]
+        waveforms = [self.sine_1vpp_1khz, self.square_1vpp_200hz_2v_offset, self.triangle_5vpp_1khz, self.rampup_1vpp_200hz]
+        frames = np.array([waveform.chan0 for waveform in waveforms])
+        other_channel_frames = np.array([waveform.chan1 for waveform in waveforms])
+
+        for function in functions:
+            results = llom.calculate_oscilloscope_measurement(function, frames, 25000.0, other_channel_frames)
+            transposed_results = llom.calculate_oscilloscope_measurement(function, frames.T, 25000.0, other_channel_frames.T, axis=0)
+            self.assertEqual(results.shape, (len(waveforms),))
+
+            for position, waveform in enumerate(waveforms):
+                expected = llom.calculate_oscilloscope_measurement(function, waveform.chan0, 25000.0, waveform.chan1)
+                self.assertAlmostEqual(results[position], expected, places=9, msg=function)
+                self.assertAlmostEqual(transposed_results[position], expected, places=9, msg=function)
+
+        results = llom.calculate_oscilloscope_measurements(functions, frames, 25000.0, other_channel_frames)
+        for function in functions:
+            expected = llom.calculate_oscilloscope_measurement(function, frames, 25000.0, other_channel_frames)
+            np.testing.assert_allclose(results[function], expected, err_msg=function)
+
+    def test_streaming_measurements(self):
+        samples = np.array(self.square_1vpp_200hz_2v_offset.chan0)
+        chunk_size = 37
+
+        streaming = llom.StreamingMeasurements(25000.0)
+        windowed = llom.StreamingMeasurements(25000.0, window_chunks=5)
+        for position in range(0, len(samples), chunk_size):
+            streaming.push(samples[position:position + chunk_size])
+            windowed.push(samples[position:position + chunk_size])
+
+        self.assertEqual(streaming.count, len(samples))
+        window = samples[-windowed.count:]
+
+        for function, delta in (('voltage_peak_to_peak', 1e-9), ('voltage_average', 1e-9), ('voltage_rms', 1e-9),
+                                ('voltage_max', 1e-9), ('voltage_min', 1e-9), ('voltage_base', 0.01),
+                                ('voltage_top', 0.01), ('voltage_amplitude', 0.01), ('positive_duty_cycle', 1),
+                                ('rise_time', 1e-9), ('fall_time', 1e-9)):
+            for measurements, measured_samples in ((streaming, samples), (windowed, window)):
+                expected = llom.calculate_oscilloscope_measurement(function, measured_samples, 25000.0)
+                self.assertAlmostEqual(measurements.measure(function), expected, delta=delta, msg=function)
+
+        self.assertAlmostEqual(streaming.measure('frequency'), 200, delta=5)
+        self.assertAlmostEqual(streaming.measure('positive_width'), 0.0025, delta=0.0001)
+        self.assertEqual(streaming.measure('phase_delay'), llom.ERROR_RESULT)
+        self.assertAlmostEqual(windowed.measure('frequency'), 200, delta=5)
+
+        # Without a window, the edges of the chunks are not kept
+        for _ in range(20):
+            for position in range(0, len(samples), chunk_size):
+                streaming.push(samples[position:position + chunk_size])
+        self.assertEqual(len(streaming._rising_edges.starts), 0)
+        self.assertAlmostEqual(streaming.measure('frequency'), 200, delta=1)
+        self.assertAlmostEqual(streaming.measure('rise_time'), llom.calculate_rise_time(samples, 25000.0), delta=1e-9)
+        self.assertLessEqual(len(windowed._rising_edges.starts), 5)
+
+        for window_chunks in (0, -1):
+            with self.assertRaises(ValueError):
+                llom.StreamingMeasurements(25000.0, window_chunks=window_chunks)
+
+        streaming.reset()
+        self.assertEqual(streaming.count, 0)
+        self.assertEqual(streaming.measure('voltage_average'), llom.ERROR_RESULT)
+
+    def test_voltage_base_and_top_without_sorting(self):
+        random = np.random.default_rng(0)
+        for length in (6, 10, 11, 99, 500, 1001):
+            frames = random.normal(size=(3, length))
+            ten_percent = round(0.1 * length)
+            sorted_frames = np.sort(frames, axis=-1)
+
+            np.testing.assert_allclose(llom.calculate_voltage_base(frames), np.mean(sorted_frames[:, :ten_percent], axis=-1))
+            np.testing.assert_allclose(llom.calculate_voltage_top(frames), np.mean(sorted_frames[:, -ten_percent:], axis=-1))
+            np.testing.assert_allclose(llom.calculate_voltage_top(frames[0]), np.mean(sorted_frames[0, -ten_percent:]))
+
+    def test_phase_delay_methods(self):
+        pairs = [
+            (self.sine_1vpp_200hz, self.sine_1vpp_200hz_delayed_25),
+            (self.sine_1vpp_200hz, self.sine_1vpp_200hz_delayed_62),
+            (self.square_1vpp_200hz, self.square_1vpp_200hz_delayed_75),
+            (self.sine_1vpp_1khz, self.sine_1vpp_1khz_delayed_15),
+            (self.square_1vpp_1khz, self.square_1vpp_1khz_delayed_5),
+        ]
+        for waveform, delayed_waveform in pairs:
+            samples = np.array(waveform.chan0)
+            expected = llom.calculate_phase_delay(samples, 25000.0, delayed_waveform.chan0, method='direct')
+            for method in ('fft', 'auto'):
+                result = llom.calculate_phase_delay(samples, 25000.0, delayed_waveform.chan0, method=method)
+                self.assertEqual(result, expected)
+
+            # Within one period, the result is the same (the signals are periodic)
+            for method in ('direct', 'fft'):
+                result = llom.calculate_phase_delay(samples, 25000.0, delayed_waveform.chan0, method=method, max_delay_periods=1)
+                self.assertAlmostEqual(result, expected, delta=7)
+
+        # only small delays
+        result = llom.calculate_phase_delay(np.array(self.sine_1vpp_200hz.chan0), 25000.0, self.sine_1vpp_200hz_delayed_62.chan0, max_delay_periods=0.1)
+        self.assertLessEqual(abs(result), 36)
+
+        # Without a frequency (a DC signal), the delays are not limited
+        flat = np.ones(500)
+        for method in ('direct', 'fft', 'auto'):
+            self.assertEqual(llom.calculate_phase_delay(flat, 25000.0, flat, method=method, max_delay_periods=1), 0)
+        frames = np.stack([flat, np.array(self.sine_1vpp_200hz.chan0)])
+        delayed_frames = np.stack([flat, np.array(self.sine_1vpp_200hz_delayed_62.chan0)])
+        result = llom.calculate_phase_delay(frames, 25000.0, delayed_frames, max_delay_periods=1)
+        self.assertEqual(result[0], 0)
+        self.assertAlmostEqual(result[1], llom.calculate_phase_delay(
+            frames[1], 25000.0, delayed_frames[1], max_delay_periods=1))
+        np.testing.assert_array_equal(llom.calculate_phase_delay_matrix([flat, flat], 25000.0, max_delay_periods=1), 0)
+
+    def test_phase_delay_matrix(self):
+        channels = [
+            self.sine_1vpp_200hz.chan0,
+            self.sine_1vpp_200hz_delayed_25.chan0,
+            self.sine_1vpp_200hz_delayed_62.chan0,
+            self.sine_1vpp_200hz_delayed_100.chan0,
+        ]
+        for max_delay_periods in (None, 1):
+            matrix = llom.calculate_phase_delay_matrix(channels, 25000.0, max_delay_periods=max_delay_periods)
+            self.assertEqual(matrix.shape, (4, 4))
+            # The frequency of the reference channel is used for every pair
+            frequency = llom.calculate_frequency(np.array(channels[0]), 25000.0)
+            for i, samples in enumerate(channels):
+                samples_frequency = llom.calculate_frequency(np.array(samples), 25000.0)
+                for j, other in enumerate(channels):
+                    expected = llom.calculate_phase_delay(np.array(samples), 25000.0, other, max_delay_periods=max_delay_periods)
+                    self.assertAlmostEqual(matrix[i, j], expected * frequency / samples_frequency)
+
+        matrix = llom.calculate_phase_delay_matrix(np.array(channels), 25000.0, reference=1)
+        self.assertEqual(matrix[1, 1], 0)
+        with self.assertRaises(ValueError):
+            llom.calculate_phase_delay_matrix(channels[0], 25000.0)
+        with self.assertRaises(ValueError):
+            llom.calculate_phase_delay_matrix(channels, 25000.0, reference=4)
+
+    def test_hysteresis(self):
+        # 1 kHz trapezoid at 100 kHz, with edges of 20 samples and noise
+        positions = np.arange(10000)
+        phase = positions % 100
+        samples = np.clip(np.where(phase < 50, phase, 100 - phase) / 20 - 1.25, -0.5, 0.5)
+        noisy = samples + np.random.default_rng(0).normal(0, 0.02, len(samples))
+
+        # The noise makes the signal cross the middle several times in some edges
+        middle, = llom.find_crossings(noisy, (0.0,), absolute=True)
+        self.assertGreater(len(middle.positions), 200)
+        middle, = llom.find_crossings(noisy, (0.0,), hysteresis=0.1, absolute=True)
+        self.assertEqual(len(middle.positions), 200)
+        np.testing.assert_array_equal(middle.rising[::2], True)
+        np.testing.assert_array_equal(middle.rising[1::2], False)
+        np.testing.assert_allclose(middle.times(100000.0)[::2] % 0.001, 0.00025, atol=0.00002)
+
+        crossings = llom.find_crossings(noisy, hysteresis=5)
+        self.assertEqual([len(level_crossings.positions) for level_crossings in crossings], [200, 200, 200])
+
+        self.assertAlmostEqual(llom.calculate_positive_duty_cycle(noisy, hysteresis=5), 50, delta=0.5)
+        self.assertAlmostEqual(llom.calculate_positive_width(noisy, 100000.0, hysteresis=5), 0.0005, delta=0.000005)
+        self.assertAlmostEqual(llom.calculate_negative_width(noisy, 100000.0, hysteresis=5), 0.0005, delta=0.000005)
+        self.assertAlmostEqual(llom.calculate_rise_time(noisy, 100000.0, hysteresis=5), 0.00016, delta=0.00003)
+        self.assertAlmostEqual(llom.calculate_fall_time(noisy, 100000.0, hysteresis=5), 0.00016, delta=0.00003)
+        self.assertAlmostEqual(llom.calculate_rise_time(samples, 100000.0, hysteresis=0), 0.00016)
+        self.assertAlmostEqual(llom.calculate_frequency(noisy, 100000.0, method='zero_crossing', hysteresis=5), 1000, delta=0.1)
+        self.assertAlmostEqual(llom.calculate_period(noisy, 100000.0, method='zero_crossing', hysteresis=5), 0.001, delta=1e-7)
+
+        # The same results with every entry point
+        functions = [
+            llom.MeasurementFunctions.rise_time, llom.MeasurementFunctions.fall_time,
+            llom.MeasurementFunctions.positive_duty_cycle, llom.MeasurementFunctions.positive_width,
+            llom.MeasurementFunctions.negative_width, llom.MeasurementFunctions.voltage_rms,
+        ]
+        batch = np.stack([noisy, samples])
+        expected = {function: llom.calculate_oscilloscope_measurement(function, batch, 100000.0, hysteresis=5)
+                    for function in functions}
+        results = llom.calculate_oscilloscope_measurements(functions, batch, 100000.0, hysteresis=5)
+        for function in functions:
+            np.testing.assert_array_equal(results[function], expected[function])
+            self.assertEqual(llom.calculate_oscilloscope_measurement(function, noisy, 100000.0, hysteresis=5),
+                             expected[function][0])
+        gated, = llom.calculate_gated_measurements(functions, noisy, [llom.Gate()], 100000.0, hysteresis=5)
+        for function in functions:
+            self.assertAlmostEqual(gated[function], expected[function][0])
+
+        # Without hysteresis, nothing changes
+        self.assertEqual(llom.calculate_oscilloscope_measurements(functions, noisy, 100000.0),
+                         llom.calculate_oscilloscope_measurements(functions, noisy, 100000.0, hysteresis=None))
+
+        cache = llom.ResultCache()
+        keys = cache.keys(functions, noisy, 100000.0)
+        hysteresis_keys = cache.keys(functions, noisy, 100000.0, hysteresis=5)
+        self.assertEqual(keys[llom.MeasurementFunctions.voltage_rms], hysteresis_keys[llom.MeasurementFunctions.voltage_rms])
+        self.assertNotEqual(keys[llom.MeasurementFunctions.rise_time], hysteresis_keys[llom.MeasurementFunctions.rise_time])
+        self.assertEqual(llom.calculate_oscilloscope_measurements(functions, noisy, 100000.0, cache=cache, hysteresis=5),
+                         {function: expected[function][0] for function in functions})
+
+    def test_prefilter(self):
+        samples = np.array(self.square_1vpp_1khz.chan0) + np.random.default_rng(0).normal(0, 0.05, 500)
+        other = np.array(self.square_1vpp_1khz_delayed_10.chan0)
+        functions = [
+            value for name, value in vars(llom.MeasurementFunctions).items() if not name.startswith('_')
+        ]
+        prefilters = [
+            llom.Prefilter(llom.FilterKinds.lowpass, cutoff=5000),
+            llom.Prefilter(llom.FilterKinds.lowpass, cutoff=5000, zero_phase=False),
+            llom.Prefilter(llom.FilterKinds.highpass, cutoff=100, order=2),
+            llom.Prefilter(llom.FilterKinds.median, window=5),
+            llom.Prefilter(llom.FilterKinds.moving_average, window=4),
+        ]
+        for prefilter in prefilters:
+            filtered = prefilter.apply(samples, 25000.0)
+            self.assertEqual(filtered.shape, samples.shape)
+            expected = llom.calculate_oscilloscope_measurements(
+                functions, filtered, 25000.0, prefilter.apply(other, 25000.0))
+            results = llom.calculate_oscilloscope_measurements(functions, samples, 25000.0, other, prefilter=prefilter)
+            self.assertEqual(results, expected)
+            self.assertEqual(
+                llom.calculate_oscilloscope_measurement('rise_time', samples, 25000.0, prefilter=prefilter),
+                expected['rise_time'])
+
+            # Filtered along the axis of the samples
+            batch = np.stack([samples, other], axis=1)
+            np.testing.assert_allclose(prefilter.apply(batch, 25000.0, axis=0)[:, 0], filtered)
+
+        # The filters are those of SciPy
+        median = llom.Prefilter(llom.FilterKinds.median, window=5).apply(samples)
+        np.testing.assert_array_equal(median[2:-2], signal.medfilt(samples, 5)[2:-2])
+        average = llom.Prefilter(llom.FilterKinds.moving_average, window=5).apply(samples)
+        np.testing.assert_allclose(average[2:-2], np.convolve(samples, np.ones(5) / 5, mode='valid'))
+        self.assertEqual(average[0], np.mean(samples[[0, 0, 0, 1, 2]]))
+        self.assertEqual(llom.Prefilter(llom.FilterKinds.median, window=3).apply(samples.astype(np.float32)).dtype,
+                         np.float32)
+
+        # The filter is applied once for every measurement, with its design
+        # calculated once
+        lowpass = llom.Prefilter(llom.FilterKinds.lowpass, cutoff=3000)
+        design_misses = llom._filter_design.cache_info().misses
+        with mock.patch.object(llom.signal, 'sosfiltfilt', wraps=llom.signal.sosfiltfilt) as sosfiltfilt:
+            llom.calculate_oscilloscope_measurements(functions, samples, 25000.0, other, prefilter=lowpass)
+            llom.calculate_gated_measurements(functions, samples, [llom.Gate(0, 250), llom.Gate(250)], 25000.0,
+                                              other, prefilter=lowpass)
+        # Each time, once for each channel
+        self.assertEqual(sosfiltfilt.call_count, 4)
+        self.assertEqual(llom._filter_design.cache_info().misses, design_misses + 1)
+
+        for prefilter in (llom.Prefilter(llom.FilterKinds.lowpass), llom.Prefilter(llom.FilterKinds.median),
+                          llom.Prefilter('notch')):
+            with self.assertRaises(ValueError):
+                llom.calculate_oscilloscope_measurements(functions, samples, 25000.0, other, prefilter=prefilter)
+
+    def test_rolling_measurements(self):
+        # A sine whose amplitude and frequency drift, with its delayed copy
+        times = np.arange(20000) / 25000.0
+        samples = (0.5 + 0.1 * times) * np.sin(2 * np.pi * (1000 + 50 * times) * times)
+        samples += np.random.default_rng(0).normal(0, 0.01, len(samples))
+        other = np.roll(samples, 3)
+        functions = [
+            value for name, value in vars(llom.MeasurementFunctions).items() if not name.startswith('_')
+        ]
+
+        # Without overlap, and overlapping (the max and min from the sparse table)
+        for window, step in ((2500, None), (1000, 333)):
+            results = llom.rolling_measurements(functions, samples, window, step, 25000.0, other)
+            starts = range(0, len(samples) - window + 1, step or window)
+            self.assertEqual(list(results), functions)
+            for function in functions:
+                self.assertEqual(results[function].shape, (len(starts),))
+            for index, start in enumerate(starts):
+                window_samples = samples[start:start + window]
+                expected = llom.calculate_oscilloscope_measurements(
+                    functions, window_samples, 25000.0, other[start:start + window])
+                expected['frequency'] = llom.calculate_frequency(window_samples, 25000.0, method='rfft')
+                expected['period'] = 1 / expected['frequency']
+                for function in functions:
+                    self.assertAlmostEqual(results[function][index], expected[function], msg=function)
+
+        # The same results measuring a few windows at a time
+        original_chunk_samples = llom.ROLLING_CHUNK_SAMPLES
+        llom.ROLLING_CHUNK_SAMPLES = 5000
+        try:
+            chunked = llom.rolling_measurements(functions, samples, 1000, 333, 25000.0, other)
+        finally:
+            llom.ROLLING_CHUNK_SAMPLES = original_chunk_samples
+        for function in functions:
+            np.testing.assert_array_equal(chunked[function], results[function])
+
+        # The windows of a constant signal have no frequency or period
+        flat = np.concatenate([np.full(5000, 0.3), samples[:5000]])
+        flat_results = llom.rolling_measurements(['frequency', 'period'], flat, 2500, None, 25000.0)
+        for function in ('frequency', 'period'):
+            np.testing.assert_array_equal(flat_results[function][:2], llom.ERROR_RESULT)
+            self.assertGreater(flat_results[function][-1], 0)
+
+        # The trend of the amplitude
+        amplitudes = llom.rolling_measurements(['voltage_peak_to_peak'], samples, 2500)['voltage_peak_to_peak']
+        self.assertTrue(np.all(np.diff(amplitudes) > 0))
+
+        for window, step in ((0, 1), (10, 0), (len(samples) + 1, 1)):
+            with self.assertRaises(ValueError):
+                llom.rolling_measurements(functions, samples, window, step, 25000.0)
+        with self.assertRaises(ValueError):
+            llom.rolling_measurements(functions, np.stack([samples, other]), 100, 100, 25000.0)
+
+    def test_frequency_methods(self):
+        methods = ('welch', 'zero_crossing', 'rfft', 'autocorrelation', 'auto')
+        for waveform, expected in ((self.sine_1vpp_1khz, 1_000), (self.square_1vpp_1khz, 1_000), (self.triangle_5vpp_1khz, 1_000),
+                                   (self.sine_0_4vpp_1khz, 1_000), (self.sine_1vpp_200hz_2v_offset, 200), (self.square_1vpp_200hz_m2v_offset, 200)):
+            for method in methods:
+                result = llom.calculate_frequency(np.array(waveform.chan0), 25000.0, method=method)
+                self.assertAlmostEqual(result, expected, delta=expected * 0.03, msg=method)
+
+        # 10,000 samples at 100 kHz: the Welch's method has a resolution of 10 Hz
+        times = np.arange(10_000) / 100_000.0
+        random = np.random.default_rng(0)
+        frames = np.array([
+            np.sin(2 * np.pi * 1234.5 * times),
+            np.sign(np.sin(2 * np.pi * 1234.5 * times)),
+            np.sin(2 * np.pi * 1234.5 * times) + random.normal(scale=0.2, size=len(times)),
+        ])
+        self.assertAlmostEqual(llom.calculate_frequency(frames[0], 100_000.0), 1230.0)
+        for method, delta in (('zero_crossing', 0.1), ('rfft', 0.2), ('autocorrelation', 0.2), ('auto', 0.2)):
+            results = llom.calculate_frequency(frames[:2], 100_000.0, method=method)
+            np.testing.assert_allclose(results, 1234.5, atol=delta, err_msg=method)
+            self.assertAlmostEqual(llom.calculate_period(frames[0], 100_000.0, method=method), 1 / 1234.5, delta=1e-6)
+
+        # With noise, the zero crossings are not regular and auto uses rfft
+        self.assertAlmostEqual(llom.calculate_frequency(frames[2], 100_000.0, method='auto'), 1234.5, delta=0.5)
+        self.assertGreater(llom.calculate_frequency(frames[2], 100_000.0, method='zero_crossing'), 2000)
+
+        # A constant signal has no frequency
+        for value in (0.0, 1.0, 0.1):
+            constant = np.full(100, value)
+            for method in ('rfft', 'auto', 'zero_crossing', 'autocorrelation'):
+                self.assertEqual(llom.calculate_frequency(constant, 25000.0, method=method), llom.ERROR_RESULT,
+                                 msg=method)
+        np.testing.assert_array_equal(
+            llom.calculate_frequency(np.stack([np.full(10_000, 0.1), frames[0]]), 100_000.0, method='rfft'),
+            [llom.ERROR_RESULT, llom.calculate_frequency(frames[0], 100_000.0, method='rfft')])
+
+        with self.assertRaises(ValueError):
+            llom.calculate_frequency(frames[0], 100_000.0, method='invalid')
+
+    def test_samples_from_buffers(self):
+        samples = np.asarray(self.sine_1vpp_1khz.chan0)
+        self.assertIs(llom.as_samples(samples), samples)
+
+        # ADC codes of 1 mV, with an offset of 0.1 V
+        codes = np.round((samples - 0.1) * 1000).astype(np.int16)
+        expected = codes * 0.001 + 0.1
+        for buffer in (codes.tobytes(), memoryview(codes.tobytes())):
+            np.testing.assert_allclose(
+                llom.as_samples(buffer, np.int16, scale=0.001, offset=0.1),
+                expected)
+        np.testing.assert_array_equal(llom.as_samples(array.array('h', codes)), codes)
+
+        self.assertEqual(
+            llom.calculate_oscilloscope_measurement('voltage_max', samples.tobytes()),
+            llom.calculate_voltage_max(samples))
+
+    def test_measurement_plan(self):
+        functions = ['voltage_amplitude', 'frequency', 'rise_time', 'phase_delay', 'none', 'invalid']
+        plan = llom.MeasurementPlan(functions, 25000.0)
+        self.assertIn('base_and_top', plan.intermediates)
+        self.assertIn('welch_peak', plan.intermediates)
+        self.assertNotIn('positive_samples', plan.intermediates)
+
+        for waveform in (self.sine_1vpp_1khz, self.square_1vpp_1khz, self.triangle_1vpp_1khz):
+            self.assertEqual(
+                plan.run(waveform.chan0, waveform.chan1),
+                llom.calculate_oscilloscope_measurements(functions, waveform.chan0, 25000.0, waveform.chan1))
+        frames = np.array([self.sine_1vpp_1khz.chan0, self.square_1vpp_1khz.chan0])
+        np.testing.assert_array_equal(
+            plan.run(frames.T, frames.T, axis=0)['voltage_amplitude'],
+            llom.calculate_voltage_amplitude(frames))
+
+        # The intermediates are the properties of the context each measurement reads
+        properties = {
+            name for name, value in vars(llom._MeasurementContext).items() if isinstance(value, property)
+        }
+        for function in llom._MEASUREMENT_INTERMEDIATES:
+            for hysteresis in (None, 5):
+                context = llom._MeasurementContext(
+                    np.array(self.square_1vpp_1khz.chan0), 25000.0, np.array(self.square_1vpp_1khz.chan1), hysteresis)
+                with mock.patch.object(context, '_get', wraps=context._get) as get:
+                    llom._CONTEXT_MEASUREMENTS[function](context)
+                read = {call[0][0] for call in get.call_args_list}
+                intermediates = llom.MeasurementPlan([function], hysteresis=hysteresis).intermediates
+                self.assertLessEqual(intermediates, properties, msg=function)
+                self.assertEqual(read, intermediates, msg=function)
+
+    def test_result_cache(self):
+        samples = self.square_1vpp_1khz.chan0
+        functions = ['voltage_amplitude', 'frequency', 'phase_delay']
+        expected = llom.calculate_oscilloscope_measurements(functions, samples, 25000.0, self.square_1vpp_1khz.chan1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            cache = llom.ResultCache(maxsize=3, path=path)
+            for _ in range(2):
+                self.assertEqual(
+                    llom.calculate_oscilloscope_measurements(
+                        functions, samples, 25000.0, self.square_1vpp_1khz.chan1, cache=cache),
+                    expected)
+            self.assertEqual(cache.info()['misses'], 3)
+            self.assertEqual(cache.info()['memory_hits'], 3)
+            self.assertEqual(cache.info()['disk_hits'], 0)
+            self.assertEqual(cache.info()['hit_rate'], 0.5)
+
+            # Different samples or sampling rate are different results
+            self.assertEqual(
+                llom.calculate_oscilloscope_measurement('frequency', samples, 50000.0, cache=cache),
+                llom.calculate_frequency(samples, 50000.0))
+            llom.calculate_oscilloscope_measurement('voltage_amplitude', self.sine_1vpp_1khz.chan0, cache=cache)
+            self.assertEqual(cache.info()['misses'], 5)
+
+            # The results in float32 are different results
+            noisy = np.random.default_rng(0).normal(0, 0.2, 500)
+            for compute_dtype in (np.float64, np.float32, np.float32):
+                self.assertEqual(
+                    llom.calculate_oscilloscope_measurements(
+                        ['voltage_rms'], noisy, cache=cache, compute_dtype=compute_dtype),
+                    llom.calculate_oscilloscope_measurements(['voltage_rms'], noisy, compute_dtype=compute_dtype))
+            self.assertEqual(cache.info()['misses'], 7)
+            cache.close()
+
+            # The results on disk are used by other caches
+            cache = llom.ResultCache(maxsize=0, path=path, max_disk_bytes=1000)
+            self.assertEqual(
+                llom.calculate_oscilloscope_measurement('frequency', list(samples), 25000.0, cache=cache),
+                expected['frequency'])
+            self.assertEqual(cache.info()['disk_hits'], 1)
+
+            # Adding more results evicts the least recently used ones
+            for offset in range(10):
+                llom.calculate_oscilloscope_measurement('voltage_average', np.asarray(samples) + offset, cache=cache)
+            self.assertLessEqual(cache.info()['disk_bytes'], 1000)
+            self.assertEqual(cache.info()['disk_bytes'], cache._stored_bytes())
+
+            # Until the low water mark, so the next result fits without evicting
+            cache.clear()
+            cache.max_disk_bytes = 2000
+            keys = [bytes([index]) * 16 for index in range(40)]
+            with mock.patch.object(cache, '_evict', wraps=cache._evict) as evict:
+                for index, key in enumerate(keys):
+                    cache.put(key, np.float64(index))
+                    if evict.called:
+                        break
+                self.assertLessEqual(cache.info()['disk_bytes'], 0.9 * 2000)
+                cache.put(keys[index + 1], np.float64(index + 1))
+            evict.assert_called_once()
+
+            # Storing a result again does not count it twice
+            disk_bytes = cache.info()['disk_bytes']
+            cache.put(keys[index + 1], np.float64(2.0))
+            self.assertEqual(cache.info()['disk_bytes'], disk_bytes)
+            self.assertEqual(cache._stored_bytes(), disk_bytes)
+
+            # The same key for the same sampling rate of any type
+            self.assertEqual(cache.keys(['frequency'], samples, 25000), cache.keys(['frequency'], samples, 25000.0))
+            self.assertEqual(cache.keys(['frequency'], samples, np.float64(25000.0), axis=np.int64(-1)),
+                             cache.keys(['frequency'], samples, 25000.0))
+            cache.clear()
+            self.assertEqual(cache.info()['disk_bytes'], 0)
+            cache.close()
+
+    def test_instrumentation(self):
+        samples = self.sine_1vpp_1khz.chan0
+        calculate_frequency = llom.calculate_frequency
+        llom.instrumentation.reset()
+        llom.enable_instrumentation()
+        try:
+            self.assertIsNot(llom.calculate_frequency, calculate_frequency)
+            llom.calculate_oscilloscope_measurement('frequency', samples, 25000.0)
+            llom.calculate_voltage_max(samples)
+            llom.calculate_oscilloscope_measurements(['voltage_rms', 'period'], samples, 25000.0)
+        finally:
+            llom.disable_instrumentation()
+        self.assertIs(llom.calculate_frequency, calculate_frequency)
+
+        # Nothing is recorded while it is disabled
+        llom.calculate_voltage_max(samples)
+        snapshot = llom.instrumentation.snapshot()
+        self.assertEqual(snapshot['calculate_oscilloscope_measurement']['calls'], 1)
+        self.assertEqual(snapshot['calculate_frequency']['calls'], 1)
+        self.assertEqual(snapshot['calculate_voltage_max']['calls'], 1)
+        self.assertEqual(snapshot['calculate_voltage_max']['samples']['buckets'][1000], 1)
+        self.assertEqual(snapshot['period']['calls'], 1)
+        self.assertEqual(snapshot['calculate_oscilloscope_measurements']['samples']['sum'], len(samples))
+        self.assertGreater(snapshot['calculate_frequency']['seconds']['sum'], 0)
+
+        prometheus = llom.instrumentation.prometheus()
+        self.assertIn('# TYPE ll_oscilloscope_measurement_seconds histogram', prometheus)
+        self.assertIn('ll_oscilloscope_measurement_seconds_count{function="calculate_frequency"} 1', prometheus)
+        self.assertIn('ll_oscilloscope_measurement_samples_bucket{function="period",le="+Inf"} 1', prometheus)
+        llom.instrumentation.reset()
+
+        with llom.profile_measurements() as report:
+            llom.calculate_phase_delay(samples, 25000.0, self.sine_1vpp_1khz.chan1)
+        self.assertIn('calculate_phase_delay', report.text())
+
+        # The samples of the APIs with other arguments first, or several channels
+        llom.enable_instrumentation()
+        try:
+            llom.calculate_gated_measurements(['voltage_rms', 'voltage_max'], samples, [llom.Gate(0, 100)])
+            llom.calculate_phase_delay_matrix([samples] * 4, 25000.0)
+            llom.calculate_phase_delay_matrix(channels=np.array([samples] * 3), sampling_rate=25000.0)
+        finally:
+            llom.disable_instrumentation()
+        snapshot = llom.instrumentation.snapshot()
+        self.assertEqual(snapshot['calculate_gated_measurements']['samples']['sum'], len(samples))
+        self.assertEqual(snapshot['calculate_phase_delay_matrix']['samples']['sum'], 2 * len(samples))
+        llom.instrumentation.reset()
+
+    def test_spectrum_cache(self):
+        cache = llom.spectrum_cache
+        cache.clear()
+        samples = self.sine_1vpp_1khz.chan0
+        frequency = llom.calculate_frequency(samples, 25000.0)
+        self.assertEqual(cache.info()['misses'], 1)
+
+        # Other measurements (and a new copy of the samples) reuse the spectrum
+        llom.calculate_period(list(samples), 25000.0)
+        llom.calculate_positive_width(samples, 25000.0)
+        self.assertEqual(cache.info()['hits'], 2)
+        self.assertEqual(llom.calculate_frequency(samples, 25000.0), frequency)
+
+        # Different samples or sampling rate are different spectrums
+        llom.calculate_frequency(samples, 50000.0)
+        llom.calculate_frequency(2 * np.asarray(samples), 25000.0)
+        self.assertEqual(cache.info()['misses'], 3)
+
+        cache.maxsize = 0
+        try:
+            llom.calculate_frequency(samples, 25000.0)
+            self.assertEqual(cache.info()['hits'], 3)
+        finally:
+            cache.maxsize = 16
+            cache.clear()
+
+        # The spectrums are also limited by their size
+        small_cache = llom.SpectrumCache(maxbytes=10000)
+        for offset in range(3):
+            spectrum = small_cache.get('welch', np.asarray(samples) + offset, 25000.0,
+                                       lambda: (np.zeros(300), np.zeros(300)))
+        self.assertEqual(small_cache.info()['size'], 2)
+        self.assertEqual(small_cache.info()['bytes'], 2 * spectrum[0].nbytes * 2)
+        small_cache.get('welch', np.asarray(samples), 25000.0, lambda: np.zeros(2000))
+        self.assertEqual(small_cache.info()['size'], 2)
+
+        # Views are hashed without copying them whole, with the same key
+        frames = np.random.default_rng(0).normal(size=(1000, 30))
+        original_block_samples = llom._HASH_BLOCK_SAMPLES
+        llom._HASH_BLOCK_SAMPLES = 100
+        try:
+            with mock.patch.object(np, 'ascontiguousarray', wraps=np.ascontiguousarray) as copy:
+                self.assertEqual(llom.samples_key(frames[:, 3]), llom.samples_key(frames[:, 3].copy()))
+                self.assertEqual(llom.samples_key(frames.T), llom.samples_key(frames.T.copy()))
+                self.assertLessEqual(max(call[0][0].size for call in copy.call_args_list), 100)
+                copy.reset_mock()
+                llom.samples_key(frames)
+                copy.assert_not_called()
+        finally:
+            llom._HASH_BLOCK_SAMPLES = original_block_samples